@@ -0,0 +1,585 @@
+"""
+Copyright 2016-2021 Maen Artimy
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import re
+import sys
+import bisect
+import argparse
+from collections import namedtuple, defaultdict
+
+import asa_policy_parser_lite as asa
+import config_parser
+from definitions import RRule
+from anomaly_detector import ruleRelation
+from normalizer import AddrMask, Rule, ANY_ADDRESS, ANY_PORT, ANY_PROTOCOL, FULL_MASK, \
+    addressPrefixes, prefixMask, int2ip, asaFields, asaRules, iosRules
+from fg_object_db import mergeIntervals
+
+# Usage: python3 acl_optimizer.py {ios|asa} config_file [--verify]
+# Prints smaller access lists that make the same decision as the original ones
+# for every packet:
+#   rules covered by an earlier rule are removed,
+#   rules covered by another rule of the same run of rules with the same action
+#   are removed, as the order of such rules does not matter,
+#   rules of a run that differ in one field only are merged: sibling prefixes
+#   into their parent prefix and adjacent or overlapping port ranges into one.
+# Rules that reference objects or have options (log, time-range, ICMP types)
+# are kept as they are and end the run of rules around them. Rules that are
+# merged are written in the syntax of the vendor; the others keep their text.
+# With --verify, each optimized access list is compared with the original one.
+
+# An entry is one access-list line. rule is the normalized rule, or None for
+# remarks, inactive rules and lines that were not parsed.
+Entry = namedtuple('Entry', 'acl order text rule kind')
+
+PLAIN = 'plain'  # a rule that can be removed, merged and rewritten
+OPAQUE = 'opaque'  # a rule (or an unparsed line) that is kept as it is
+INERT = 'inert'  # a line that matches no packet, such as a remark
+
+FIELDS = ['src', 'dst', 'dstport', 'srcport']
+ASA_PLAIN_FIELDS = {'name', 'line', 'action', 'protocol', 'srcaddr', 'srcport',
+                    'dstaddr', 'dstport'}
+ASA_LINE = re.compile(r"^(access-list\s+\S+\s+)line\s+\d+\s+")
+
+# Matches every packet that no rule matches
+IMPLICIT_DENY = Rule(None, None, 'deny', ANY_PROTOCOL, ANY_ADDRESS, ANY_PORT,
+                     ANY_ADDRESS, ANY_PORT)
+
+
+def plainPorts(ports):
+    """
+    Returns True if ports can be written as one port argument (eq, lt, gt, range, neq).
+    """
+
+    if not isinstance(ports, tuple):
+        return False
+    if len(ports) == 2:
+        return ports[0][0] == 0 and ports[1][1] == 65535 and ports[0][1] + 2 == ports[1][0]
+    return len(ports) == 1
+
+
+def plainRule(rule):
+    return isinstance(rule.src, AddrMask) and isinstance(rule.dst, AddrMask) and \
+        plainPorts(rule.srcport) and plainPorts(rule.dstport)
+
+
+def asaPlain(text, rule):
+    """
+    Returns True if rule describes all of the text of an extended ASA rule,
+    so the rule can be rewritten without losing ports or options.
+    """
+
+    fields, rest = asaFields(text)
+    return fields is not None and not rest and fields == [
+        rule.action, rule.protocol, rule.src, rule.srcport, rule.dst, rule.dstport]
+
+
+def asaEntries(lines):
+    """
+    Returns the entries of the access lists of an ASA configuration, in order.
+    """
+
+    entries = []
+    for order, line in enumerate(asa.policyLineStream(lines)):
+        text = "access-list " + line
+        results = asa.policyParser(line)
+        if not results:
+            acl = line.split(None, 1)[0] if line.split() else ''
+            entries.append(Entry(acl, order, text, None, OPAQUE))
+            continue
+        policy = results[0].asDict()
+        rules = asaRules([policy], [line])
+        if not rules:
+            entries.append(Entry(policy.get('name'), order, text, None, INERT))
+            continue
+        rule = rules[0]._replace(order=order)
+        plain = set(policy) <= ASA_PLAIN_FIELDS and plainRule(rule) and asaPlain(text, rule)
+        entries.append(Entry(rule.acl, order, text, rule, PLAIN if plain else OPAQUE))
+    return entries
+
+
+def iosEntries(lines):
+    """
+    Returns the entries of the access lists of an IOS configuration, in order,
+    and the names of the standard access lists.
+    """
+
+    entries = []
+    standard = set()
+    for line in lines:
+        if not line.lstrip().startswith('access-list'):
+            continue
+        order = len(entries)
+        text = line.strip()
+        policies = list(config_parser.ios_policy_records([line]))
+        if not policies:
+            entries.append(Entry(text.split()[1], order, text, None, OPAQUE))
+            continue
+        policy = policies[0]
+        rules = iosRules([policy])
+        if not rules:
+            entries.append(Entry(policy.get('name'), order, text, None, INERT))
+            continue
+        if 'dstip' not in policy:
+            standard.add(rules[0].acl)
+        rule = rules[0]._replace(order=order)
+        plain = not policy.get('notes') and plainRule(rule)
+        entries.append(Entry(rule.acl, order, text, rule, PLAIN if plain else OPAQUE))
+    return entries, standard
+
+
+def prefixOf(addr):
+    """
+    Returns the smallest prefix, as (value, length), that contains an AddrMask.
+    """
+
+    return addressPrefixes(addr, 0)[0]
+
+
+def isPrefix(addr):
+    return prefixMask(prefixOf(addr)[1]) == addr.mask
+
+
+class ContainmentIndex:
+    """
+    Finds the rules that may contain a rule. Rules are kept in buckets by
+    protocol and by the smallest prefixes containing their source and
+    destination; a rule can only be contained in the buckets of the same or
+    shorter prefixes, and of its protocol or 'ip'.
+    """
+
+    def __init__(self, rules):
+        self.buckets = defaultdict(list)
+        self.srcLengths = set()
+        self.dstLengths = set()
+        for rule in rules:
+            src, dst = prefixOf(rule.src), prefixOf(rule.dst)
+            self.srcLengths.add(src[1])
+            self.dstLengths.add(dst[1])
+            self.buckets[rule.protocol, src, dst].append(rule)
+        self.srcLengths = sorted(self.srcLengths)
+        self.dstLengths = sorted(self.dstLengths)
+
+    @staticmethod
+    def ancestors(prefix, lengths):
+        value, length = prefix
+        return [(value & prefixMask(n), n) for n in lengths if n <= length]
+
+    def containers(self, rule):
+        """
+        Yields the rules that contain rule, including rule itself.
+        """
+
+        protocols = {rule.protocol, ANY_PROTOCOL}
+        srcs = self.ancestors(prefixOf(rule.src), self.srcLengths)
+        dsts = self.ancestors(prefixOf(rule.dst), self.dstLengths)
+        for protocol in protocols:
+            for src in srcs:
+                for dst in dsts:
+                    for other in self.buckets.get((protocol, src, dst), ()):
+                        if ruleRelation(rule, other) in (RRule.EM, RRule.IMB):
+                            yield other
+
+
+def runIds(entries):
+    """
+    Returns the run of each plain rule: runs are broken by a change of action
+    and by opaque rules.
+    """
+
+    runs = {}
+    run, action = 0, None
+    for e in entries:
+        if e.kind == OPAQUE:
+            run += 1
+            action = None
+        elif e.kind == PLAIN:
+            if e.rule.action != action:
+                run += 1
+                action = e.rule.action
+            runs[e.order] = run
+    return runs
+
+
+def dropCovered(entries):
+    """
+    Remove the plain rules covered by an earlier rule, or by another rule of
+    their run (the first of equal rules is kept).
+    """
+
+    runs = runIds(entries)
+    index = ContainmentIndex(e.rule for e in entries if e.kind == PLAIN)
+    kept = []
+    for e in entries:
+        if e.kind == PLAIN:
+            covered = False
+            for other in index.containers(e.rule):
+                if other.order == e.order:
+                    continue
+                if other.order < e.order or (runs[other.order] == runs[e.order] and
+                                             ruleRelation(e.rule, other) == RRule.IMB):
+                    covered = True
+                    break
+            if covered:
+                continue
+        kept.append(e)
+    return kept
+
+
+def mergeAddresses(values):
+    """
+    Merge AddrMasks into the fewest prefixes that match the same addresses.
+    Returns (value, members) pairs, where members are the indexes of the
+    values that each new value replaces. Non-contiguous masks are kept as they are.
+    """
+
+    levels = defaultdict(set)
+    others = defaultdict(list)
+    prefixes = []
+    for i, addr in enumerate(values):
+        if isPrefix(addr):
+            prefixes.append((prefixOf(addr), i))
+        else:
+            others[addr].append(i)
+
+    # Remove the prefixes inside another one
+    last = None
+    for (value, length), _ in sorted(prefixes):
+        if last and length >= last[1] and value & prefixMask(last[1]) == last[0]:
+            continue
+        last = (value, length)
+        levels[length].add(value)
+
+    # Join sibling prefixes into their parent, from the longest prefixes up
+    for length in range(32, 0, -1):
+        bit = 1 << (32 - length)
+        for value in sorted(levels[length]):
+            if value in levels[length] and value ^ bit in levels[length]:
+                levels[length] -= {value, value ^ bit}
+                levels[length - 1].add(value & ~bit)
+
+    lengths = sorted(n for n in levels if levels[n])
+    members = defaultdict(list)
+    for (value, length), i in prefixes:
+        for n in lengths:
+            if n <= length and value & prefixMask(n) in levels[n]:
+                members[value & prefixMask(n), n].append(i)
+                break
+    merged = [(AddrMask(value, prefixMask(length)), m) for (value, length), m in members.items()]
+    return merged + list(others.items())
+
+
+def mergePorts(values):
+    """
+    Merge port range tuples into the fewest ranges that match the same ports.
+    Returns (value, members) pairs like mergeAddresses.
+    """
+
+    ranges = mergeIntervals(r for ports in values for r in ports)
+    starts = [low for low, _ in ranges]
+    members = defaultdict(list)
+    for i, ports in enumerate(values):
+        for low, _ in ports:
+            members[ranges[bisect.bisect_right(starts, low) - 1]].append(i)
+    if ranges == ((0, 65535),):
+        return [(ANY_PORT, members[(0, 65535)])]
+    return [((r,), m) for r, m in members.items()]
+
+
+MERGERS = {'src': mergeAddresses, 'dst': mergeAddresses,
+           'srcport': mergePorts, 'dstport': mergePorts}
+
+
+def mergeRun(run):
+    """
+    Merge the rules of a run that differ in one field only, until no more can be merged.
+    """
+
+    changed = len(run) > 1
+    while changed:
+        changed = False
+        for field in FIELDS:
+            groups = defaultdict(list)
+            for e in run:
+                groups[e.rule._replace(order=None, **{field: None})].append(e)
+            merged = []
+            for key, members in groups.items():
+                values = [getattr(e.rule, field) for e in members]
+                results = MERGERS[field](values) if len(members) > 1 else []
+                if len(results) >= len(members) or not results:
+                    merged += members
+                    continue
+                changed = True
+                for value, indexes in results:
+                    same = [members[i] for i in indexes if values[i] == value]
+                    if same:
+                        merged.append(same[0])
+                        continue
+                    order = min(members[i].order for i in indexes)
+                    merged.append(Entry(key.acl, order, None,
+                                        key._replace(order=order, **{field: value}), PLAIN))
+            run = merged
+    return run
+
+
+def mergeRuns(entries):
+    """
+    Merge the rules of each run of plain rules with the same action.
+    """
+
+    runs = runIds(entries)
+    grouped = defaultdict(list)
+    result = []
+    for e in entries:
+        if e.kind == PLAIN:
+            grouped[runs[e.order]].append(e)
+        else:
+            result.append(e)
+    for run in grouped.values():
+        result += mergeRun(run)
+    result.sort(key=lambda e: e.order)
+    return result
+
+
+def optimizeEntries(entries):
+    """
+    Returns the optimized entries of one access list.
+    """
+
+    while True:
+        optimized = mergeRuns(dropCovered(entries))
+        if len(optimized) == len(entries):
+            return optimized
+        entries = optimized
+
+
+def formatAddress(vendor, addr):
+    if addr == ANY_ADDRESS:
+        return 'any'
+    if addr.mask == FULL_MASK:
+        return f"host {int2ip(addr.value)}"
+    if vendor == 'asa':
+        return f"{int2ip(addr.value)} {int2ip(addr.mask)}"
+    return f"{int2ip(addr.value)} {int2ip(~addr.mask & FULL_MASK)}"
+
+
+def formatPorts(ports):
+    if ports == ANY_PORT:
+        return ''
+    if len(ports) == 2:
+        return f"neq {ports[0][1] + 1}"
+    low, high = ports[0]
+    if low == high:
+        return f"eq {low}"
+    if low == 0:
+        return f"lt {high + 1}"
+    if high == 65535:
+        return f"gt {low - 1}"
+    return f"range {low} {high}"
+
+
+def formatEntry(vendor, entry, standard=()):
+    """
+    Returns the text of an entry: the original text, without the ASA line
+    number, or the rule written in the syntax of vendor.
+    """
+
+    if entry.text is not None:
+        return ASA_LINE.sub(r"\1", entry.text) if vendor == 'asa' else entry.text
+    r = entry.rule
+    if vendor == 'ios' and r.acl in standard:
+        words = ['access-list', r.acl, r.action, formatAddress(vendor, r.src)]
+    else:
+        words = ['access-list', r.acl] + (['extended'] if vendor == 'asa' else []) + \
+            [r.action, r.protocol, formatAddress(vendor, r.src), formatPorts(r.srcport),
+             formatAddress(vendor, r.dst), formatPorts(r.dstport)]
+    return ' '.join(w for w in words if w)
+
+
+def byACL(entries):
+    acls = {}
+    for e in entries:
+        acls.setdefault(e.acl, []).append(e)
+    return acls
+
+
+# Equivalence checking
+#
+# The packets of each protocol are split into regions (an AddrMask for each
+# address and a (low, high) range for each port) until, in each region, the
+# first rule of both lists that matches some of its packets matches all of
+# them. Their actions must then be the same. Opaque rules, whose packets are
+# not known, must be met in the same order in both lists: the packets they
+# match get their action in both lists, and the others go on to the next rules.
+
+Region = namedtuple('Region', 'src srcport dst dstport')
+
+
+def addressIntersects(addr, region):
+    return (addr.value ^ region.value) & addr.mask & region.mask == 0
+
+
+def addressCovers(addr, region):
+    return addr.mask & ~region.mask == 0 and (addr.value ^ region.value) & addr.mask == 0
+
+
+def portsIntersect(ports, region):
+    return any(low <= region[1] and region[0] <= high for low, high in ports)
+
+
+def portsCover(ports, region):
+    return any(low <= region[0] and region[1] <= high for low, high in ports)
+
+
+def intersects(rule, region):
+    return addressIntersects(rule.src, region.src) and \
+        addressIntersects(rule.dst, region.dst) and \
+        portsIntersect(rule.srcport, region.srcport) and \
+        portsIntersect(rule.dstport, region.dstport)
+
+
+def covers(rule, region):
+    return addressCovers(rule.src, region.src) and \
+        addressCovers(rule.dst, region.dst) and \
+        portsCover(rule.srcport, region.srcport) and \
+        portsCover(rule.dstport, region.dstport)
+
+
+def splitRegion(rule, region):
+    """
+    Split a region that rule partly matches on the first field it does not cover.
+    """
+
+    for field in ('src', 'dst'):
+        addr, area = getattr(rule, field), getattr(region, field)
+        missing = addr.mask & ~area.mask
+        if missing:
+            bit = 1 << (missing.bit_length() - 1)
+            mask = area.mask | bit
+            return [region._replace(**{field: AddrMask(area.value & ~bit & mask, mask)}),
+                    region._replace(**{field: AddrMask((area.value | bit) & mask, mask)})]
+    for field in ('srcport', 'dstport'):
+        low, high = getattr(region, field)
+        for start, end in getattr(rule, field):
+            for point in (start, end + 1):
+                if low < point <= high:
+                    return [region._replace(**{field: (low, point - 1)}),
+                            region._replace(**{field: (point, high)})]
+    raise ValueError("the rule covers the region")
+
+
+def checkList(entries):
+    """
+    Returns the rules of an access list as (kind, rule, identity), ending with the implicit deny.
+    """
+
+    items = [(e.kind, e.rule, e.text) for e in entries if e.kind != INERT]
+    return items + [(PLAIN, IMPLICIT_DENY, None)]
+
+
+def firstDifference(before, after):
+    """
+    Compare two lists of entries of one access list. Returns None if they make
+    the same decision for every packet, or a (protocol, region) where they may
+    not. protocol is None for the protocols that no rule names.
+    """
+
+    a, b = checkList(before), checkList(after)
+    protocols = {r.protocol for kind, r, _ in a + b if kind == PLAIN} - {ANY_PROTOCOL}
+    full = Region(ANY_ADDRESS, (0, 65535), ANY_ADDRESS, (0, 65535))
+    for protocol in sorted(protocols) + [None]:
+        def matches(item):
+            kind, r, _ = item
+            return kind != PLAIN or r.protocol in (ANY_PROTOCOL, protocol)
+
+        stack = [(full, [i for i in a if matches(i)], 0, [i for i in b if matches(i)], 0)]
+        while stack:
+            region, first, i, second, j = stack.pop()
+            x, y = first[i], second[j]
+            split = None
+            if x[0] == PLAIN and not covers(x[1], region):
+                split = x[1]
+            elif y[0] == PLAIN and not covers(y[1], region):
+                split = y[1]
+            if split is not None:
+                for part in splitRegion(split, region):
+                    def inside(item):
+                        return item[0] != PLAIN or intersects(item[1], part)
+
+                    first2 = [item for item in first[i:] if inside(item)]
+                    second2 = [item for item in second[j:] if inside(item)]
+                    stack.append((part, first2, 0, second2, 0))
+                continue
+
+            actionX = x[1].action if x[1] else None
+            actionY = y[1].action if y[1] else None
+            if x[0] == PLAIN and y[0] == PLAIN:
+                if actionX != actionY:
+                    return protocol, region
+            elif x[0] == OPAQUE and y[0] == OPAQUE:
+                if x[2] != y[2]:
+                    return protocol, region
+                stack.append((region, first, i + 1, second, j + 1))
+            elif actionX is None or actionX != actionY:
+                return protocol, region
+            elif x[0] == OPAQUE:
+                stack.append((region, first, i + 1, second, j))
+            else:
+                stack.append((region, first, i, second, j + 1))
+    return None
+
+
+def formatRegion(protocol, region):
+    """
+    Describe a region by the first packet in it.
+    """
+
+    return f"{protocol or 'other'} {int2ip(region.src.value)}:{region.srcport[0]} -> " \
+        f"{int2ip(region.dst.value)}:{region.dstport[0]}"
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(
+        description="Remove and merge redundant rules of ASA and IOS access lists.")
+    argparser.add_argument("vendor", choices=['ios', 'asa'])
+    argparser.add_argument("config", help="configuration file")
+    argparser.add_argument("--verify", action="store_true",
+                           help="check that each optimized access list is equivalent "
+                                "to the original")
+    args = argparser.parse_intermixed_args()
+
+    with open(args.config, 'r') as cfgfile:
+        if args.vendor == 'asa':
+            entries, standard = asaEntries(cfgfile), set()
+        else:
+            entries, standard = iosEntries(cfgfile)
+
+    failed = 0
+    for acl, members in byACL(entries).items():
+        optimized = optimizeEntries(members)
+        for e in optimized:
+            print(formatEntry(args.vendor, e, standard))
+        report = f"{acl}: {len(members)} entries, {len(optimized)} after optimization"
+        if args.verify:
+            difference = firstDifference(members, optimized)
+            if difference:
+                failed += 1
+                report += f", NOT equivalent at {formatRegion(*difference)}"
+            else:
+                report += ", equivalent"
+        print(report + ".", file=sys.stderr)
+    if failed:
+        sys.exit(1)
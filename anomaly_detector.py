@@ -0,0 +1,183 @@
+"""
+Copyright 2016-2021 Maen Artimy
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import sys
+import csv
+import heapq
+from collections import namedtuple, defaultdict
+
+from definitions import RRule, RField, Anomaly
+from normalizer import AddrMask, ANY_ADDRESS, addressBounds, fieldRelation, \
+    protocolRelation, iosRules, asaRules, fgRules
+
+# Usage: python3 anomaly_detector.py {ios|asa|fg} [config file]
+# Reports the anomalies between every pair of rules in the same ACL.
+
+Finding = namedtuple('Finding', 'acl rulex ruley relation anomaly')
+
+
+def ruleRelation(x, y):
+    """
+    Returns the relation of rule x to rule y (e.g. IMB if x is a subset of y).
+    """
+
+    fields = [protocolRelation(x.protocol, y.protocol),
+              fieldRelation(x.src, y.src), fieldRelation(x.srcport, y.srcport),
+              fieldRelation(x.dst, y.dst), fieldRelation(x.dstport, y.dstport)]
+    kinds = set(fields)
+
+    if RField.UNEQUAL in kinds:
+        return RRule.CD if kinds == {RField.UNEQUAL} else RRule.PD
+    if kinds == {RField.EQUAL}:
+        return RRule.EM
+    if kinds <= {RField.EQUAL, RField.SUBSET}:
+        return RRule.IMB
+    if kinds <= {RField.EQUAL, RField.SUPERSET}:
+        return RRule.IMP
+    return RRule.CC
+
+
+def ruleAnomaly(relation, x, y):
+    """
+    Classify the anomaly between rule x and the later rule y.
+    """
+
+    same = x.action == y.action
+    if relation in (RRule.EM, RRule.IMP):
+        return Anomaly.RXD if same else Anomaly.SHD
+    if relation == RRule.IMB:
+        return Anomaly.RUD if same else Anomaly.GEN
+    if relation == RRule.CC and not same:
+        return Anomaly.COR
+    return Anomaly.AOK
+
+
+def candidatePairs(rules):
+    """
+    Returns the pairs of rule indexes whose source and destination may overlap.
+    Address intervals are joined with a sweep over their start points, so
+    pairs with disjoint addresses are never compared.
+    Object names only meet the same name or 'any'.
+    """
+
+    def sourcePairs(values):
+        intervals = []
+        byName = defaultdict(list)
+        anyRules = []
+        for i, value in enumerate(values):
+            if isinstance(value, AddrMask):
+                intervals.append(addressBounds(value) + (i,))
+                if value == ANY_ADDRESS:
+                    anyRules.append(i)
+            else:
+                byName[value].append(i)
+
+        intervals.sort()
+        active = []  # heap of (high, index)
+        for low, high, i in intervals:
+            while active and active[0][0] < low:
+                heapq.heappop(active)
+            for _, j in active:
+                yield j, i
+            heapq.heappush(active, (high, i))
+
+        for group in byName.values():
+            for n, i in enumerate(group):
+                for j in group[:n]:
+                    yield j, i
+                for j in anyRules:
+                    yield j, i
+
+    dst = [r.dst for r in rules]
+    for i, j in sourcePairs([r.src for r in rules]):
+        if fieldRelation(dst[i], dst[j]) != RField.UNEQUAL:
+            yield (i, j) if i < j else (j, i)
+
+
+def findAnomalies(rules):
+    """
+    Classify every pair of rules in the same ACL and return the anomalies.
+    Pairs that cannot overlap are disjoint and are not reported.
+    """
+
+    acls = defaultdict(list)
+    for rule in rules:
+        acls[rule.acl].append(rule)
+
+    findings = []
+    for acl, members in acls.items():
+        members.sort(key=lambda r: r.order)
+        for i, j in sorted(candidatePairs(members)):
+            x, y = members[i], members[j]
+            relation = ruleRelation(x, y)
+            anomaly = ruleAnomaly(relation, x, y)
+            if anomaly != Anomaly.AOK:
+                findings.append(Finding(acl, x.order, y.order, relation, anomaly))
+    return findings
+
+
+def vendorRules(vendor, text):
+    """
+    Parse a configuration with the parser of vendor and return its rules.
+    """
+
+    return vendorTable(vendor, text)[1]
+
+
+def vendorTable(vendor, text):
+    """
+    Parse a configuration with the parser of vendor.
+    Returns the PolicyTable of the parsed policies and their rules.
+    """
+
+    from batch_parser import parseConfig
+
+    parsed = parseConfig(vendor, text)
+    if vendor == 'ios':
+        return parsed.table, iosRules(parsed.table)
+    if vendor == 'asa':
+        import asa_policy_parser_lite as asa
+        return parsed.table, asaRules(parsed.table, asa.policyLineStream(text.splitlines()))
+    return parsed.table, fgRules(parsed.table.bySection(parsed.sections))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python3 anomaly_detector.py {ios|asa|fg} [config file]",
+              file=sys.stderr)
+        sys.exit(1)
+
+    vendor = sys.argv[1]
+    if len(sys.argv) > 2:
+        with open(sys.argv[2], 'r') as cfgfile:
+            cfg = cfgfile.read()
+    else:
+        print("Input file name is required! An example is used for now.",
+              file=sys.stderr)
+        module = {'ios': 'ios_policy_parser', 'asa': 'asa_policy_parser_lite',
+                  'fg': 'fg_policy_parser_lite'}[vendor]
+        cfg = __import__(module).cfg
+
+    rules = vendorRules(vendor, cfg)
+    findings = findAnomalies(rules)
+
+    writer = csv.writer(sys.stdout, lineterminator='\n')
+    writer.writerow(Finding._fields)
+    for f in findings:
+        writer.writerow([f.acl, f.rulex, f.ruley, f.relation.name, f.anomaly.name])
+
+    print(f"Compared {len(rules)} rules and found {len(findings)} anomalies.",
+          file=sys.stderr)
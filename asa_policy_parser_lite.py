@@ -14,8 +14,16 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
-from pyparsing import *
 import sys
+import argparse
+
+from policy_export import PolicyWriter
+from policy_table import PolicyTable
+from profiler import Profiler
+
+# pyparsing is imported by the functions that build a grammar, and the modules
+# that only some options use (parse_cache, columnar_export and concurrent.futures)
+# where they are used, so that the parser starts quickly.
 
 # This app will be able to parse ASA policies like the following example:
 # See https://www.cisco.com/c/en/us/td/docs/security/asa/asa914/configuration/firewall/asa-914-firewall-config.html
@@ -40,21 +48,34 @@ access-list uvw extended permit ip 10.5.5.0 255.255.255.0 192.168.20.64 255.255.
 outfilename = "out.csv"
 NOT_PARSED = "**Unable to parse this policy**"
 
-# Cisco ACL Parsing Definitions
-POLICY_START_MARKER = LineStart() + Keyword("access-list").suppress()
-POLICY_END_MARKER = LineEnd().suppress()
+# Change when the grammar changes, so cached results are not reused
+GRAMMAR_VERSION = "asa-2"
 
-# General Parsing Definitions
-SEPERATOR = Word("-_.", max=1)
-LBRACE, RBRACE, SEMI, QUOTE, COMMA = map(Suppress, '{};",')
-#ip4Address = Combine(Word(nums, max=3) + ('.' + Word(nums, max=3))*3)
+# Every field the policy grammar can produce, used when the columns cannot
+# be collected from the parsed policies in advance
+ASA_FIELDS = ['name', 'line', 'action', 'protocol', 'srcaddr', 'srcport',
+              'dstaddr', 'dstport', 'icmp_opt', 'user', 'remark', 'time_range',
+              'inactive']
 
+# Names of the branches of policyDef that follow the ACL name, in the order they are tried
+POLICY_ALTERNATIVES = ['standard', 'extended', 'remark']
 
-def policyParser(text):
+# Names of the extended policies, which the protocol selects, in the order they are tried
+EXTENDED_ALTERNATIVES = ['fqdn', 'port', 'icmp', 'user']
+
+
+def policyGrammar():
     """
-    Parse individual firewall policies.
+    Build the grammar of individual firewall policies.
     """
 
+    from pyparsing import Combine, FollowedBy, Keyword, Literal, OneOrMore, Optional, \
+        Regex, Word, ZeroOrMore, alphanums, alphas, nums, oneOf, printables
+
+    # General Parsing Definitions
+    SEPERATOR = Word("-_.", max=1)
+    #ip4Address = Combine(Word(nums, max=3) + ('.' + Word(nums, max=3))*3)
+
     icmp = Literal("icmp")
     transport = oneOf("tcp udp sctp")
     action = oneOf("deny permit")
@@ -65,9 +86,9 @@ def policyParser(text):
     protocol_argument = Keyword(
         "object-group") + objName | Keyword("object") + objName | ~icmp + Word(alphas)
 
-    address_argument = Literal(
-        "any") | Keyword("host") + ip4Address | ip4Address + ip4Address | Keyword("interface") + objName | Keyword("object-group") + objName | Keyword("object") + objName
-    address_argument_st = Literal("any") | Keyword(
+    any_address = Keyword("any4") | Keyword("any6") | Literal("any")
+    address_argument = any_address | Keyword("host") + ip4Address | ip4Address + ip4Address | Keyword("interface") + objName | Keyword("object-group") + objName | Keyword("object") + objName
+    address_argument_st = any_address | Keyword(
         "host") + ip4Address | ip4Address + ip4Address
     user_argument = Keyword("object-group-user") + objName | Keyword(
         "user") + Keyword(printables) | Keyword("user-gorup") + Keyword(printables)
@@ -86,38 +107,113 @@ def policyParser(text):
     # User-Based Matching
     # access-list access_list_name [line line_number] extended {deny | permit} protocol_argument [user_argument] source_address_argument [port_argument] dest_address_argument [port_argument] [log [[level] [interval secs] | disable | default]] [time-range time_range_name] [inactive]
 
-    extendedHeader = objName(
-        "name") + Optional(lineNum) + Keyword("extended") + action("action")
-    fqdnPolicy = extendedHeader + protocol_argument.setParseAction(' '.join)("protocol") + \
+    # The ACL name, the optional line number, the ACL type and the action are read
+    # once and the protocol selects the extended policies that can match it.
+    # The extended policies keep their order (fqdn, port, icmp, user), so a line
+    # matches the same policy as when every alternative was tried in turn.
+    fqdnPolicy = protocol_argument.setParseAction(' '.join)("protocol") + \
         address_argument.setParseAction(' '.join)(
             "srcaddr") + address_argument.setParseAction(' '.join)("dstaddr")
-    portPolicy = extendedHeader + transport("protocol") + address_argument.setParseAction(' '.join)("srcaddr") + \
+    portPolicy = transport("protocol") + address_argument.setParseAction(' '.join)("srcaddr") + \
         Optional(port_argument).setParseAction(' '.join)("srcport") + \
         address_argument.setParseAction(' '.join)(
             "dstaddr") + Optional(port_argument).setParseAction(' '.join)("srcport")
-    icmpPolicy = extendedHeader + icmp("protocol") + address_argument.setParseAction(' '.join)("srcaddr") + \
+    icmpPolicy = icmp("protocol") + address_argument.setParseAction(' '.join)("srcaddr") + \
         address_argument.setParseAction(' '.join)(
             "dstaddr") + Optional(icmp_argument).setParseAction(' '.join)("icmp_opt")
-    userPolicy = extendedHeader + protocol_argument.setParseAction(' '.join)("protocol") + \
+    userPolicy = protocol_argument.setParseAction(' '.join)("protocol") + \
         Optional(user_argument)("user") + address_argument.setParseAction(' '.join)("srcaddr") + \
         Optional(port_argument).setParseAction(' '.join)("srcport") + \
         address_argument.setParseAction(' '.join)(
             "dstaddr") + Optional(port_argument).setParseAction(':'.join)("dstport")
+    for policy, name in zip((fqdnPolicy, portPolicy, icmpPolicy, userPolicy),
+                            EXTENDED_ALTERNATIVES):
+        policy.setName(name)
+
+    # Options that may follow the policy, after the log settings
+    timeRange = Keyword("time-range").suppress() + objName("time_range")
+    inactive = Keyword("inactive")("inactive")
+    skipToOption = Regex(r"[^\n]*?(?=(?<![\w-])(time-range|inactive)(?![\w-]))").suppress()
+    options = Optional(skipToOption + Optional(timeRange) + Optional(inactive))
+
+    extendedPolicy = Keyword("extended") + action("action") + (
+        FollowedBy(icmp) + (icmpPolicy | userPolicy) |
+        FollowedBy(transport) + (fqdnPolicy | portPolicy | userPolicy) |
+        fqdnPolicy | userPolicy) + options
 
     # Standard ACLs
     # access-list access_list_name standard {deny | permit} {any4 | host ip_address | ip_address mask }
 
-    standardPolicy = objName("name") + \
-        Keyword("standard") + action("action") + \
+    standardPolicy = Keyword("standard") + action("action") + \
         address_argument_st.setParseAction(' '.join)("srcaddr")
 
-    remarkPolicy = objName("name") + \
-        Optional(lineNum) + Keyword("remark") + \
+    remarkPolicy = Keyword("remark") + \
         OneOrMore(Word(printables)).setParseAction(' '.join)("remark")
 
-    policyDef = fqdnPolicy | portPolicy | icmpPolicy | userPolicy | remarkPolicy | standardPolicy
+    # Standard policies have no line number
+    policyDef = objName("name") + (
+        standardPolicy | Optional(lineNum) + extendedPolicy | Optional(lineNum) + remarkPolicy)
+
+    return policyDef
+
+
+class PolicyParser:
+    """
+    Reusable parser of individual firewall policies.
+    The grammar is built once, when the parser is created, and shared by all lines.
+    """
+
+    def __init__(self):
+        self.policyDef = policyGrammar()
+
+    def parse(self, text):
+        """
+        Parse the policies found in text.
+        """
+
+        return self.policyDef.searchString(text)
+
+    def parse_lines(self, lines):
+        """
+        Parse an iterable of policy lines, yielding the results of each line in order.
+        """
+
+        for line in lines:
+            yield self.policyDef.searchString(line)
+
+
+_parser = None
+
+
+def defaultParser():
+    """
+    Returns the module-wide parser, building it on first use.
+    """
+
+    global _parser
+    if _parser is None:
+        _parser = PolicyParser()
+    return _parser
+
+
+def policyParser(text):
+    """
+    Parse individual firewall policies.
+    """
+
+    return defaultParser().parse(text)
 
-    return policyDef.searchString(text)
+
+def parallelPolicyParser(lines, jobs, chunksize=1000):
+    """
+    Parse policy lines in a pool of jobs processes.
+    Lines are sent to the processes in chunks and the results are returned in order.
+    """
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(policyParser, lines, chunksize=chunksize))
 
 
 def policyFinder(text):
@@ -126,11 +222,67 @@ def policyFinder(text):
     It is used to verify the number of policies parsed correctly.
     """
 
+    from pyparsing import Keyword, LineEnd, LineStart, SkipTo
+
+    # Cisco ACL Parsing Definitions
+    POLICY_START_MARKER = LineStart() + Keyword("access-list").suppress()
     policyDef = POLICY_START_MARKER + SkipTo(LineEnd())
 
     return policyDef.searchString(text)
 
 
+def policyLineStream(lines):
+    """
+    Yields the text that follows the keyword 'access-list' on each line,
+    like policyFinder, without reading all the lines into memory.
+    """
+
+    for line in lines:
+        words = line.split(None, 1)
+        if words and words[0] == "access-list":
+            yield words[1].rstrip("\r\n") if len(words) > 1 else ""
+
+
+def streamToCSV(columns, lines, outfile, parse=None, columnar=None):
+    """
+    Parse the policies one line at a time and write them to outfile
+    as a comma-seperated table, and to the columnar writer, if given.
+    parse replaces policyParser, e.g. to use a cache.
+    Returns the report generated by verifyParsing.
+    """
+
+    if parse is None:
+        results = defaultParser().parse_lines(policyLineStream(lines))
+    else:
+        results = map(parse, policyLineStream(lines))
+    policies = (sec[0] if sec else None for sec in results)
+    if columnar:
+        policies = columnarCopy(policies, columnar)
+    writer = policyToCSV(columns, policies, outfile)
+    return verifyParsing(writer.written + writer.failed, writer.failed)
+
+
+def columnarCopy(policies, columnar):
+    """
+    Yields the policies after writing each one to the columnar writer.
+    """
+
+    for policy in policies:
+        columnar.writePolicies([policy])
+        yield policy
+
+
+def policyTable(results):
+    """
+    Store the results of the parser in a PolicyTable.
+    Lines that were not parsed are kept as failed rows.
+    """
+
+    table = PolicyTable()
+    table.extend(sec[0] if sec else None for sec in results)
+    return table
+
+
 def fieldNames(policies):
     """
     Extract field names from parsed policies
@@ -143,57 +295,159 @@ def fieldNames(policies):
     return list(fields)
 
 
-def verifyParsing(num, text):
+def verifyParsing(num, count):
     """
-    Generate report for debugging.
+    Generate report for debugging. count is the number of policies not parsed.
     """
 
-    count = text.count(NOT_PARSED)
     return f"Found {num} and parsed {num - count} policies.\n"
 
 
-def policyToCSV(columns, policies):
+def policyToCSV(columns, policies, outfile):
     """
-    Returns a list of strings. 
-    Each string represents a comma-seperated table of a single firewall policy section.
+    Write the parsed policies to outfile as a comma-seperated table, one row
+    per policy, as they are produced. Policies that were not parsed are None
+    and are marked in the table.
+    Returns the PolicyWriter, which counts the written and failed policies.
     """
 
-    st = ','.join(columns) + "\n"
-    for sec in policies:
-        if sec:
-            row = [sec[0].get(att, '') for att in columns]
-            st += ",".join(row) + "\n"
+    writer = PolicyWriter(outfile, columns)
+    writer.writeHeader()
+    for policy in policies:
+        if policy is None:
+            writer.writeFailure(NOT_PARSED)
         else:
-            st += NOT_PARSED + "\n"
-
-    # print(f"Policies not parsed {count}")
-    return st
+            writer.writePolicy(policy)
+    return writer
 
 
 if __name__ == "__main__":
     # Read command line arguments
-    if len(sys.argv) > 2:
-        outfilename = sys.argv[2].split('.')[0] + ".csv"
-    if len(sys.argv) > 1:
-        with open(sys.argv[1], 'r') as fgfile:
-            cfg = fgfile.read()
-    else:
+    argparser = argparse.ArgumentParser(
+        description="Convert ASA access-list policies to CSV.")
+    argparser.add_argument("infile", nargs="?", help="configuration file")
+    argparser.add_argument("outfile", nargs="?", help="output file name")
+    argparser.add_argument("--stream", action="store_true",
+                           help="parse one line at a time with bounded memory")
+    argparser.add_argument("--jobs", type=int, default=1,
+                           help="number of processes used to parse the policies")
+    argparser.add_argument("--cache", metavar="PATH",
+                           help="reuse the results of unchanged lines from this cache file")
+    argparser.add_argument("--cache-size", type=int, default=256, metavar="MB",
+                           help="largest size of the cache file")
+    argparser.add_argument("--columnar", metavar="PATH",
+                           help="also write the policies in a columnar binary format: "
+                           "Arrow (.arrow), Parquet (.parquet) or a directory of NumPy arrays")
+    argparser.add_argument("--profile", metavar="FILE",
+                           help="write the time spent in each stage to FILE as JSON")
+    args = argparser.parse_intermixed_args()
+    if args.jobs > 1 and (args.stream or args.cache):
+        argparser.error("--jobs cannot be combined with --stream or --cache")
+
+    profiler = Profiler()
+    parser = defaultParser()
+    if args.profile and args.jobs <= 1:
+        # The alternatives are timed only in this process
+        parser = PolicyParser()
+        profiler.instrument(parser.policyDef.exprs[-1], 'policyDef', POLICY_ALTERNATIVES)
+        profiler.instrumentNamed(parser.policyDef, 'extended', EXTENDED_ALTERNATIVES)
+
+    parse = None
+    cache = None
+    if args.cache:
+        from parse_cache import ParseCache
+        cache = ParseCache(args.cache, args.cache_size * 1024 * 1024)
+        # Lines that are not in the cache are parsed, and profiled, by parser
+        parse = cache.cached(parser.parse, GRAMMAR_VERSION)
+
+    if args.outfile:
+        outfilename = args.outfile.split('.')[0] + ".csv"
+    if not args.infile:
         print("Input file name is required! An example is used for now.")
 
-    # Parse firewall policies
-    policylines = [p[0] for p in policyFinder(cfg)]
-    policies = [policyParser(policy) for policy in policylines]
+    if args.stream:
+        columnar = None
+        if args.columnar:
+            from columnar_export import columnarWriter
+            columnar = columnarWriter(args.columnar, ASA_FIELDS)
+        # Parsing and writing are interleaved, so they are profiled as one stage
+        with profiler.stage('stream') as stage, open(outfilename, 'w') as outfile:
+            parseLine = parse or parser.parse
+
+            def parse(text):
+                policies = parseLine(text)
+                stage.items += 1
+                stage.bytes += len(text)
+                stage.failures += not policies
+                return policies
+
+            if args.infile:
+                with open(args.infile, 'r') as fgfile:
+                    report = streamToCSV(ASA_FIELDS, fgfile, outfile, parse, columnar)
+            else:
+                report = streamToCSV(ASA_FIELDS, cfg.splitlines(), outfile, parse, columnar)
+        if columnar:
+            columnar.close()
+        if cache:
+            cache.close()
+            report += cache.report()
+        print(report, file=sys.stderr)
+        if args.profile:
+            with open(args.profile, 'w') as profile:
+                profiler.write(profile)
+        sys.exit()
+
+    if args.infile:
+        with open(args.infile, 'r') as fgfile:
+            cfg = fgfile.read()
+
+    # Find and parse firewall policies
+    with profiler.stage('policyFinder', bytes=len(cfg)) as stage:
+        if cache:
+            policylines = list(policyLineStream(cfg.splitlines()))
+        else:
+            policylines = [p[0] for p in policyFinder(cfg)]
+        stage.items = len(policylines)
+
+    with profiler.stage('policyParser', bytes=sum(map(len, policylines))) as stage:
+        if cache:
+            # Unchanged lines are loaded from the cache
+            results = map(parse, policylines)
+        elif args.jobs > 1:
+            results = parallelPolicyParser(policylines, args.jobs)
+        else:
+            results = parser.parse_lines(policylines)
+        policies = policyTable(results)
+        stage.items = len(policies)
+        stage.failures = policies.failed
 
     # Get field names from parsed policies and insert order field
-    columns = fieldNames(policies)
+    with profiler.stage('fieldNames') as stage:
+        columns = policies.fieldNames()
+        stage.items = len(policies)
     #columns = ['name','line','action','protocol','srcaddr','srcport','dstaddr','dstport','icmp_opt','remark']
 
     # Convert parsed policies to CSV and save to file
-    text = ""
-    with open(outfilename, 'w') as outfile:
-        for s in policyToCSV(columns, policies):
-            text += s
-            outfile.write(s)
+    with profiler.stage('csv') as stage, open(outfilename, 'w') as outfile:
+        writer = policyToCSV(columns, policies, outfile)
+        stage.items = writer.written
+        stage.failures = writer.failed
+        stage.bytes = outfile.tell()
+
+    if args.columnar:
+        from columnar_export import columnarWriter
+        with profiler.stage('columnar') as stage, \
+                columnarWriter(args.columnar, columns) as columnar:
+            columnar.writePolicies(policies)
+            stage.items = columnar.written
+            stage.failures = columnar.failed
 
     # Print report
-    print(verifyParsing(len(policylines), text), file=sys.stderr)
+    report = verifyParsing(len(policylines), writer.failed)
+    if cache:
+        cache.close()
+        report += cache.report()
+    print(report, file=sys.stderr)
+    if args.profile:
+        with open(args.profile, 'w') as profile:
+            profiler.write(profile)
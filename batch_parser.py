@@ -0,0 +1,245 @@
+"""
+Copyright 2016-2021 Maen Artimy
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import re
+import sys
+import csv
+import glob
+import time
+import argparse
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import asa_policy_parser_lite as asa
+import fg_policy_parser_lite as fg
+import config_parser
+from policy_export import PolicyWriter
+from policy_table import PolicyTable
+
+# Usage: python3 batch_parser.py [--outdir DIR] [--jobs N] directory_or_glob ...
+# Parses every configuration file in one pool of processes and writes
+# one CSV file per device and a summary of all devices to the output directory.
+
+ParsedConfig = namedtuple('ParsedConfig', 'vendor table sections found')
+
+SUMMARY_FIELDS = ['device', 'file', 'vendor', 'found', 'parsed', 'failed', 'seconds', 'error']
+
+FG_MARKER = re.compile(r"^\s*config firewall policy\s*$", re.MULTILINE)
+ASA_MARKER = re.compile(
+    r"^\s*access-list\s+\S+\s+(line\s+\d+\s+)?(extended|standard|remark|webtype|ethertype)\b"
+    r"|^ASA Version", re.MULTILINE)
+IOS_MARKER = re.compile(r"^\s*access-list\s+\d+\s+(permit|deny)\b", re.MULTILINE)
+IOS_REMARK = re.compile(r"^\s*access-list\s+\d+\s+remark\b", re.MULTILINE)
+
+
+def detectVendor(text):
+    """
+    Returns the vendor of a configuration ('fg', 'asa' or 'ios') or None.
+    ASA policies always name their type, so 'access-list N permit' is IOS.
+    """
+
+    if FG_MARKER.search(text):
+        return 'fg'
+    if IOS_MARKER.search(text):
+        return 'ios'
+    if ASA_MARKER.search(text):
+        return 'asa'
+    if IOS_REMARK.search(text):
+        return 'ios'
+    return None
+
+
+def parseConfig(vendor, text):
+    """
+    Parse a configuration with the parser of vendor.
+    Returns the PolicyTable, the number of sections and the number of policies found.
+    """
+
+    if vendor == 'fg':
+        sections = fg.policySectionParser(text)
+        table = fg.policyTable(fg.policyParser(s.content) for s in sections)
+        found = sum(1 for _, block in fg.policyStream(text.splitlines())
+                    if block.split(None, 2)[1:2] and block.split(None, 2)[1].isdigit())
+        return ParsedConfig(vendor, table, len(sections), found)
+    if vendor == 'asa':
+        lines = list(asa.policyLineStream(text.splitlines()))
+        table = asa.policyTable(asa.defaultParser().parse_lines(lines))
+        return ParsedConfig(vendor, table, 1, len(lines))
+    if vendor == 'ios':
+        lines = text.splitlines()
+        table = PolicyTable()
+        table.extend(config_parser.ios_policy_records(lines))
+        found = sum(1 for line in lines if line.split(None, 1)[:1] == ['access-list'])
+        return ParsedConfig(vendor, table, 1, found)
+    raise ValueError(f"Unknown vendor '{vendor}'")
+
+
+def writeCSV(parsed, outfile):
+    """
+    Write the policies of a ParsedConfig to outfile in the format of the vendor's
+    own command line tool. Returns the number of policies written.
+    """
+
+    table = parsed.table
+    if parsed.vendor == 'fg':
+        writer = fg.policyToCSV(sorted(table.fieldNames()),
+                                table.bySection(parsed.sections), outfile)
+    elif parsed.vendor == 'asa':
+        writer = asa.policyToCSV(table.fieldNames(), table, outfile)
+    else:
+        writer = PolicyWriter(outfile, table.fieldNames())
+        writer.writeHeader()
+        writer.writePolicies(table.records())
+    return writer.written
+
+
+def warmUp():
+    """
+    Build the grammars once in each process of the pool.
+    """
+
+    asa.defaultParser()
+    fg.policyParser("")
+    config_parser.ios_policy_parser("")
+
+
+def parseFile(path, outpath):
+    """
+    Parse one configuration file and write its policies to outpath.
+    Returns a summary of the file, with the error if it could not be read.
+    """
+
+    start = time.perf_counter()
+    try:
+        with open(path, 'r') as cfgfile:
+            text = cfgfile.read()
+    except (OSError, ValueError) as e:
+        summary = dict.fromkeys(SUMMARY_FIELDS, '')
+        summary.update(device=os.path.splitext(os.path.basename(outpath))[0], file=path,
+                       error=f"read: {e}", seconds=round(time.perf_counter() - start, 4))
+        return summary
+    return parseText(text, path, outpath, start)
+
+
+def parseText(text, path, outpath, start=None):
+    """
+    Parse the configuration text read from path and write its policies to outpath.
+    Returns a summary of the file, timed from start, with the error if it
+    could not be parsed or written.
+    """
+
+    start = time.perf_counter() if start is None else start
+    summary = dict.fromkeys(SUMMARY_FIELDS, '')
+    summary.update(device=os.path.splitext(os.path.basename(outpath))[0], file=path)
+    vendor = detectVendor(text)
+    if vendor is not None:
+        summary['vendor'] = vendor
+        try:
+            parsed = parseConfig(vendor, text)
+            with open(outpath, 'w') as outfile:
+                written = writeCSV(parsed, outfile)
+            summary.update(found=parsed.found, parsed=written,
+                           failed=max(parsed.found - written, 0))
+        except Exception as e:
+            summary['error'] = f"parse: {e}"
+    summary['seconds'] = round(time.perf_counter() - start, 4)
+    return summary
+
+
+def expandInputs(inputs):
+    """
+    Returns the files named by a list of files, directories and glob patterns.
+    """
+
+    paths = []
+    for name in inputs:
+        if os.path.isdir(name):
+            paths += sorted(os.path.join(name, f) for f in os.listdir(name)
+                            if os.path.isfile(os.path.join(name, f)))
+        else:
+            paths += sorted(glob.glob(name)) or [name]
+    return paths
+
+
+def outputPaths(paths, outdir):
+    """
+    Returns one output file per input file, named after the device (file name).
+    """
+
+    outputs = []
+    used = set()
+    for path in paths:
+        device = os.path.splitext(os.path.basename(path))[0]
+        name, n = device, 1
+        while name in used:
+            n += 1
+            name = f"{device}-{n}"
+        used.add(name)
+        outputs.append(os.path.join(outdir, name + ".csv"))
+    return outputs
+
+
+def batchParse(paths, outdir, jobs=1):
+    """
+    Parse the files in a pool of jobs processes and write the results to outdir.
+    Returns the summaries of the files, in the order of paths.
+    """
+
+    os.makedirs(outdir, exist_ok=True)
+    outputs = outputPaths(paths, outdir)
+    if jobs <= 1:
+        warmUp()
+        return [parseFile(p, o) for p, o in zip(paths, outputs)]
+    with ProcessPoolExecutor(max_workers=jobs, initializer=warmUp) as executor:
+        return list(executor.map(parseFile, paths, outputs))
+
+
+def writeSummary(summaries, outfile):
+    """
+    Write the summaries of all the files as a comma-seperated table.
+    """
+
+    writer = csv.DictWriter(outfile, lineterminator='\n', fieldnames=SUMMARY_FIELDS)
+    writer.writeheader()
+    writer.writerows(summaries)
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(
+        description="Convert the firewall policies of many devices to CSV.")
+    argparser.add_argument("inputs", nargs="+",
+                           help="configuration files, directories or glob patterns")
+    argparser.add_argument("--outdir", default="out",
+                           help="directory of the output files")
+    argparser.add_argument("--jobs", type=int, default=os.cpu_count(),
+                           help="number of processes used to parse the files")
+    args = argparser.parse_intermixed_args()
+
+    start = time.perf_counter()
+    summaries = batchParse(expandInputs(args.inputs), args.outdir, args.jobs)
+    with open(os.path.join(args.outdir, "summary.csv"), 'w') as outfile:
+        writeSummary(summaries, outfile)
+
+    for s in summaries:
+        if s['error']:
+            print(f"{s['device']}: {s['error']}", file=sys.stderr)
+            continue
+        vendor = s['vendor'] or 'unknown vendor, skipped'
+        print(f"{s['device']} ({vendor}): parsed {s['parsed'] or 0} of "
+              f"{s['found'] or 0} policies in {s['seconds']:.3f}s", file=sys.stderr)
+    print(f"Parsed {len(summaries)} file(s) in {time.perf_counter() - start:.3f}s.",
+          file=sys.stderr)
@@ -0,0 +1,678 @@
+"""
+Copyright 2016-2021 Maen Artimy
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import io
+import sys
+import csv
+import json
+import time
+import random
+import platform
+import argparse
+import resource
+import tempfile
+import subprocess
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+import asa_policy_parser_lite as asa
+import fg_policy_parser_lite as fg
+import ios_policy_parser
+import config_parser
+from policy_export import PolicyWriter
+from policy_table import PolicyTable
+
+# Usage: python3 benchmark.py {asa-grammar|scaling|ios-fastpath|csv|table|lookup|objects|columnar} [-n size] [--jobs N]
+#        python3 benchmark.py startup [--budget MS]
+#        python3 benchmark.py suite [--sizes 1000,10000] [--vdoms N] [--output FILE] [--compare FILE]
+
+ASA_TEMPLATES = [
+    "access-list {name} extended permit icmp any any echo",
+    "access-list {name} line {line} extended permit tcp any eq https host {ip} eq https",
+    "access-list {name} extended {action} ip {net} 255.255.255.0 {ip} 255.255.255.240",
+    "access-list {name} extended {action} udp host {ip} any eq {port}",
+    "access-list {name} remark generated policy {line}",
+    "access-list {name} standard {action} host {ip}",
+]
+
+
+def asaConfig(size, seed=0):
+    """
+    Generate a synthetic ASA configuration with size access-list lines.
+    """
+
+    rnd = random.Random(seed)
+    lines = []
+    for x in range(size):
+        ip = f"10.{rnd.randrange(256)}.{rnd.randrange(256)}.{rnd.randrange(256)}"
+        net = f"192.168.{rnd.randrange(256)}.0"
+        lines.append(rnd.choice(ASA_TEMPLATES).format(
+            name=f"acl{x % 7}", line=x + 1, ip=ip, net=net,
+            action=rnd.choice(["permit", "deny"]), port=rnd.randrange(1, 65536)))
+    return "\n".join(lines) + "\n"
+
+
+def fgConfig(size, vdoms=1, seed=0):
+    """
+    Generate a synthetic FortiOS configuration with size policies spread over vdoms.
+    """
+
+    rnd = random.Random(seed)
+    lines = []
+    for v in range(vdoms):
+        lines.append(f"config vdom\nedit vdom{v}\nconfig firewall policy")
+        for x in range(size // vdoms):
+            lines.append(f"""    edit {x + 1}
+        set name "policy-{x + 1}"
+        set uuid {rnd.getrandbits(128):032x}
+        set srcintf "port{rnd.randrange(8)}"
+        set dstintf "port{rnd.randrange(8)}"
+        set srcaddr "net-{rnd.randrange(1000)}"
+        set dstaddr "all"
+        set action {rnd.choice(["accept", "deny"])}
+        set schedule "always"
+        set service "{rnd.choice(["ALL", "HTTP", "HTTPS", "DNS"])}"
+        set logtraffic all
+    next""")
+        lines.append("end\nend")
+    return "\n".join(lines) + "\n"
+
+
+def fgObjectConfig(groups, seed=0):
+    """
+    Generate a FortiOS configuration with groups nested address and service
+    groups and one policy per group. Groups form trees in which every group
+    holds three others; one group in a hundred also holds its parent (a cycle).
+    """
+
+    rnd = random.Random(seed)
+    lines = ["config firewall address"]
+    for x in range(groups):
+        lines.append(f'    edit "host-{x}"\n        set subnet 10.{x >> 8 & 255}.{x & 255}.1 '
+                     f'255.255.255.255\n    next')
+    lines.append("end\nconfig firewall addrgrp")
+    for x in range(groups):
+        members = [f'"host-{rnd.randrange(groups)}"' for _ in range(3)]
+        members += [f'"grp-{c}"' for c in range(3 * x + 1, min(3 * x + 4, groups))]
+        if x % 100 == 99:
+            members.append(f'"grp-{(x - 1) // 3}"')
+        lines.append(f'    edit "grp-{x}"\n        set member {" ".join(members)}\n    next')
+    lines.append("end\nconfig firewall service custom")
+    for x in range(groups):
+        lines.append(f'    edit "svc-{x}"\n        set tcp-portrange {1000 + x % 60000}\n    next')
+    lines.append("end\nconfig firewall service group")
+    for x in range(groups):
+        members = [f'"svc-{rnd.randrange(groups)}"' for _ in range(2)]
+        members += [f'"sgrp-{c}"' for c in range(3 * x + 1, min(3 * x + 4, groups))]
+        lines.append(f'    edit "sgrp-{x}"\n        set member {" ".join(members)}\n    next')
+    lines.append("end\nconfig firewall policy")
+    for x in range(groups):
+        lines.append(f'    edit {x + 1}\n        set srcaddr "grp-{rnd.randrange(groups)}"\n'
+                     f'        set dstaddr "all"\n        set action accept\n'
+                     f'        set service "sgrp-{rnd.randrange(groups)}"\n    next')
+    lines.append("end")
+    return "\n".join(lines) + "\n"
+
+
+def iosConfig(size, seed=0):
+    """
+    Generate a synthetic IOS configuration with size numbered access-list lines.
+    """
+
+    rnd = random.Random(seed)
+    lines = []
+    for x in range(size):
+        num = rnd.choice([10, 20, 101, 121, 141])
+        src = rnd.choice(["any", f"host 10.0.{x % 256}.{rnd.randrange(256)}",
+                          f"10.{x % 256}.0.0 0.0.255.255"])
+        dst = rnd.choice(["any", f"172.16.{x % 256}.0 0.0.0.255"])
+        action = rnd.choice(["permit", "deny"])
+        if x % 50 == 0:
+            lines.append(f"access-list {num} remark generated policy {x}")
+        elif num < 100:
+            lines.append(f"access-list {num} {action} ip {src}")
+        else:
+            port = rnd.choice(["", " eq www", f" range {x % 1000} {x % 1000 + 10}", " gt 1023"])
+            lines.append(f"access-list {num} {action} tcp {src} {dst}{port}")
+    return "\n".join(lines) + "\n"
+
+
+def iosFuzzLines(count, seed=0):
+    """
+    Generate access-list lines from valid and invalid tokens, with random spacing.
+    """
+
+    rnd = random.Random(seed)
+    nums = ["1", "13", "99", "100", "141", "2000", "007", "1a", "-1"]
+    actions = ["permit", "deny", "remark", "permitx", "Permit", "dynamic"]
+    protocols = ["ip", "tcp", "udp", "icmp", "6", "tcp-x", "gre"]
+    addresses = ["any", "any4", "host 1.2.3.4", "host", "10.0.0.0 0.255.255.255",
+                 "10.0.0.0", "1.2.3.4 any", "999.1.1.1 0.0.0.0", "1.2.3 0.0.0.255",
+                 "host 1.2.3.4.5", "anything"]
+    ports = ["", "", "eq 80", "eq www", "eq ftp-data", "gt 1023", "lt 10",
+             "neq 53", "range 10 20", "range www 20", "eq", "range 1", "gtx 5",
+             "eq 80x", "neq _"]
+    tails = ["", "", "log", "established", "echo", "log  extra words  ", "eq 5", "any"]
+    lines = []
+    for _ in range(count):
+        words = ["access-list", rnd.choice(nums), rnd.choice(actions)]
+        if words[2] == "remark":
+            words.append(rnd.choice(["", "a remark", " spaced  remark "]))
+        else:
+            words += [rnd.choice(protocols), rnd.choice(addresses), rnd.choice(ports),
+                      rnd.choice(addresses), rnd.choice(ports), rnd.choice(tails)]
+        sep = rnd.choice([" ", "  ", " \t"])
+        line = sep.join(w for w in words if w)
+        lines.append(rnd.choice(["", " "]) + line + rnd.choice(["", " ", "\n", "\r\n"]))
+    return lines
+
+
+def timeit(func, *args, **kwargs):
+    """
+    Returns the result of func and the elapsed wall time.
+    """
+
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def benchASAGrammar(size):
+    """
+    Compare building the ASA grammar for every line against the compiled parser.
+    """
+
+    policylines = [p[0] for p in asa.policyFinder(asaConfig(size))]
+
+    def perLine():
+        return [asa.policyGrammar().searchString(line) for line in policylines]
+
+    def compiled():
+        return list(asa.PolicyParser().parse_lines(policylines))
+
+    old, told = timeit(perLine)
+    new, tnew = timeit(compiled)
+    assert [r.asList() for r in old] == [r.asList() for r in new]
+
+    st = f"ASA grammar, {len(policylines)} lines:\n"
+    st += f"  per-line grammar: {told:.3f}s ({len(policylines) / told:.0f} lines/s)\n"
+    st += f"  compiled parser:  {tnew:.3f}s ({len(policylines) / tnew:.0f} lines/s)\n"
+    st += f"  speedup: {told / tnew:.1f}x\n"
+    return st
+
+
+def benchScaling(size, jobs):
+    """
+    Measure the speedup of the parallel parsers from 1 to jobs processes.
+    """
+
+    sections = [s.content for s in fg.policySectionParser(fgConfig(size, vdoms=4))]
+    policylines = [p[0] for p in asa.policyFinder(asaConfig(size))]
+
+    st = f"Parallel parsing, {size} policies:\n"
+    for name, serial, parallel in [
+            ("fg", lambda: [fg.policyParser(s) for s in sections],
+             lambda n: fg.parallelPolicyParser(sections, n)),
+            ("asa", lambda: list(asa.PolicyParser().parse_lines(policylines)),
+             lambda n: asa.parallelPolicyParser(policylines, n))]:
+        _, base = timeit(serial)
+        st += f"  {name} jobs=1: {base:.3f}s\n"
+        for n in range(2, jobs + 1):
+            _, t = timeit(parallel, n)
+            st += f"  {name} jobs={n}: {t:.3f}s (speedup {base / t:.2f}x)\n"
+    return st
+
+
+def benchIOSFastPath(size):
+    """
+    Check that the IOS fast path agrees with the grammar on the bundled sample
+    and on fuzzed lines, then compare the speed of both engines.
+    """
+
+    samples = ios_policy_parser.cfg.splitlines(keepends=True)
+    fuzz = iosFuzzLines(size)
+    mismatches = config_parser.compare_engines(samples + fuzz)
+    accepted = sum(config_parser.ios_fast_parser(line) is not None for line in fuzz)
+
+    text = iosConfig(size)
+    lines = text.splitlines()
+    old, told = timeit(lambda: [p.asDict() for p in config_parser.ios_policy_parser(text)])
+    new, tnew = timeit(lambda: list(config_parser.ios_policy_records(lines)))
+    assert old == new
+
+    st = f"IOS fast path, {len(fuzz)} fuzzed lines ({accepted} taken by the fast path):\n"
+    st += f"  mismatches: {len(mismatches)}\n"
+    for line in mismatches[:10]:
+        st += f"    {line!r}\n"
+    st += f"IOS engines, {len(lines)} lines:\n"
+    st += f"  grammar:   {told:.3f}s ({len(lines) / told:.0f} lines/s)\n"
+    st += f"  fast path: {tnew:.3f}s ({len(lines) / tnew:.0f} lines/s)\n"
+    st += f"  speedup: {told / tnew:.1f}x\n"
+    return st
+
+
+def benchCSV(size):
+    """
+    Compare writing size rows with string concatenation, as the ASA parser did,
+    against the streaming PolicyWriter.
+    """
+
+    columns = asa.ASA_FIELDS
+    rows = [{'name': f"acl{x % 7}", 'line': str(x), 'action': 'permit', 'protocol': 'tcp',
+             'srcaddr': 'any', 'dstaddr': f"host 10.0.{x % 256}.1", 'dstport': 'eq https'}
+            for x in range(size)]
+
+    def concatenated():
+        st = ','.join(columns) + "\n"
+        for row in rows:
+            st += ",".join([row.get(att, '') for att in columns]) + "\n"
+        text = ""
+        outfile = io.StringIO()
+        for s in st:
+            text += s
+            outfile.write(s)
+        return text.count(asa.NOT_PARSED)
+
+    def streamed():
+        writer = PolicyWriter(io.StringIO(), columns)
+        writer.writeHeader()
+        writer.writePolicies(rows)
+        return writer.failed
+
+    _, told = timeit(concatenated)
+    _, tnew = timeit(streamed)
+
+    st = f"CSV export, {size} rows:\n"
+    st += f"  concatenation:  {told:.3f}s ({size / told:.0f} rows/s)\n"
+    st += f"  PolicyWriter:   {tnew:.3f}s ({size / tnew:.0f} rows/s)\n"
+    st += f"  speedup: {told / tnew:.1f}x\n"
+    return st
+
+
+def benchColumnar(size, outdir="bench-columnar"):
+    """
+    Time writing and reloading size policies in the columnar format,
+    against YAML for a tenth of the policies.
+    """
+
+    import yaml
+    from columnar_export import columnarWriter, loadColumnar
+
+    records = list(config_parser.ios_policy_records(iosConfig(size).splitlines()))
+    columns = config_parser.field_names(records)
+    path = os.path.join(outdir, "policies")
+
+    def write():
+        with columnarWriter(path, columns) as writer:
+            writer.writePolicies(records)
+
+    def reload():
+        policies = loadColumnar(path)
+        return sum(1 for _ in policies.records())
+
+    _, twrite = timeit(write)
+    count, tread = timeit(reload)
+    assert count == len(records)
+    sample = {'acl': records[:size // 10]}
+    text, tyaml = timeit(yaml.dump, sample)
+    _, tload = timeit(yaml.safe_load, text)
+
+    st = f"Columnar export, {len(records)} policies:\n"
+    st += f"  write:  {twrite:.3f}s ({len(records) / twrite:.0f} policies/s)\n"
+    st += f"  reload: {tread:.3f}s ({len(records) / tread:.0f} policies/s)\n"
+    st += f"YAML, {len(sample['acl'])} policies:\n"
+    st += f"  dump: {tyaml:.3f}s, load: {tload:.3f}s\n"
+    return st
+
+
+def allocated(func):
+    """
+    Returns the result of func and the memory it allocated and kept.
+    """
+
+    tracemalloc.start()
+    result = func()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def benchTable(size):
+    """
+    Compare the memory held by parsed FortiGate policies as ParseResults
+    and as rows of a PolicyTable.
+    """
+
+    text = fgConfig(size, vdoms=2)
+    sections = [s.content for s in fg.policySectionParser(text)]
+
+    results, rbytes = allocated(lambda: [fg.policyParser(s) for s in sections])
+    table, tbytes = allocated(lambda: fg.policyTable(fg.policyParser(s) for s in sections))
+    assert [p.asDict() for sec in results for p in sec] == \
+        [r.asDict() for r in table.records()]
+
+    st = f"Policy storage, {len(table)} FortiGate policies:\n"
+    st += f"  ParseResults: {rbytes / 1e6:.1f} MB ({rbytes / len(table):.0f} bytes/policy)\n"
+    st += f"  PolicyTable:  {tbytes / 1e6:.1f} MB ({tbytes / len(table):.0f} bytes/policy)\n"
+    st += f"  reduction: {rbytes / tbytes:.1f}x\n"
+    return st
+
+
+def benchObjects(size):
+    """
+    Time the object database and the resolution of every policy for size
+    and 2 * size nested groups. Near-linear resolution about doubles the time.
+    """
+
+    from fg_object_db import objectDatabase, resolvePolicy
+
+    st = "FortiGate object resolution:\n"
+    for groups in (size, 2 * size):
+        text = fgObjectConfig(groups)
+        sections = fg.policySectionParser(text)
+        policies = [p.asDict() for p in fg.policyParser(sections[0].content)]
+        db, tbuild = timeit(objectDatabase, text.splitlines())
+        _, tresolve = timeit(lambda: [resolvePolicy(db, p, 0) for p in policies])
+        st += f"  {groups} groups: database {tbuild:.3f}s, {len(policies)} policies " \
+            f"resolved in {tresolve:.3f}s, {len(db.cycles)} cycles\n"
+    return st
+
+
+def benchLookup(size, flows=1000000):
+    """
+    Time first-match lookups of flows against an ACL of size rules.
+    """
+
+    import numpy as np
+    from flow_lookup import aclMatcher
+    from normalizer import iosRules
+
+    rules = iosRules(config_parser.ios_policy_records(iosConfig(size).splitlines()))
+    matcher = aclMatcher(rules, "101")
+    rnd = np.random.default_rng(0)
+    proto = rnd.choice(np.array([1, 6, 17], dtype=np.int16), flows)
+    src = rnd.integers(0, 2**32, flows, dtype=np.uint32)
+    dst = rnd.integers(0, 2**32, flows, dtype=np.uint32)
+    sport = rnd.integers(0, 65536, flows, dtype=np.int32)
+    dport = rnd.integers(0, 1024, flows, dtype=np.int32)
+
+    result, t = timeit(matcher.lookup, proto, src, sport, dst, dport)
+    st = f"Flow lookup, {flows} flows against {len(matcher.rules)} rules:\n"
+    st += f"  {t:.3f}s ({flows / t:.0f} flows/s), {(result >= 0).sum()} matched\n"
+    return st
+
+
+# The parsers and the command line of a run on a small configuration of each vendor
+STARTUP_PARSERS = {
+    'ios': ('ios_policy_parser', iosConfig, ['--no-yaml']),
+    'asa': ('asa_policy_parser_lite', asaConfig, []),
+    'fg': ('fg_policy_parser_lite', fgConfig, []),
+}
+
+# Modules that only some options need, which importing a parser must not load
+DEFERRED_MODULES = ['pyparsing', 'yaml', 'numpy', 'pyarrow', 'sqlite3',
+                    'concurrent.futures.process']
+
+
+def importTime(module, repeat=5):
+    """
+    Returns the shortest time, in seconds, of importing module in a new
+    interpreter, and the deferred modules that the import loaded.
+    """
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    probe = f"import sys, {module}; print(' '.join(m for m in {DEFERRED_MODULES!r} " \
+        "if m in sys.modules))"
+    best = None
+    for _ in range(repeat):
+        run = subprocess.run([sys.executable, "-X", "importtime", "-c", probe],
+                             capture_output=True, text=True, check=True, cwd=here)
+        # The last line of the import report is the module itself, with its dependencies
+        total = int(run.stderr.strip().splitlines()[-1].split('|')[1]) / 1e6
+        best = total if best is None else min(best, total)
+    return best, run.stdout.split()
+
+
+def benchStartup(budget, repeat=5, size=20):
+    """
+    Measure the import time of each parser and the wall time of a run on a
+    small configuration, as in a pre-merge hook that checks one file.
+    Returns the report and False if an import exceeds budget seconds or
+    loads a deferred module.
+    """
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    ok = True
+    st = f"Startup, {size} policies, budget {budget * 1000:.0f} ms per import:\n"
+    with tempfile.TemporaryDirectory() as tmp:
+        for vendor, (module, generate, options) in STARTUP_PARSERS.items():
+            imported, loaded = importTime(module, repeat)
+            config = os.path.join(tmp, vendor + ".conf")
+            with open(config, 'w') as cfgfile:
+                cfgfile.write(generate(size))
+            command = [sys.executable, os.path.join(here, module + ".py"), config] + options
+            run = min(timeit(subprocess.run, command, cwd=tmp, capture_output=True,
+                             check=True)[1] for _ in range(repeat))
+            failed = imported > budget or loaded
+            ok = ok and not failed
+            st += f"  {vendor:3} import {imported * 1000:6.1f} ms, run {run * 1000:6.1f} ms"
+            if loaded:
+                st += f", loaded {', '.join(loaded)}"
+            st += "  FAILED\n" if failed else "\n"
+    return st, ok
+
+
+def peakRSS():
+    """
+    Returns the peak resident set size of this process in kilobytes.
+    """
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def stage(stages, name, items, func, *args):
+    """
+    Time one stage of the pipeline and record it in stages.
+    items is the number of policies handled by the stage.
+    """
+
+    result, t = timeit(func, *args)
+    stages[name] = {'seconds': round(t, 6), 'items': items,
+                    'per_second': round(items / t) if t else None,
+                    'peak_rss_kb': peakRSS()}
+    return result
+
+
+def suiteFG(size, vdoms, stages):
+    """
+    The stages of the FortiGate parser.
+    """
+
+    text = fgConfig(size, vdoms)
+    sections = stage(stages, 'policySectionParser', size, fg.policySectionParser, text)
+    stage(stages, 'policyFinder', size,
+          lambda: [fg.policyFinder(s.content) for s in sections])
+    results = stage(stages, 'policyParser', size,
+                    lambda: [fg.policyParser(s.content) for s in sections])
+    table = stage(stages, 'policyTable', size, fg.policyTable, results)
+    with open(os.devnull, 'w') as outfile:
+        stage(stages, 'csv', size, fg.policyToCSV, sorted(table.fieldNames()),
+              table.bySection(len(sections)), outfile)
+    return text
+
+
+def suiteASA(size, vdoms, stages):
+    """
+    The stages of the ASA parser.
+    """
+
+    text = asaConfig(size)
+    lines = stage(stages, 'policyFinder', size,
+                  lambda: [p[0] for p in asa.policyFinder(text)])
+    results = stage(stages, 'policyParser', size,
+                    lambda: list(asa.defaultParser().parse_lines(lines)))
+    table = stage(stages, 'policyTable', size, asa.policyTable, results)
+    with open(os.devnull, 'w') as outfile:
+        stage(stages, 'csv', size, asa.policyToCSV, table.fieldNames(), table, outfile)
+    return text
+
+
+def suiteIOS(size, vdoms, stages):
+    """
+    The stages of the IOS parser: the grammar, the fast path and both writers.
+    """
+
+    import yaml
+
+    text = iosConfig(size)
+    lines = text.splitlines()
+    stage(stages, 'ios_policy_parser', size, config_parser.ios_policy_parser, text)
+    records = stage(stages, 'ios_policy_records', size,
+                    lambda: list(config_parser.ios_policy_records(lines)))
+    table = PolicyTable()
+    table.extend(records)
+    columns = table.fieldNames()
+    with open(os.devnull, 'w') as outfile:
+        writer = csv.DictWriter(outfile, lineterminator='\n', fieldnames=columns)
+        stage(stages, 'csv', size, writer.writerows, records)
+    with open(os.devnull, 'w') as outfile:
+        stage(stages, 'yaml', size, yaml.dump, {'acl': records}, outfile)
+    return text
+
+
+SUITE = {'fg': suiteFG, 'asa': suiteASA, 'ios': suiteIOS}
+
+
+def suiteCase(vendor, size, vdoms):
+    """
+    Run the stages of one vendor on a generated configuration of size policies.
+    Each case runs in its own process, so peak RSS is not inherited from other cases.
+    """
+
+    stages = {}
+    text = SUITE[vendor](size, vdoms, stages)
+    total = sum(s['seconds'] for s in stages.values())
+    return {'vendor': vendor, 'size': size, 'vdoms': vdoms if vendor == 'fg' else 1,
+            'bytes': len(text), 'seconds': round(total, 6),
+            'per_second': round(size / total) if total else None,
+            'mb_per_second': round(len(text) / total / 1e6, 3) if total else None,
+            'peak_rss_kb': peakRSS(), 'stages': stages}
+
+
+def gitCommit():
+    """
+    Returns the commit of the working tree, or None outside a git repository.
+    """
+
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def runSuite(sizes, vendors, vdoms=4):
+    """
+    Run the benchmark suite and return the results as a JSON-serializable dictionary.
+    """
+
+    results = []
+    for vendor in vendors:
+        for size in sizes:
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                case = executor.submit(suiteCase, vendor, size, vdoms).result()
+            print(f"{vendor} {size}: {case['seconds']:.3f}s ({case['per_second']} policies/s), "
+                  f"peak RSS {case['peak_rss_kb'] / 1024:.1f} MB", file=sys.stderr)
+            results.append(case)
+    return {'commit': gitCommit(), 'python': platform.python_version(),
+            'platform': platform.platform(), 'created': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'results': results}
+
+
+def compareSuites(old, new):
+    """
+    Generate a report of the change of each stage between two suite results.
+    """
+
+    before = {(c['vendor'], c['size'], name): s
+              for c in old['results'] for name, s in c['stages'].items()}
+    st = f"Comparing {old.get('commit')} (before) with {new.get('commit')} (after):\n"
+    for case in new['results']:
+        for name, s in case['stages'].items():
+            b = before.get((case['vendor'], case['size'], name))
+            if b is None or not s['seconds']:
+                continue
+            st += f"  {case['vendor']:3} {case['size']:>8} {name:20} " \
+                f"{b['seconds']:9.3f}s -> {s['seconds']:9.3f}s " \
+                f"({b['seconds'] / s['seconds']:.2f}x), " \
+                f"RSS {b['peak_rss_kb'] / 1024:.0f} -> {s['peak_rss_kb'] / 1024:.0f} MB\n"
+    return st
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Parser benchmarks.")
+    argparser.add_argument("benchmark",
+                           choices=["asa-grammar", "scaling", "ios-fastpath", "csv",
+                                    "table", "lookup", "objects", "columnar", "startup", "suite"])
+    argparser.add_argument("-n", "--size", type=int, default=2000,
+                           help="number of policies to generate")
+    argparser.add_argument("--jobs", type=int, default=os.cpu_count(),
+                           help="largest number of processes for the scaling benchmark")
+    argparser.add_argument("--budget", type=float, default=75, metavar="MS",
+                           help="longest import time of a parser in the startup benchmark")
+    argparser.add_argument("--sizes", default="1000,10000,100000",
+                           help="comma-separated policy counts of the suite")
+    argparser.add_argument("--vendors", default="fg,asa,ios",
+                           help="comma-separated vendors of the suite")
+    argparser.add_argument("--vdoms", type=int, default=4,
+                           help="number of VDOMs of the generated FortiGate configurations")
+    argparser.add_argument("--output", default="benchmark.json",
+                           help="JSON file of the suite results")
+    argparser.add_argument("--compare", metavar="FILE",
+                           help="suite results of an earlier commit to compare with")
+    args = argparser.parse_args()
+
+    if args.benchmark == "asa-grammar":
+        print(benchASAGrammar(args.size))
+    elif args.benchmark == "scaling":
+        print(benchScaling(args.size, args.jobs))
+    elif args.benchmark == "ios-fastpath":
+        print(benchIOSFastPath(args.size))
+    elif args.benchmark == "csv":
+        print(benchCSV(args.size))
+    elif args.benchmark == "table":
+        print(benchTable(args.size))
+    elif args.benchmark == "lookup":
+        print(benchLookup(args.size))
+    elif args.benchmark == "objects":
+        print(benchObjects(args.size))
+    elif args.benchmark == "columnar":
+        print(benchColumnar(args.size))
+    elif args.benchmark == "startup":
+        report, ok = benchStartup(args.budget / 1000)
+        print(report)
+        sys.exit(0 if ok else 1)
+    elif args.benchmark == "suite":
+        suite = runSuite([int(n) for n in args.sizes.split(',')],
+                         args.vendors.split(','), args.vdoms)
+        with open(args.output, 'w') as outfile:
+            json.dump(suite, outfile, indent=2)
+        if args.compare:
+            with open(args.compare, 'r') as oldfile:
+                print(compareSuites(json.load(oldfile), suite))
@@ -0,0 +1,405 @@
+"""
+Copyright 2016-2021 Maen Artimy
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import sys
+import json
+import struct
+from array import array
+
+import numpy as np
+
+from policy_table import PolicyTable
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Columnar binary export of parsed policies.
+# Policies are written in record batches as they are parsed, either as an
+# Arrow IPC or Parquet file (when pyarrow is installed) or as a directory of
+# NumPy .npy files laid out like a PolicyTable: one array of string pool
+# indexes per column (0 for missing fields) and the string pool as offsets
+# into one UTF-8 buffer. Both can be memory-mapped back without copying.
+# A single .npz file cannot be memory-mapped, so the NumPy layout is a directory.
+# Without pyarrow, Arrow and Parquet paths fall back to the NumPy layout,
+# in a directory named after the path (see fallbackPath).
+
+FORMATS = ['arrow', 'parquet', 'npy']
+BATCH_SIZE = 65536
+META_FILE = "meta.json"
+NPY_HEADER_SIZE = 128
+
+
+def columnarFormat(path):
+    """
+    Returns the format of an output path from its extension:
+    '.arrow' or '.feather' for Arrow IPC, '.parquet' for Parquet, else 'npy'.
+    """
+
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ('.arrow', '.feather'):
+        return 'arrow'
+    if ext == '.parquet':
+        return 'parquet'
+    return 'npy'
+
+
+def fallbackPath(path):
+    """
+    Returns the directory written in place of an Arrow or Parquet file
+    when pyarrow is not installed: the path with the extension '.npy'.
+    """
+
+    return os.path.splitext(path)[0] + '.npy'
+
+
+def text(value):
+    """
+    Convert a field value to a string, as PolicyTable.intern does.
+    """
+
+    if isinstance(value, str):
+        return value
+    return ' '.join(value) if isinstance(value, (list, tuple)) else str(value)
+
+
+def npyHeader(dtype, length):
+    """
+    Returns a fixed-size .npy (version 1.0) header for a one-dimensional array,
+    so the header can be rewritten once the length is known.
+    """
+
+    header = f"{{'descr': '{np.dtype(dtype).str}', 'fortran_order': False, " \
+        f"'shape': ({length},), }}"
+    header = header.ljust(NPY_HEADER_SIZE - 10 - 1) + "\n"
+    return b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1')
+
+
+class NpyColumn:
+    """
+    A .npy file written in chunks. The length in the header is set by close().
+    """
+
+    def __init__(self, path, typecode, dtype):
+        self.file = open(path, 'wb')
+        self.file.write(npyHeader(dtype, 0))
+        self.dtype = dtype
+        self.buffer = array(typecode)
+        self.length = 0
+
+    def append(self, value):
+        self.buffer.append(value)
+
+    def flush(self):
+        self.file.write(self.buffer.tobytes())
+        self.length += len(self.buffer)
+        del self.buffer[:]
+
+    def close(self):
+        self.flush()
+        self.file.seek(0)
+        self.file.write(npyHeader(self.dtype, self.length))
+        self.file.close()
+
+
+class NumpyPolicyWriter:
+    """
+    Writes policies to a directory of .npy files, one batch at a time.
+    """
+
+    def __init__(self, path, columns, batchSize=BATCH_SIZE):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.columns = list(columns)
+        self.batchSize = batchSize
+        self.strings = [None]
+        self.index = {}
+        self.data = [NpyColumn(os.path.join(path, f"column{i}.npy"), 'I', np.uint32)
+                     for i in range(len(self.columns))]
+        self.sections = NpyColumn(os.path.join(path, "sections.npy"), 'I', np.uint32)
+        self.parsed = NpyColumn(os.path.join(path, "parsed.npy"), 'B', np.uint8)
+        self.pending = 0
+        self.written = 0
+        self.failed = 0
+
+    def intern(self, value):
+        i = self.index.get(value)
+        if i is None:
+            i = self.index[value] = len(self.strings)
+            self.strings.append(value)
+        return i
+
+    def writePolicy(self, policy, section=0):
+        """
+        Write one policy, a mapping with a get method.
+        """
+
+        for name, column in zip(self.columns, self.data):
+            value = policy.get(name, None)
+            column.append(0 if value is None else self.intern(text(value)))
+        self.sections.append(section)
+        self.parsed.append(1)
+        self.written += 1
+        self.next()
+
+    def writeFailure(self, section=0):
+        """
+        Write an empty row for a policy that could not be parsed.
+        """
+
+        for column in self.data:
+            column.append(0)
+        self.sections.append(section)
+        self.parsed.append(0)
+        self.failed += 1
+        self.next()
+
+    def writePolicies(self, policies, section=0):
+        """
+        Write each policy of an iterable. None stands for a policy that was not parsed.
+        """
+
+        for policy in policies:
+            if policy is None:
+                self.writeFailure(section)
+            else:
+                self.writePolicy(policy, section)
+
+    def next(self):
+        self.pending += 1
+        if self.pending >= self.batchSize:
+            for column in self.data + [self.sections, self.parsed]:
+                column.flush()
+            self.pending = 0
+
+    def close(self):
+        """
+        Write the remaining rows, the string pool and the column names.
+        """
+
+        for column in self.data + [self.sections, self.parsed]:
+            column.close()
+        encoded = [s.encode() for s in self.strings[1:]]
+        offsets = np.zeros(len(self.strings) + 1, dtype=np.uint64)
+        offsets[2:] = np.cumsum([len(s) for s in encoded], dtype=np.uint64)
+        np.save(os.path.join(self.path, "offsets.npy"), offsets)
+        np.save(os.path.join(self.path, "strings.npy"),
+                np.frombuffer(b''.join(encoded), dtype=np.uint8))
+        with open(os.path.join(self.path, META_FILE), 'w') as meta:
+            json.dump({'format': 'npy', 'version': 1, 'rows': self.written + self.failed,
+                       'columns': self.columns}, meta)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ArrowPolicyWriter:
+    """
+    Writes policies to an Arrow IPC or Parquet file, one record batch at a time.
+    Every column is a string column; missing fields are nulls. The section and
+    the parse status of each row are kept in the _section and _parsed columns.
+    """
+
+    def __init__(self, path, columns, format='arrow', batchSize=BATCH_SIZE):
+        if pa is None:
+            raise ImportError("pyarrow is required for the Arrow and Parquet formats")
+        self.columns = list(columns)
+        self.batchSize = batchSize
+        self.schema = pa.schema([(c, pa.string()) for c in self.columns] +
+                                [('_section', pa.uint32()), ('_parsed', pa.bool_())])
+        if format == 'parquet':
+            self.writer = pq.ParquetWriter(path, self.schema)
+        else:
+            self.writer = pa.ipc.new_file(path, self.schema)
+        self.buffers = [[] for _ in self.columns]
+        self.sections = []
+        self.parsed = []
+        self.written = 0
+        self.failed = 0
+
+    def writePolicy(self, policy, section=0):
+        for name, buffer in zip(self.columns, self.buffers):
+            value = policy.get(name, None)
+            buffer.append(None if value is None else text(value))
+        self.sections.append(section)
+        self.parsed.append(True)
+        self.written += 1
+        self.next()
+
+    def writeFailure(self, section=0):
+        for buffer in self.buffers:
+            buffer.append(None)
+        self.sections.append(section)
+        self.parsed.append(False)
+        self.failed += 1
+        self.next()
+
+    def writePolicies(self, policies, section=0):
+        for policy in policies:
+            if policy is None:
+                self.writeFailure(section)
+            else:
+                self.writePolicy(policy, section)
+
+    def next(self):
+        if len(self.parsed) >= self.batchSize:
+            self.flush()
+
+    def flush(self):
+        if not self.parsed:
+            return
+        arrays = [pa.array(b, pa.string()) for b in self.buffers]
+        arrays += [pa.array(self.sections, pa.uint32()), pa.array(self.parsed, pa.bool_())]
+        self.writer.write_batch(pa.record_batch(arrays, schema=self.schema))
+        self.buffers = [[] for _ in self.columns]
+        self.sections = []
+        self.parsed = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def columnarWriter(path, columns, format=None, batchSize=BATCH_SIZE):
+    """
+    Returns a writer of policies for path. The format is taken from the
+    extension of path when it is not given.
+    """
+
+    format = format or columnarFormat(path)
+    if format != 'npy' and pa is None:
+        path = fallbackPath(path)
+        print(f"pyarrow is not installed, the policies are written as NumPy arrays to {path}",
+              file=sys.stderr)
+        format = 'npy'
+    if format == 'npy':
+        return NumpyPolicyWriter(path, columns, batchSize)
+    return ArrowPolicyWriter(path, columns, format, batchSize)
+
+
+class ColumnarPolicies:
+    """
+    Policies loaded from a directory written by NumpyPolicyWriter.
+    The arrays are memory-mapped, and strings are only decoded when they are read.
+    """
+
+    def __init__(self, path):
+        with open(os.path.join(path, META_FILE), 'r') as meta:
+            self.meta = json.load(meta)
+        self.columns = self.meta['columns']
+
+        def load(name):
+            return np.load(os.path.join(path, name), mmap_mode='r')
+
+        self.data = {c: load(f"column{i}.npy") for i, c in enumerate(self.columns)}
+        self.sections = load("sections.npy")
+        self.parsed = load("parsed.npy")
+        self.offsets = load("offsets.npy")
+        self.buffer = load("strings.npy")
+        self.pool = None
+
+    def __len__(self):
+        return len(self.parsed)
+
+    def string(self, i):
+        """
+        Returns string i of the pool, or None for 0 (a missing field).
+        """
+
+        if not i:
+            return None
+        return bytes(self.buffer[self.offsets[i]:self.offsets[i + 1]]).decode()
+
+    def strings(self):
+        """
+        Returns the whole string pool, decoded once.
+        """
+
+        if self.pool is None:
+            data = bytes(self.buffer)
+            offsets = self.offsets.tolist()
+            self.pool = [None] + [data[offsets[i]:offsets[i + 1]].decode()
+                                  for i in range(1, len(offsets) - 1)]
+        return self.pool
+
+    def column(self, name):
+        """
+        Returns the values of a column, with None for missing fields.
+        """
+
+        pool = self.strings()
+        return [pool[i] for i in self.data[name].tolist()]
+
+    def records(self):
+        """
+        Yields each row as a dictionary, or None for policies that were not parsed.
+        """
+
+        pool = self.strings()
+        columns = [(c, self.data[c].tolist()) for c in self.columns]
+        for row, parsed in enumerate(self.parsed.tolist()):
+            if not parsed:
+                yield None
+                continue
+            yield {c: pool[values[row]] for c, values in columns if values[row]}
+
+    def table(self):
+        """
+        Returns the policies as a PolicyTable.
+        """
+
+        table = PolicyTable()
+        table.strings = list(self.strings())
+        table.index = {s: i for i, s in enumerate(table.strings) if i}
+        for c in self.columns:
+            table.columns[c] = array('I', self.data[c].tobytes())
+        table.sections = array('I', self.sections.tobytes())
+        table.parsed = bytearray(self.parsed.tobytes())
+        return table
+
+
+def loadColumnar(path):
+    """
+    Memory-map policies written by a columnar writer. Returns a pyarrow Table
+    for Arrow and Parquet files and a ColumnarPolicies for NumPy directories.
+    Without pyarrow, an Arrow or Parquet path is read from the directory that
+    columnarWriter wrote in its place.
+    """
+
+    if os.path.isdir(path):
+        return ColumnarPolicies(path)
+    if pa is None:
+        if os.path.isdir(fallbackPath(path)):
+            print(f"pyarrow is not installed, the policies are read from {fallbackPath(path)}",
+                  file=sys.stderr)
+            return ColumnarPolicies(fallbackPath(path))
+        raise ImportError("pyarrow is required for the Arrow and Parquet formats")
+    if columnarFormat(path) == 'parquet':
+        return pq.read_table(path, memory_map=True)
+    return pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
@@ -14,7 +14,7 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
-import pyparsing as pp
+import re
 
 # Field names
 F_NAME = 'name'
@@ -26,43 +26,41 @@ F_DSTIP = 'dstip'
 F_DSTPORT = 'dstport'
 F_NOTES = 'notes'
 
-# General Parsing Definitions
-SEPERATOR = pp.Word("-_.", max=1)
-LBRACE, RBRACE, SEMI, QUOTE, COMMA = map(pp.Suppress, '{};",')
-
-DECBYTE = pp.Word(pp.nums, max=3)
-IP4ADDRESS = pp.Combine(DECBYTE + ('.' + DECBYTE)*3)
-WILEDCARD = pp.Combine(DECBYTE + ('.' + DECBYTE)*3)
-
-# Cisco ACL Parsing Definitions
-POLICY_START_MARKER = pp.LineStart() + pp.Keyword("access-list").suppress()
-POLICY_END_MARKER = pp.LineEnd().suppress()
-STD_NUM = pp.Word(pp.nums, max=2, asKeyword=True)
-EXD_NUM = pp.Word(pp.nums, min=3, asKeyword=True)
-ACL_NUM = STD_NUM | EXD_NUM
-REMARK = pp.Keyword('remark').suppress()
-ANY = pp.Keyword("any")
-HOST = pp.Keyword("host").suppress()
-ONE_PORT_MATCH = pp.Keyword('eq').suppress() | pp.oneOf('gt lt neq')
-PORT_RNAGE = pp.Keyword('range').suppress()
-PORTKEY = pp.Word(pp.alphas, asKeyword=True)
-PORTNUM = pp.Word(pp.nums, asKeyword=True)
-PORTID = PORTKEY | PORTNUM
-ACTION = pp.oneOf("deny permit")
-PROTOCOL = pp.Word(pp.alphanums)
-
-ADDRESS = ANY | HOST + IP4ADDRESS | IP4ADDRESS + WILEDCARD
-PORT = ONE_PORT_MATCH + PORTID | PORT_RNAGE + PORTNUM + PORTNUM
-
-PORT_OR_ANY = pp.Optional(PORT, 'any')
-REMAINDER = pp.SkipTo(pp.LineEnd())
 
-
-def ios_policy_parser(text):
+def ios_policy_grammar():
     """
-    Parse individual firewall policies.
+    Build the grammar of individual firewall policies.
+    pyparsing is imported here, so the lines of the fast path never load it.
     """
 
+    import pyparsing as pp
+
+    # General Parsing Definitions
+    DECBYTE = pp.Word(pp.nums, max=3)
+    IP4ADDRESS = pp.Combine(DECBYTE + ('.' + DECBYTE)*3)
+    WILEDCARD = pp.Combine(DECBYTE + ('.' + DECBYTE)*3)
+
+    # Cisco ACL Parsing Definitions
+    STD_NUM = pp.Word(pp.nums, max=2, asKeyword=True)
+    EXD_NUM = pp.Word(pp.nums, min=3, asKeyword=True)
+    ACL_NUM = STD_NUM | EXD_NUM
+    REMARK = pp.Keyword('remark').suppress()
+    ANY = pp.Keyword("any")
+    HOST = pp.Keyword("host").suppress()
+    ONE_PORT_MATCH = pp.Keyword('eq').suppress() | pp.oneOf('gt lt neq')
+    PORT_RNAGE = pp.Keyword('range').suppress()
+    PORTKEY = pp.Word(pp.alphas, asKeyword=True)
+    PORTNUM = pp.Word(pp.nums, asKeyword=True)
+    PORTID = PORTKEY | PORTNUM
+    ACTION = pp.oneOf("deny permit")
+    PROTOCOL = pp.Word(pp.alphanums)
+
+    ADDRESS = ANY | HOST + IP4ADDRESS | IP4ADDRESS + WILEDCARD
+    PORT = ONE_PORT_MATCH + PORTID | PORT_RNAGE + PORTNUM + PORTNUM
+
+    PORT_OR_ANY = pp.Optional(PORT, 'any')
+    REMAINDER = pp.SkipTo(pp.LineEnd())
+
     remarkPolicy = ACL_NUM(F_NAME) + REMARK + REMAINDER(F_NOTES)
 
     standardPolicy = STD_NUM(F_NAME) + ACTION(F_ACTION) + PROTOCOL(F_PROTOCOL)\
@@ -78,7 +76,164 @@ def ios_policy_parser(text):
         + REMAINDER(F_NOTES)
 
     policyDef = remarkPolicy ^ extendedPolicy ^ standardPolicy
-    return policyDef.searchString(text)
+    return policyDef
+
+
+_policy_def = None
+
+
+def _grammar():
+    global _policy_def
+    if _policy_def is None:
+        _policy_def = ios_policy_grammar()
+    return _policy_def
+
+
+def ios_policy_parser(text):
+    """
+    Parse individual firewall policies.
+    """
+
+    return _grammar().searchString(text)
+
+
+# Fast path definitions. The fast path takes only lines of printable ASCII
+# characters and spaces, on which str and re agree with the grammar about
+# digits, letters and whitespace.
+FAST_LINE = re.compile(r'[ -~]*$', re.ASCII)
+TOKEN = re.compile(r'\S+', re.ASCII)
+IP4_TOKEN = re.compile(r'\d{1,3}(?:\.\d{1,3}){3}$', re.ASCII)
+PORT_OPS = ('eq', 'gt', 'lt', 'neq')
+
+
+def _fast_address(tokens, i):
+    """
+    Match an address at tokens[i]. Returns the address parts and the next index.
+    """
+
+    if i < len(tokens):
+        word = tokens[i].group()
+        if word == 'any':
+            return ['any'], i + 1
+        if word == 'host' and i + 1 < len(tokens) \
+                and IP4_TOKEN.match(tokens[i + 1].group()):
+            return [tokens[i + 1].group()], i + 2
+        if IP4_TOKEN.match(word) and i + 1 < len(tokens) \
+                and IP4_TOKEN.match(tokens[i + 1].group()):
+            return [word, tokens[i + 1].group()], i + 2
+    return None, i
+
+
+def _fast_port(tokens, i):
+    """
+    Match an optional port at tokens[i]. Returns the port parts and the next index.
+    Returns None if the port cannot be classified.
+    """
+
+    if i >= len(tokens):
+        return ['any'], i
+    word = tokens[i].group()
+    if word in PORT_OPS:
+        if i + 1 < len(tokens):
+            port = tokens[i + 1].group()
+            if port.isalpha() or port.isdigit():
+                return ([port] if word == 'eq' else [word, port]), i + 2
+        return None, i
+    if word == 'range':
+        if i + 2 < len(tokens) and tokens[i + 1].group().isdigit() \
+                and tokens[i + 2].group().isdigit():
+            return [tokens[i + 1].group(), tokens[i + 2].group()], i + 3
+        return None, i
+    return ['any'], i
+
+
+def ios_fast_parser(line):
+    """
+    Parse a single 'access-list' line without pyparsing.
+    Returns the same fields as ios_policy_parser, or None if the line
+    cannot be classified and must be left to the grammar.
+    """
+
+    line = line.rstrip('\n')
+    if not FAST_LINE.match(line):
+        return None
+    words = line.split(None, 2)
+    if len(words) < 3 or words[0] != 'access-list' or not words[1].isdigit():
+        return None
+    tokens = list(TOKEN.finditer(line))
+    name, keyword = tokens[1].group(), tokens[2].group()
+    standard = len(name) <= 2
+
+    if keyword == 'remark':
+        if len(tokens) == 3:
+            return None
+        return {F_NAME: name, F_NOTES: line[tokens[3].start():]}
+    if keyword not in ('permit', 'deny') or len(tokens) < 5 \
+            or not tokens[3].group().isalnum():
+        return None
+
+    policy = {F_NAME: name, F_ACTION: keyword, F_PROTOCOL: tokens[3].group()}
+    addr_join, port_join = (' ', ' ') if standard else ('/', '-')
+    fields = [(F_SRCIP, F_SRCPORT)] if standard \
+        else [(F_SRCIP, F_SRCPORT), (F_DSTIP, F_DSTPORT)]
+    i = 4
+    for addr_field, port_field in fields:
+        address, i = _fast_address(tokens, i)
+        if address is None:
+            return None
+        port, i = _fast_port(tokens, i)
+        if port is None:
+            return None
+        policy[addr_field] = addr_join.join(address)
+        policy[port_field] = port_join.join(port)
+    policy[F_NOTES] = line[tokens[i].start():] if i < len(tokens) else ''
+    return policy
+
+
+def ios_policy_records(lines):
+    """
+    Parse firewall policies one line at a time and yield a dictionary per policy.
+    Lines are parsed by ios_fast_parser and the grammar is used only for
+    the lines it cannot classify.
+    """
+
+    policy_def = None
+    for line in lines:
+        policy = ios_fast_parser(line)
+        if policy is not None:
+            yield policy
+            continue
+        if policy_def is None:
+            policy_def = _grammar()
+        for p in policy_def.searchString(line):
+            yield p.asDict()
+
+
+def ios_policy_stream(lines):
+    """
+    Parse firewall policies one line at a time, yielding each policy as it is found.
+    Only the current line is kept in memory, so lines may be an open file of any size.
+    """
+
+    return ios_policy_records(lines)
+
+
+def compare_engines(lines):
+    """
+    Parse each line with both ios_fast_parser and the grammar.
+    Returns the lines on which the two engines disagree.
+    """
+
+    policy_def = _grammar()
+    mismatches = []
+    for line in lines:
+        policy = ios_fast_parser(line)
+        if policy is None:
+            continue
+        expected = [p.asDict() for p in policy_def.searchString(line)]
+        if expected != [policy]:
+            mismatches.append(line)
+    return mismatches
 
 def field_names(policies):
     """
@@ -30,6 +30,7 @@ class RField(Enum):
     EQUAL = 1
     SUBSET = 2
     SUPERSET = 3
+    OVERLAP = 4  # intersecting, neither contains the other
 
     def __repr__(self):
         return self.name
@@ -0,0 +1,453 @@
+"""
+Copyright 2016-2021 Maen Artimy
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import re
+from collections import namedtuple
+
+from normalizer import ip2int, int2ip, FULL_MASK
+
+# A database of the FortiGate objects referenced by firewall policies:
+# 'config firewall address', 'addrgrp', 'service custom' and 'service group'.
+# Addresses are stored as integer intervals [low, high] and services as the
+# intervals of port numbers (tcp, udp, sctp), ICMP types (icmp, icmp6) or
+# protocol numbers (ip) of each protocol.
+# Objects are scoped by the firewall policy section (VDOM) that follows them,
+# so they are numbered like the sections of fg_policy_parser_lite.
+
+OBJECT_SECTIONS = {
+    ('firewall', 'address'): 'address',
+    ('firewall', 'addrgrp'): 'addrgrp',
+    ('firewall', 'service', 'custom'): 'service',
+    ('firewall', 'service', 'group'): 'servicegrp',
+}
+
+TOKEN = re.compile(r'"((?:[^"\\]|\\.)*)"|(\S+)')
+
+ALL_ADDRESSES = ((0, FULL_MASK),)
+ALL_PORTS = ((0, 65535),)
+ALL_TYPES = ((0, 255),)
+
+# Values of objects that may be used without being defined in the configuration
+BUILTIN_ADDRESSES = {'all': ALL_ADDRESSES, 'none': ()}
+BUILTIN_SERVICES = {
+    'ALL': {'ip': ALL_TYPES},
+    'ALL_TCP': {'tcp': ALL_PORTS},
+    'ALL_UDP': {'udp': ALL_PORTS},
+    'ALL_ICMP': {'icmp': ALL_TYPES},
+}
+
+# The addresses or services of an object once its groups are expanded.
+# values are the merged intervals (of addresses) or a dict of protocol
+# to intervals (of services); unresolved are the names with no known value.
+Resolved = namedtuple('Resolved', 'values unresolved')
+
+
+def tokens(text):
+    """
+    Split a line of configuration into words, removing the quotes.
+    """
+
+    if '"' not in text:
+        return text.split()
+    return [m.group(2) if m.group(1) is None else m.group(1).replace('\\"', '"')
+            for m in TOKEN.finditer(text)]
+
+
+def objectStream(lines):
+    """
+    Yields (scope, kind, name, settings) for each object of the address and
+    service sections. settings maps each 'set' keyword to its list of values.
+    scope is the number of firewall policy sections found before the object.
+    """
+
+    scope = 0
+    path = []
+    kind = None
+    name = None
+    settings = None
+    depth = 0
+    for line in lines:
+        words = tokens(line)
+        if not words:
+            continue
+        if kind is None:
+            if words[0] == 'config':
+                path.append(tuple(words[1:]))
+                kind = OBJECT_SECTIONS.get(path[-1])
+                if path[-1] == ('firewall', 'policy'):
+                    scope += 1
+                depth = 0
+            elif words[0] == 'end' and path:
+                path.pop()
+            continue
+        if words[0] == 'config':
+            depth += 1
+        elif words[0] == 'end':
+            if depth == 0:
+                path.pop()
+                kind = None
+                continue
+            depth -= 1
+        elif depth == 0 and words[0] == 'edit' and len(words) > 1:
+            name = words[1]
+            settings = {}
+        elif depth == 0 and words[0] == 'next' and name is not None:
+            yield scope, kind, name, settings
+            name = None
+        elif depth == 0 and words[0] == 'set' and name is not None and len(words) > 1:
+            settings[words[1]] = words[2:]
+
+
+def mergeIntervals(intervals):
+    """
+    Returns sorted, non-overlapping intervals covering the same values.
+    Adjacent intervals are joined.
+    """
+
+    merged = []
+    for low, high in sorted(intervals):
+        if merged and low <= merged[-1][1] + 1:
+            if high > merged[-1][1]:
+                merged[-1] = (merged[-1][0], high)
+        else:
+            merged.append((low, high))
+    return tuple(merged)
+
+
+def addressIntervals(settings):
+    """
+    Returns the intervals of an address object, or None if its value is not an
+    IPv4 subnet, range or wildcard (an FQDN or a country, for example).
+    """
+
+    kind = settings.get('type', ['ipmask'])[0]
+    if kind == 'ipmask':
+        subnet = settings.get('subnet', ['0.0.0.0', '0.0.0.0'])
+        if '/' in subnet[0]:
+            ip, bits = subnet[0].split('/', 1)
+            value = ip2int(ip)
+            mask = (FULL_MASK << (32 - int(bits))) & FULL_MASK if bits.isdigit() else None
+        else:
+            value = ip2int(subnet[0])
+            mask = ip2int(subnet[1]) if len(subnet) > 1 else FULL_MASK
+        if value is None or mask is None:
+            return None
+        low = value & mask
+        return ((low, low | (~mask & FULL_MASK)),)
+    if kind == 'iprange':
+        low = ip2int(settings.get('start-ip', ['0.0.0.0'])[0])
+        high = ip2int(settings.get('end-ip', ['0.0.0.0'])[0])
+        if low is None or high is None:
+            return None
+        return ((min(low, high), max(low, high)),)
+    if kind == 'wildcard':
+        # FortiGate wildcards are (address, mask) pairs with a possibly
+        # non-contiguous mask; each block of the free low bits is one interval
+        wildcard = settings.get('wildcard', [])
+        value = ip2int(wildcard[0]) if wildcard else None
+        mask = ip2int(wildcard[1]) if len(wildcard) > 1 else None
+        if value is None or mask is None:
+            return None
+        free = ~mask & FULL_MASK
+        block = free & ~(free + 1)
+        high = free & ~block
+        if bin(high).count('1') > 16:
+            return None
+        # Enumerate the values of the free bits above the contiguous low block
+        bits = [1 << b for b in range(32) if high >> b & 1]
+        starts = [value & mask]
+        for bit in bits:
+            starts += [s | bit for s in starts]
+        return mergeIntervals((s, s | block) for s in starts)
+    return None
+
+
+def portIntervals(values):
+    """
+    Returns the destination port intervals of a FortiGate port range list,
+    such as ['80', '443', '1000-2000', '53:1024-65535'] (destination:source).
+    """
+
+    intervals = []
+    for value in values:
+        dst = value.split(':', 1)[0]
+        low, _, high = dst.partition('-')
+        if low.isdigit() and (not high or high.isdigit()):
+            intervals.append((int(low), int(high or low)))
+    return intervals
+
+
+def serviceValues(settings):
+    """
+    Returns the protocols and intervals of a custom service, or None
+    if the service cannot be expressed as protocols and ports.
+    """
+
+    protocol = settings.get('protocol', ['TCP/UDP/SCTP'])[0].upper()
+    if protocol in ('TCP/UDP/SCTP', 'TCP/UDP'):
+        values = {}
+        for proto in ('tcp', 'udp', 'sctp'):
+            intervals = portIntervals(settings.get(proto + '-portrange', []))
+            if intervals:
+                values[proto] = mergeIntervals(intervals)
+        return values or None
+    if protocol in ('ICMP', 'ICMP6'):
+        icmptype = settings.get('icmptype', [])
+        types = ((int(icmptype[0]),) * 2,) if icmptype and icmptype[0].isdigit() else ALL_TYPES
+        return {protocol.lower(): types}
+    if protocol == 'IP':
+        number = settings.get('protocol-number', ['0'])[0]
+        if not number.isdigit():
+            return None
+        return {'ip': ALL_TYPES if number == '0' else ((int(number),) * 2,)}
+    return None
+
+
+def mergeServices(services):
+    """
+    Returns the union of a list of service values.
+    """
+
+    protocols = {}
+    for values in services:
+        for proto, intervals in values.items():
+            protocols.setdefault(proto, []).extend(intervals)
+    return {proto: mergeIntervals(intervals) for proto, intervals in protocols.items()}
+
+
+def rangePrefixes(low, high):
+    """
+    Returns the smallest list of CIDR prefixes covering the addresses low to high.
+    """
+
+    prefixes = []
+    while low <= high:
+        size = (low & -low).bit_length() - 1 if low else 32
+        while low + (1 << size) - 1 > high:
+            size -= 1
+        prefixes.append(f"{int2ip(low)}/{32 - size}")
+        low += 1 << size
+    return prefixes
+
+
+def formatAddresses(resolved):
+    """
+    Format resolved addresses as ';'-separated CIDR prefixes followed by the
+    names that could not be resolved.
+    """
+
+    items = [p for low, high in resolved.values for p in rangePrefixes(low, high)]
+    return ';'.join(items + sorted(resolved.unresolved))
+
+
+def formatServices(resolved):
+    """
+    Format resolved services as ';'-separated protocol/low-high items followed
+    by the names that could not be resolved.
+    """
+
+    items = []
+    for proto in sorted(resolved.values):
+        intervals = resolved.values[proto]
+        if proto == 'ip' and intervals == ALL_TYPES:
+            items.append('ip')
+            continue
+        for low, high in intervals:
+            items.append(f"{proto}/{low}" if low == high else f"{proto}/{low}-{high}")
+    return ';'.join(items + sorted(resolved.unresolved))
+
+
+class ObjectDB:
+    """
+    Indexed address and service objects of a FortiGate configuration.
+    Groups are expanded on first use and the result of every group is kept,
+    so each group is expanded once however many policies and groups refer to it.
+    Groups that contain themselves, directly or not, are expanded to the union
+    of all the members of the cycle and recorded in cycles.
+    """
+
+    def __init__(self):
+        self.objects = {'address': {}, 'addrgrp': {}, 'service': {}, 'servicegrp': {}}
+        self.resolved = {'address': {}, 'service': {}}
+        self.cycles = []
+
+    def add(self, scope, kind, name, settings):
+        """
+        Add an object found by objectStream.
+        """
+
+        if kind == 'address':
+            value = addressIntervals(settings)
+        elif kind == 'service':
+            value = serviceValues(settings)
+        else:
+            value = settings.get('member', [])
+        self.objects[kind][scope, name] = value
+
+    def address(self, scope, name):
+        """
+        Returns the Resolved addresses of an address or address group.
+        """
+
+        return self._resolve('address', 'addrgrp', scope, name)
+
+    def service(self, scope, name):
+        """
+        Returns the Resolved services of a custom service or service group.
+        """
+
+        return self._resolve('service', 'servicegrp', scope, name)
+
+    def addresses(self, scope, names):
+        """
+        Returns the Resolved union of a ';'-separated list of address names,
+        as produced by the policy parser.
+        """
+
+        return self._union('address', [self.address(scope, n) for n in names.split(';') if n])
+
+    def services(self, scope, names):
+        """
+        Returns the Resolved union of a ';'-separated list of service names.
+        """
+
+        return self._union('service', [self.service(scope, n) for n in names.split(';') if n])
+
+    @staticmethod
+    def _union(leaf, resolved):
+        if leaf == 'address':
+            values = mergeIntervals(i for r in resolved for i in r.values)
+        else:
+            values = mergeServices(r.values for r in resolved)
+        return Resolved(values, frozenset().union(*(r.unresolved for r in resolved)))
+
+    def _leaf(self, leaf, scope, name):
+        """
+        Returns the Resolved value of an object that is not a group.
+        """
+
+        value = self.objects[leaf].get((scope, name))
+        if value is None and (scope, name) not in self.objects[leaf]:
+            builtins = BUILTIN_ADDRESSES if leaf == 'address' else BUILTIN_SERVICES
+            value = builtins.get(name)
+        if value is None:
+            return Resolved(() if leaf == 'address' else {}, frozenset([name]))
+        return Resolved(value, frozenset())
+
+    def _resolve(self, leaf, group, scope, name):
+        """
+        Expand a name with an iterative depth-first search that finds the strongly
+        connected components (cycles) of the group graph, as in Tarjan's algorithm.
+        The members of a component are expanded together, once.
+        """
+
+        cache = self.resolved[leaf]
+        key = (scope, name)
+        if key in cache:
+            return cache[key]
+        groups = self.objects[group]
+        if key not in groups:
+            cache[key] = self._leaf(leaf, scope, name)
+            return cache[key]
+
+        index, low, stack, onStack = {}, {}, [], set()
+        work = [(key, iter(groups[key]))]
+        index[key] = low[key] = 0
+        stack.append(key)
+        onStack.add(key)
+        while work:
+            node, members = work[-1]
+            advanced = False
+            for member in members:
+                child = (scope, member)
+                if child in cache:
+                    continue
+                if child not in groups:
+                    cache[child] = self._leaf(leaf, scope, member)
+                    continue
+                if child not in index:
+                    index[child] = low[child] = len(index)
+                    stack.append(child)
+                    onStack.add(child)
+                    work.append((child, iter(groups[child])))
+                    advanced = True
+                    break
+                if child in onStack:
+                    low[node] = min(low[node], index[child])
+            if advanced:
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                low[parent] = min(low[parent], low[node])
+            if low[node] == index[node]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    onStack.discard(member)
+                    component.append(member)
+                    if member == node:
+                        break
+                self._expandComponent(leaf, groups, cache, component)
+        return cache[key]
+
+    def _expandComponent(self, leaf, groups, cache, component):
+        """
+        Expand the groups of a strongly connected component. The members outside
+        the component have already been expanded.
+        """
+
+        inside = set(component)
+        if len(component) > 1 or component[0][1] in groups[component[0]]:
+            self.cycles.append(sorted(name for _, name in component))
+        parts = []
+        for scope, name in component:
+            for member in groups[scope, name]:
+                if (scope, member) not in inside:
+                    parts.append(cache[scope, member])
+        result = self._union(leaf, parts)
+        for node in component:
+            cache[node] = result
+
+
+def objectDatabase(lines):
+    """
+    Build the ObjectDB of a configuration, given as an iterable of lines.
+    """
+
+    db = ObjectDB()
+    for scope, kind, name, settings in objectStream(lines):
+        db.add(scope, kind, name, settings)
+    return db
+
+
+RESOLVED_FIELDS = ['srcaddr-resolved', 'dstaddr-resolved', 'service-resolved']
+
+
+def resolvePolicy(db, policy, section):
+    """
+    Returns a policy as a dictionary with the addresses and services of its
+    srcaddr, dstaddr and service fields resolved to prefixes and port ranges.
+    """
+
+    resolved = policy.asDict() if hasattr(policy, 'asDict') else dict(policy)
+    resolved['srcaddr-resolved'] = formatAddresses(
+        db.addresses(section, resolved.get('srcaddr', '')))
+    resolved['dstaddr-resolved'] = formatAddresses(
+        db.addresses(section, resolved.get('dstaddr', '')))
+    resolved['service-resolved'] = formatServices(
+        db.services(section, resolved.get('service', '')))
+    return resolved
@@ -1,175 +1,674 @@
-"""
-Copyright 2016-2021 Maen Artimy
-
-Licensed under the Apache License, Version 2.0 (the "License");
-you may not use this file except in compliance with the License.
-You may obtain a copy of the License at
-
-    http://www.apache.org/licenses/LICENSE-2.0
-
-Unless required by applicable law or agreed to in writing, software
-distributed under the License is distributed on an "AS IS" BASIS,
-WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
-See the License for the specific language governing permissions and
-limitations under the License.
-"""
-
-from pyparsing import *
-import sys
-
-# This app will be able to parse FG policies like the following example:
-
-cfg = r"""\
-config firewall policy
-    edit 93
-        set uuid 3509d226-cff8-51e5-aa5c-35c83c70e195
-        set srcintf "internal-lan"
-        set dstintf "outside"
-        set srcaddr "WEB_SERVER-2"
-        set dstaddr "all"
-        set action accept
-        set schedule "always"
-        set service "ALL"
-        set nat enable
-        set comments "Example Policy"
-    next
-end
-"""
-
-outfilename = "out.csv"
-
-# Forigate Parsing Definitions
-POLICY_SECTION_START_MARKER = Keyword("config firewall policy").suppress()
-POLICY_SECTION_END_MARKER = Keyword("end").suppress()
-POLICY_START_MARKER = Keyword("edit").suppress()
-POLICY_END_MARKER = Keyword("next").suppress()
-
-# General Parsing Definitions
-SEPERATOR = Word("-_. ", max=1)
-LBRACE, RBRACE, SEMI, QUOTE, COMMA = map(Suppress, '{};",')
-
-
-def policySectionParser(text):
-    """
-    Returns the firewall policy section in the configuration. Thers is one section per VDOM.
-    """
-
-    sectionDef = POLICY_SECTION_START_MARKER + \
-        SkipTo(POLICY_SECTION_END_MARKER).setResultsName("content")
-    return sectionDef.searchString(text)
-
-
-def policyParser(text):
-    """
-    Parse individual firewall policies.
-    """
-
-    NEXTMARK = Suppress(Keyword("next"))
-    fieldName = Combine(Word(alphas) + ZeroOrMore('-' + Word(alphas)))
-    objName = Combine(Word(alphanums) +
-                      ZeroOrMore(SEPERATOR + Word(alphanums)))
-    objList = OneOrMore(QUOTE + objName + QUOTE).setParseAction(';'.join)
-
-    policyNum = POLICY_START_MARKER + Word(nums).setResultsName("num")
-    policyParam = objName | objList | quotedString | SkipTo("\n")
-    policyStatement = Keyword("set").suppress() + \
-        Group(fieldName + policyParam)
-    policyDef = policyNum + Dict(OneOrMore(policyStatement)) + NEXTMARK
-
-    return policyDef.searchString(text)
-
-
-def policyFinder(text):
-    """
-    Finds individual firewall policies by locating the keywords 'edit' and 'next'.
-    It is used to verify the number of policies parsed correctly.
-    """
-
-    policyNum = POLICY_START_MARKER + Word(nums)
-    policyDef = policyNum + SkipTo(POLICY_END_MARKER)
-
-    return policyDef.searchString(text)
-
-
-def fieldNames(policies):
-    """
-    Extract field names from parsed policies
-    """
-
-    fields = set()
-    for sec in policies:
-        for obj in sec:
-            fields.update(obj.asDict().keys())
-    return list(fields)
-
-
-def verifyParsing(policyNums, policies):
-    """
-    Generate report for debugging.
-    """
-
-    num = len(policyNums)
-    st = f"Found {num} firewall policy section(s).\n"
-
-    for x in range(num):
-        st += f"Found {len(policyNums[x])} and parsed {len(policies[x])} policies in section {x}.\n"
-
-    # for x in range(num):
-    #     st += f"Policy numbers found in section { x } (in order):\n"
-    #     st += ",".join([item[0] for item in policyNums[x]]) + "\n"
-
-    for x in range(num):
-        notparsed = set([item[0] for item in policyNums[x]]) - \
-            set([item[0] for item in policies[x]])
-        if notparsed:
-            st += f"Policies not parsed in section { x }: "
-            st += ",".join(list(notparsed)) + "\n"
-
-    return st
-
-
-def policyToCSV(columns, policies):
-    """
-    Returns a list of strings. 
-    Each string represents a comma-seperated table of a single firewall policy section.
-    """
-
-    sections = []
-    for sec in policies:
-        # order = 0
-        st = ','.join(columns) + "\n"
-        for obj in sec:
-            # order += 1
-            row = [obj.get(att, '') for att in columns]
-            # row[0] = str(order)
-            st += ",".join(row) + "\n"
-        sections.append(st)
-    return sections
-
-
-if __name__ == "__main__":
-    # Read command line arguments
-    if len(sys.argv) > 2:
-        outfilename = sys.argv[2].split('.')[0] + ".csv"
-    if len(sys.argv) > 1:
-        fgfile = open(sys.argv[1], 'r')
-        cfg = fgfile.read()
-    else:
-        print("Input file name is required! An example is used for now.")
-
-    # Parse firewall policies
-    policySections = policySectionParser(cfg)
-    policyNums = [policyFinder(section) for section in policySections]
-    policies = [policyParser(section.content) for section in policySections]
-
-    # Get field names from parsed policies and insert order field
-    columns = sorted(fieldNames(policies))
-    # columns.insert(0, "order")
-
-    # Convert parsed policies to CSV and save to file
-    with open(outfilename, 'w') as outfile:
-        for s in policyToCSV(columns, policies):
-            outfile.write(s)
-
-    # Print report
-    print(verifyParsing(policyNums, policies), file=sys.stderr)
+"""
+Copyright 2016-2021 Maen Artimy
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import sys
+import argparse
+import re
+from functools import partial
+
+from policy_export import PolicyWriter
+from policy_table import PolicyTable
+from profiler import Profiler
+
+# pyparsing is imported by the functions that build a grammar, and the modules
+# that only some options use (parse_cache, fg_object_db, columnar_export and
+# concurrent.futures) where they are used, so that the parser starts quickly.
+
+# This app will be able to parse FG policies like the following example:
+
+cfg = r"""\
+config firewall policy
+    edit 93
+        set uuid 3509d226-cff8-51e5-aa5c-35c83c70e195
+        set srcintf "internal-lan"
+        set dstintf "outside"
+        set srcaddr "WEB_SERVER-2"
+        set dstaddr "all"
+        set action accept
+        set schedule "always"
+        set service "ALL"
+        set nat enable
+        set comments "Example Policy"
+    next
+end
+"""
+
+outfilename = "out.csv"
+
+# Change when the grammar changes, so cached results are not reused
+GRAMMAR_VERSION = "fg-1"
+
+
+def policySectionParser(text):
+    """
+    Returns the firewall policy section in the configuration. Thers is one section per VDOM.
+    """
+
+    from pyparsing import Keyword, SkipTo
+
+    # Forigate Parsing Definitions
+    POLICY_SECTION_START_MARKER = Keyword("config firewall policy").suppress()
+    POLICY_SECTION_END_MARKER = Keyword("end").suppress()
+    sectionDef = POLICY_SECTION_START_MARKER + \
+        SkipTo(POLICY_SECTION_END_MARKER).setResultsName("content")
+    return sectionDef.searchString(text)
+
+
+def valueGrammar():
+    """
+    Build the grammar of the value of a 'set' statement.
+    """
+
+    from pyparsing import Combine, OneOrMore, SkipTo, Suppress, Word, ZeroOrMore, \
+        alphanums, quotedString
+
+    # General Parsing Definitions
+    SEPERATOR = Word("-_. ", max=1)
+    QUOTE = Suppress('"')
+    objName = Combine(Word(alphanums) +
+                      ZeroOrMore(SEPERATOR + Word(alphanums)))
+    objList = OneOrMore(QUOTE + objName + QUOTE).setParseAction(';'.join)
+    return objName | objList | quotedString | SkipTo("\n")
+
+
+def policyGrammar():
+    """
+    Build the grammar of individual firewall policies.
+    """
+
+    from pyparsing import Combine, Dict, Group, Keyword, OneOrMore, Suppress, Word, \
+        ZeroOrMore, alphas, nums
+
+    POLICY_START_MARKER = Keyword("edit").suppress()
+    NEXTMARK = Suppress(Keyword("next"))
+    fieldName = Combine(Word(alphas) + ZeroOrMore('-' + Word(alphas)))
+
+    policyNum = POLICY_START_MARKER + Word(nums).setResultsName("num")
+    policyParam = valueGrammar()
+    policyStatement = Keyword("set").suppress() + \
+        Group(fieldName + policyParam)
+    policyDef = policyNum + Dict(OneOrMore(policyStatement)) + NEXTMARK
+
+    return policyDef
+
+
+_policyDef = None
+
+
+def policyParser(text):
+    """
+    Parse individual firewall policies.
+    """
+
+    global _policyDef
+    if _policyDef is None:
+        _policyDef = policyGrammar()
+    return _policyDef.searchString(text)
+
+
+EDIT_LINE = re.compile(r"^[ \t]*edit\b", re.MULTILINE)
+
+# The statements of a policy section, as read by lazyPolicyParser
+STATEMENT = re.compile(
+    r"^[ \t]*(?:edit[ \t]+(\d+)|(next)|(config)\b[^\r\n]*|(end)"
+    r"|set[ \t]+([A-Za-z]+(?:-[A-Za-z]+)*)(?=[ \t\r]|$)[ \t]*([^\r\n]*))[ \t]*\r?$",
+    re.MULTILINE)
+OBJ_NAME = r"[A-Za-z0-9]+(?:[-_. ][A-Za-z0-9]+)*"
+PLAIN_VALUE = re.compile(OBJ_NAME)
+QUOTED_LIST = re.compile(rf'(?:"{OBJ_NAME}"\s*)+')
+QUOTED_NAME = re.compile(rf'"({OBJ_NAME})"')
+# The values that the grammar reads whole: a name, a list of quoted names,
+# or a quoted string without quotes or escapes inside
+REGULAR_VALUE = re.compile(rf'(?:{OBJ_NAME}|(?:"{OBJ_NAME}"\s*)+|"[^"\\\r\n]*")[ \t]*')
+
+_valueDef = None
+
+
+def policyValue(text):
+    """
+    Parse the value of a 'set' statement as policyGrammar does. Names and
+    lists of quoted names are read directly, other values with the grammar.
+    """
+
+    global _valueDef
+    text = text.strip()
+    if PLAIN_VALUE.fullmatch(text):
+        return text
+    if QUOTED_LIST.fullmatch(text):
+        return ';'.join(QUOTED_NAME.findall(text))
+    from pyparsing import ParseException
+
+    if _valueDef is None:
+        _valueDef = valueGrammar()
+    try:
+        result = _valueDef.parseString(text + "\n")
+    except ParseException:
+        return ''
+    return result[0] if result else ''
+
+
+class LazyPolicy:
+    """
+    A firewall policy indexed by its number and the offsets of the values of
+    its 'set' statements in the text of its section. Each value is parsed the
+    first time it is read. Policies can be used wherever a ParseResults is.
+    values holds the values that are already parsed.
+    """
+
+    __slots__ = ('text', 'num', 'spans', 'values')
+
+    def __init__(self, text, num, spans, values=None):
+        self.text = text
+        self.num = num
+        self.spans = spans
+        self.values = {} if values is None else values
+
+    def keys(self):
+        return ['num'] + list(self.spans)
+
+    def get(self, name, default=None):
+        if name == 'num':
+            return self.num
+        value = self.values.get(name)
+        if value is None:
+            span = self.spans.get(name)
+            if span is None:
+                return default
+            value = self.values[name] = policyValue(self.text[span[0]:span[1]])
+        return value
+
+    def __getitem__(self, name):
+        value = self.get(name)
+        if value is None:
+            raise KeyError(name)
+        return value
+
+    def __contains__(self, name):
+        return name == 'num' or name in self.spans
+
+    def asDict(self):
+        return {name: self.get(name) for name in self.keys()}
+
+
+def parsedPolicy(text, wanted):
+    """
+    Parse the text of one policy with the grammar. Returns a LazyPolicy holding
+    the wanted fields (all if wanted is None), or None if it was not parsed.
+    """
+
+    results = policyParser(text)
+    if not results:
+        return None
+    values = {name: value for name, value in results[0].asDict().items()
+              if name != 'num' and (wanted is None or name in wanted)}
+    return LazyPolicy(text, results[0]['num'], dict.fromkeys(values), values)
+
+
+def lazyPolicyParser(text, fields=None):
+    """
+    Find the firewall policies of text without parsing their values.
+    Returns a list of LazyPolicy. When fields is given, the other 'set'
+    statements are skipped, so only those fields (and num) can be read.
+    A policy with a line that is not a 'set' statement, or a value that the
+    grammar may not read whole, is parsed with the grammar instead, so the
+    policies are the ones policyParser returns.
+    """
+
+    wanted = None if fields is None else set(fields)
+    policies = []
+    depth = 0
+    num = spans = None
+    found = regular = False
+    start = last = 0
+    for m in STATEMENT.finditer(text):
+        edit, nextMark, config, end, field, value = m.groups()
+        # Statements are whole lines, so anything else between them is another line
+        if num is not None and m.start() > last + 1 and text[last:m.start()].strip():
+            regular = False
+        last = m.end()
+        if num is not None and (config or end):
+            regular = False
+        if config:
+            depth += 1
+        elif end:
+            depth = max(depth - 1, 0)
+        elif depth:
+            continue
+        elif edit:
+            num, spans, found, regular, start = edit, {}, False, True, m.start()
+        elif nextMark:
+            if num is not None and not regular:
+                policy = parsedPolicy(text[start:m.end()], wanted)
+                if policy is not None:
+                    policies.append(policy)
+            # Like policyGrammar, a policy needs at least one 'set' statement
+            elif num is not None and found:
+                policies.append(LazyPolicy(text, num, spans))
+            num = None
+        elif num is not None:
+            found = True
+            regular = regular and REGULAR_VALUE.fullmatch(value) is not None
+            if wanted is None or field in wanted:
+                spans[field] = m.span(6)
+    return policies
+
+
+def policyProjection(text, fields):
+    """
+    Parse only the given fields (and num) of the firewall policies of text.
+    Returns a list of dictionaries.
+    """
+
+    return [p.asDict() for p in lazyPolicyParser(text, fields)]
+
+
+def splitPolicies(text, size):
+    """
+    Split the content of a section into chunks of about size policies.
+    Chunks start at an 'edit' statement, so no policy is split between two chunks.
+    """
+
+    starts = [m.start() for m in EDIT_LINE.finditer(text)][size::size]
+    bounds = [0] + starts + [len(text)]
+    return [text[bounds[i]:bounds[i + 1]] for i in range(len(bounds) - 1)]
+
+
+def parallelPolicyParser(sections, jobs, chunksize=1000, parse=policyParser):
+    """
+    Parse the content of each section in a pool of jobs processes.
+    Sections are split into chunks of policies that are parsed independently.
+    parse replaces policyParser; it must be picklable.
+    Returns a list with the parsed policies of each section, in order.
+    """
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    chunks = [(x, chunk) for x, text in enumerate(sections)
+              for chunk in splitPolicies(text, chunksize)]
+    policies = [[] for _ in sections]
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        results = executor.map(parse, [chunk for _, chunk in chunks])
+        for (x, _), result in zip(chunks, results):
+            policies[x].extend(result)
+    return policies
+
+
+def policyStream(lines, sections=False):
+    """
+    Yields (section, policy) for every 'edit ... next' block of the firewall policy
+    sections, as soon as the block is complete. Sections are numbered from 0.
+    With sections, (section, None) is also yielded when a section starts, so
+    sections without policies are seen.
+    Only the current block is kept in memory, so lines may be an open file of any size.
+    """
+
+    section = -1
+    inSection = False
+    depth = 0
+    block = None
+    for line in lines:
+        words = line.split(None, 3)
+        if not inSection:
+            if words[:3] == ['config', 'firewall', 'policy'] and len(words) == 3:
+                inSection = True
+                section += 1
+                depth = 0
+                if sections:
+                    yield section, None
+            continue
+        if not words:
+            pass
+        elif words[0] == 'config':
+            depth += 1
+        elif words[0] == 'end':
+            if depth == 0:
+                inSection = False
+                block = None
+                continue
+            depth -= 1
+        elif depth == 0 and words[0] == 'edit':
+            block = [line]
+            continue
+        elif depth == 0 and words[0] == 'next' and block is not None:
+            block.append(line)
+            yield section, "".join(block)
+            block = None
+            continue
+        if block is not None:
+            block.append(line)
+
+
+FIELD_NAME = re.compile(r"\s*set\s+([A-Za-z]+(?:-[A-Za-z]+)*)(?=[ \t]|$)")
+
+
+def streamFieldNames(lines):
+    """
+    Extract field names from the 'set' statements of the firewall policies
+    without parsing them.
+    """
+
+    fields = set()
+    for _, block in policyStream(lines):
+        fields.add("num")
+        for line in block.splitlines():
+            match = FIELD_NAME.match(line)
+            if match:
+                fields.add(match.group(1))
+    return list(fields)
+
+
+def streamToCSV(columns, lines, outfile, parse=policyParser, resolve=None, columnar=None):
+    """
+    Parse the firewall policies one block at a time with parse and write them
+    to outfile as comma-seperated tables, one table per section, and to the
+    columnar writer, if given.
+    resolve(policy, section), if given, returns the policy to write.
+    Returns the report generated by verifyParsing.
+    """
+
+    writer = PolicyWriter(outfile, columns)
+    found, parsed, notparsed = [], [], []
+    for section, block in policyStream(lines, sections=True):
+        if block is None:
+            # Each section has a table, even when it has no policies
+            found.append(0)
+            parsed.append(0)
+            notparsed.append([])
+            writer.writeHeader()
+            continue
+        num = block.split(None, 2)[1:2]
+        if num and num[0].isdigit():
+            found[section] += 1
+        policies = parse(block)
+        if resolve:
+            policies = [resolve(p, section) for p in policies]
+        writer.writePolicies(policies)
+        if columnar:
+            columnar.writePolicies(policies, section=section)
+        parsed[section] += len(policies)
+        if num and not policies:
+            notparsed[section].append(num[0])
+
+    num = len(found)
+    st = f"Found {num} firewall policy section(s).\n"
+    for x in range(num):
+        st += f"Found {found[x]} and parsed {parsed[x]} policies in section {x}.\n"
+    for x in range(num):
+        if notparsed[x]:
+            st += f"Policies not parsed in section { x }: "
+            st += ",".join(notparsed[x]) + "\n"
+    return st
+
+
+def policyFinder(text):
+    """
+    Finds individual firewall policies by locating the keywords 'edit' and 'next'.
+    It is used to verify the number of policies parsed correctly.
+    """
+
+    from pyparsing import Keyword, SkipTo, Word, nums
+
+    POLICY_START_MARKER = Keyword("edit").suppress()
+    POLICY_END_MARKER = Keyword("next").suppress()
+    policyNum = POLICY_START_MARKER + Word(nums)
+    policyDef = policyNum + SkipTo(POLICY_END_MARKER)
+
+    return policyDef.searchString(text)
+
+
+def policyTable(policies):
+    """
+    Store the parsed policies of each section in a PolicyTable.
+    """
+
+    table = PolicyTable()
+    for x, sec in enumerate(policies):
+        table.extend(sec, section=x)
+    return table
+
+
+def fieldNames(policies):
+    """
+    Extract field names from parsed policies
+    """
+
+    fields = set()
+    for sec in policies:
+        for obj in sec:
+            fields.update(obj.asDict().keys())
+    return list(fields)
+
+
+def verifyParsing(policyNums, policies):
+    """
+    Generate report for debugging.
+    """
+
+    num = len(policyNums)
+    st = f"Found {num} firewall policy section(s).\n"
+
+    for x in range(num):
+        st += f"Found {len(policyNums[x])} and parsed {len(policies[x])} policies in section {x}.\n"
+
+    # for x in range(num):
+    #     st += f"Policy numbers found in section { x } (in order):\n"
+    #     st += ",".join([item[0] for item in policyNums[x]]) + "\n"
+
+    for x in range(num):
+        notparsed = set([item[0] for item in policyNums[x]]) - \
+            set([item.get('num') for item in policies[x]])
+        if notparsed:
+            st += f"Policies not parsed in section { x }: "
+            st += ",".join(list(notparsed)) + "\n"
+
+    return st
+
+
+def policyToCSV(columns, policies, outfile):
+    """
+    Write the parsed policies to outfile as comma-seperated tables,
+    one table per firewall policy section. Returns the PolicyWriter.
+    """
+
+    writer = PolicyWriter(outfile, columns)
+    for sec in policies:
+        writer.writeHeader()
+        writer.writePolicies(sec)
+    return writer
+
+
+if __name__ == "__main__":
+    # Read command line arguments
+    argparser = argparse.ArgumentParser(
+        description="Convert FortiGate firewall policies to CSV.")
+    argparser.add_argument("infile", nargs="?", help="configuration file")
+    argparser.add_argument("outfile", nargs="?", help="output file name")
+    argparser.add_argument("--stream", action="store_true",
+                           help="parse one policy at a time with bounded memory")
+    argparser.add_argument("--jobs", type=int, default=1,
+                           help="number of processes used to parse the policies")
+    argparser.add_argument("--cache", metavar="PATH",
+                           help="reuse the results of unchanged policies from this cache file")
+    argparser.add_argument("--cache-size", type=int, default=256, metavar="MB",
+                           help="largest size of the cache file")
+    argparser.add_argument("--resolve", action="store_true",
+                           help="add the prefixes and port ranges of the address and service objects")
+    argparser.add_argument("--columnar", metavar="PATH",
+                           help="also write the policies in a columnar binary format: "
+                           "Arrow (.arrow), Parquet (.parquet) or a directory of NumPy arrays")
+    argparser.add_argument("--fields", metavar="LIST",
+                           help="comma-separated fields to write; the other fields are not parsed")
+    argparser.add_argument("--profile", metavar="FILE",
+                           help="write the time spent in each stage to FILE as JSON")
+    args = argparser.parse_intermixed_args()
+    if args.jobs > 1 and (args.stream or args.cache):
+        argparser.error("--jobs cannot be combined with --stream or --cache")
+    if args.fields and args.cache:
+        argparser.error("--fields cannot be combined with --cache")
+
+    # With a projection, only the selected fields (and those --resolve reads) are parsed
+    fields = args.fields.split(',') if args.fields else None
+    parseFields = fields
+    if fields and args.resolve:
+        parseFields = fields + [f for f in ('srcaddr', 'dstaddr', 'service') if f not in fields]
+
+    profiler = Profiler()
+
+    if args.resolve:
+        from fg_object_db import objectDatabase, resolvePolicy, RESOLVED_FIELDS
+
+    parse = policyParser
+    if fields:
+        parse = partial(policyProjection, fields=parseFields)
+    cache = None
+    if args.cache:
+        from parse_cache import ParseCache
+        cache = ParseCache(args.cache, args.cache_size * 1024 * 1024)
+        parse = cache.cached(policyParser, GRAMMAR_VERSION)
+
+    if args.outfile:
+        outfilename = args.outfile.split('.')[0] + ".csv"
+    if not args.infile:
+        print("Input file name is required! An example is used for now.")
+
+    if args.stream or cache:
+        # Policies are parsed (or loaded from the cache) one block at a time.
+        # Two passes over the file: one for the columns, one for the policies
+        lines = None if args.infile else cfg.splitlines(keepends=True)
+        if fields:
+            columns = list(fields)
+        else:
+            with profiler.stage('streamFieldNames') as stage:
+                if args.infile:
+                    with open(args.infile, 'r') as fgfile:
+                        columns = sorted(streamFieldNames(fgfile))
+                else:
+                    columns = sorted(streamFieldNames(lines))
+                stage.items = len(columns)
+
+        resolve = None
+        if args.resolve:
+            with profiler.stage('objectDatabase'):
+                if args.infile:
+                    with open(args.infile, 'r') as fgfile:
+                        db = objectDatabase(fgfile)
+                else:
+                    db = objectDatabase(lines)
+            columns = columns + RESOLVED_FIELDS if fields else sorted(columns + RESOLVED_FIELDS)
+
+            def resolve(policy, section):
+                return resolvePolicy(db, policy, section)
+
+        columnar = None
+        if args.columnar:
+            from columnar_export import columnarWriter
+            columnar = columnarWriter(args.columnar, columns)
+
+        # Parsing and writing are interleaved, so they are profiled as one stage
+        with profiler.stage('stream') as stage, open(outfilename, 'w') as outfile:
+            parseBlock = parse
+
+            def parse(text):
+                policies = parseBlock(text)
+                stage.items += 1
+                stage.bytes += len(text)
+                stage.failures += not policies
+                return policies
+
+            if args.infile:
+                with open(args.infile, 'r') as fgfile:
+                    report = streamToCSV(columns, fgfile, outfile, parse, resolve, columnar)
+            else:
+                report = streamToCSV(columns, lines, outfile, parse, resolve, columnar)
+        if columnar:
+            columnar.close()
+        if cache:
+            cache.close()
+            report += cache.report()
+        print(report, file=sys.stderr)
+        if args.profile:
+            with open(args.profile, 'w') as profile:
+                profiler.write(profile)
+        sys.exit()
+
+    if args.infile:
+        with open(args.infile, 'r') as fgfile:
+            cfg = fgfile.read()
+
+    # Parse firewall policies
+    with profiler.stage('policySectionParser', bytes=len(cfg)) as stage:
+        policySections = policySectionParser(cfg)
+        stage.items = len(policySections)
+
+    policyNums = []
+    for x, section in enumerate(policySections):
+        with profiler.stage('policyFinder', section=x, bytes=len(section.content)) as stage:
+            policyNums.append(policyFinder(section))
+            stage.items = len(policyNums[x])
+
+    table = PolicyTable()
+    if args.jobs > 1:
+        with profiler.stage('policyParser', bytes=len(cfg)) as stage:
+            results = parallelPolicyParser(
+                [section.content for section in policySections], args.jobs, parse=parse)
+            for x, sec in enumerate(results):
+                table.extend(sec, section=x)
+            stage.items = len(table)
+            stage.failures = max(sum(map(len, policyNums)) - len(table), 0)
+    else:
+        for x, section in enumerate(policySections):
+            with profiler.stage('policyParser', section=x,
+                                bytes=len(section.content)) as stage:
+                start = len(table)
+                table.extend(parse(section.content), section=x)
+                stage.items = len(table) - start
+                stage.failures = max(len(policyNums[x]) - stage.items, 0)
+    policies = table.bySection(len(policySections))
+
+    # Get field names from parsed policies and insert order field
+    with profiler.stage('fieldNames') as stage:
+        columns = list(fields) if fields else sorted(table.fieldNames())
+        stage.items = len(table)
+    # columns.insert(0, "order")
+
+    # Add the addresses and services of the objects named by the policies
+    if args.resolve:
+        with profiler.stage('objectDatabase', bytes=len(cfg)) as stage:
+            db = objectDatabase(cfg.splitlines())
+            policies = [[resolvePolicy(db, p, x) for p in sec]
+                        for x, sec in enumerate(policies)]
+            columns = columns + RESOLVED_FIELDS if fields else sorted(columns + RESOLVED_FIELDS)
+            stage.items = len(table)
+
+    # Convert parsed policies to CSV and save to file
+    with profiler.stage('csv') as stage, open(outfilename, 'w') as outfile:
+        writer = policyToCSV(columns, policies, outfile)
+        stage.items = writer.written
+        stage.bytes = outfile.tell()
+
+    if args.columnar:
+        from columnar_export import columnarWriter
+        with profiler.stage('columnar') as stage, \
+                columnarWriter(args.columnar, columns) as columnar:
+            for x, sec in enumerate(policies):
+                columnar.writePolicies(sec, section=x)
+            stage.items = columnar.written
+
+    # Print report
+    print(verifyParsing(policyNums, policies), file=sys.stderr)
+    if args.profile:
+        with open(args.profile, 'w') as profile:
+            profiler.write(profile)
@@ -0,0 +1,341 @@
+"""
+Copyright 2016-2021 Maen Artimy
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from collections import namedtuple, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from batch_parser import detectVendor, expandInputs, outputPaths, warmUp
+from rule_index import formatAddress, formatPorts
+
+# Usage: python3 fleet_check.py configs... [--baseline DEVICE] [--jobs N] [--json]
+# Finds the rules that drift between devices that should enforce the same policy.
+#
+# The rules of every device are normalized into canonical tuples: addresses
+# become prefixes (or address and wildcard), ports become ranges, and FortiGate
+# name lists are sorted, so 'host 10.1.1.1' and '10.1.1.1 0.0.0.0', or 'www'
+# and '80', are the same rule. The tuples of all the devices are hashed into
+# one index that counts the devices holding each rule, so the fleet is compared
+# in one pass over its rules instead of device by device.
+#
+# The index is shared by every vendor, but devices are only compared with the
+# other devices of the same vendor: ASA rules are scoped by access list and
+# FortiGate rules by VDOM and interface pair, so an ASA and a FortiGate that
+# enforce the same policy have no rule in common. The expected rules are the
+# ones held by more than half of the devices, or by the baseline device (the
+# first device of a pair); a device is missing the expected rules it does not
+# have, and its other rules are extra. A missing and an extra rule of the same
+# access list (or FortiGate interface pair) that share at least half of their
+# fields are reported as one different rule.
+
+FIELDS = ['action', 'protocol', 'src', 'srcport', 'dst', 'dstport']
+
+MISSING, EXTRA, DIFFERENT = 'missing', 'extra', 'different'
+
+# scope is the access list name, or the VDOM and interface pair of a FortiGate policy
+CanonicalRule = namedtuple('CanonicalRule', ['scope'] + FIELDS)
+
+# The rules of a device, in order
+Device = namedtuple('Device', 'name vendor rules')
+
+# expected and found are CanonicalRules (None when there is none), position the
+# order of found on the device (from 1) and fields the changed {field: (expected, found)}
+Drift = namedtuple('Drift', 'kind expected found position fields')
+
+# Largest number of missing or extra rules of a scope that are paired by
+# similarity; beyond that they are reported as they are.
+SIMILARITY_WINDOW = 64
+
+
+def nameList(text):
+    """
+    Sort a ';'-separated list of FortiGate names, which is a set.
+    """
+
+    return ';'.join(sorted(text.split(';')))
+
+
+def fgScope(acl):
+    """
+    Canonical scope of a FortiGate rule: 'vdom:srcintf->dstintf', with sorted interfaces.
+    """
+
+    vdom, _, pair = acl.partition(':')
+    src, _, dst = pair.partition('->')
+    return f"{vdom}:{nameList(src)}->{nameList(dst)}"
+
+
+def canonicalRule(rule, vendor):
+    """
+    Convert a normalizer.Rule into a CanonicalRule of strings. Fields that
+    could not be normalized, such as object names, are kept as text.
+    """
+
+    src, dst = formatAddress(rule.src), formatAddress(rule.dst)
+    srcport, dstport = formatPorts(rule.srcport), formatPorts(rule.dstport)
+    scope = rule.acl
+    if vendor == 'fg':
+        scope = fgScope(scope)
+        src, dst, dstport = (nameList(v) if isinstance(v, str) else v
+                             for v in (src, dst, dstport))
+    return CanonicalRule(scope, rule.action, str(rule.protocol).lower(),
+                         str(src), str(srcport), str(dst), str(dstport))
+
+
+def loadDevice(name, path):
+    """
+    Parse the configuration in path and return its canonical rules as a Device.
+    The vendor is None if it could not be detected.
+    """
+
+    from anomaly_detector import vendorRules
+
+    with open(path, 'r') as cfgfile:
+        text = cfgfile.read()
+    vendor = detectVendor(text)
+    if vendor is None:
+        return Device(name, None, [])
+    return Device(name, vendor, [canonicalRule(r, vendor) for r in vendorRules(vendor, text)])
+
+
+def loadFleet(paths, jobs=1):
+    """
+    Parse the configurations in a pool of jobs processes.
+    Devices are named after their files. Returns the Devices, in the order of paths.
+    """
+
+    names = [os.path.splitext(os.path.basename(p))[0] for p in outputPaths(paths, '')]
+    if jobs <= 1:
+        return [loadDevice(n, p) for n, p in zip(names, paths)]
+    with ProcessPoolExecutor(max_workers=jobs, initializer=warmUp) as executor:
+        return list(executor.map(loadDevice, names, paths))
+
+
+class FleetIndex:
+    """
+    The canonical rules of a fleet hashed into one index, which maps each rule
+    to the number of times each device holds it.
+    """
+
+    def __init__(self, devices):
+        self.devices = list(devices)
+        self.holders = defaultdict(dict)
+        self.positions = [{} for _ in self.devices]
+        for d, device in enumerate(self.devices):
+            for position, rule in enumerate(device.rules, 1):
+                counts = self.holders[rule]
+                counts[d] = counts.get(d, 0) + 1
+                self.positions[d].setdefault(rule, []).append(position)
+
+    def groups(self):
+        """
+        Returns the indexes of the devices of each vendor, as {vendor: [indexes]}.
+        """
+
+        groups = defaultdict(list)
+        for d, device in enumerate(self.devices):
+            if device.vendor is not None:
+                groups[device.vendor].append(d)
+        return groups
+
+    def expected(self, group, baseline=None):
+        """
+        Returns the number of times a device of group is expected to hold each
+        rule: as often as the baseline device holds it, or as the lower median
+        of the group, so the rules held by more than half of the devices are
+        expected. A pair of devices has no majority; the first is the baseline.
+        """
+
+        if baseline is None and len(group) == 2:
+            baseline = group[0]
+        if baseline is not None:
+            return {rule: len(p) for rule, p in self.positions[baseline].items()}
+        members = set(group)
+        expected = {}
+        for rule, counts in self.holders.items():
+            held = sorted(n for d, n in counts.items() if d in members)
+            if not held:
+                continue
+            # The devices that do not hold the rule count as zeros
+            median = (len(group) - 1) // 2 - (len(group) - len(held))
+            if median >= 0:
+                expected[rule] = held[median]
+        return expected
+
+    def drift(self, group, baseline=None):
+        """
+        Compare each device of group with the expected rules.
+        Returns {device index: [Drift]} for the devices that differ.
+        """
+
+        expected = self.expected(group, baseline)
+        missing = defaultdict(list)
+        extra = defaultdict(list)
+        members = set(group)
+        for rule, counts in self.holders.items():
+            want = expected.get(rule, 0)
+            # Devices that do not hold an expected rule are only visited for the
+            # expected rules, which most of the group holds
+            devices = group if want else (d for d in counts if d in members)
+            for d in devices:
+                have = counts.get(d, 0)
+                if have < want:
+                    missing[d] += [rule] * (want - have)
+                elif have > want:
+                    positions = self.positions[d][rule]
+                    extra[d] += [(rule, p) for p in positions[len(positions) - (have - want):]]
+        return {d: pairDrift(missing[d], extra[d]) for d in group if missing[d] or extra[d]}
+
+
+def similarity(a, b):
+    """
+    Returns the number of fields with the same value in two rules.
+    """
+
+    return sum(1 for f in FIELDS if getattr(a, f) == getattr(b, f))
+
+
+def fieldChanges(a, b):
+    return {f: (getattr(a, f), getattr(b, f)) for f in FIELDS if getattr(a, f) != getattr(b, f)}
+
+
+def pairDrift(missing, extra):
+    """
+    Pair the missing and extra rules of each scope that share at least half of
+    their fields, the most similar first. Returns the Drifts of a device,
+    in the order of the scopes and positions.
+    """
+
+    scopes = defaultdict(lambda: ([], []))
+    for rule in missing:
+        scopes[rule.scope][0].append(rule)
+    for rule, position in sorted(extra, key=lambda e: e[1]):
+        scopes[rule.scope][1].append((rule, position))
+
+    drifts = []
+    for scope in sorted(scopes):
+        wanted, found = scopes[scope]
+        usedWanted, usedFound = set(), set()
+        if len(wanted) <= SIMILARITY_WINDOW and len(found) <= SIMILARITY_WINDOW:
+            candidates = sorted(((similarity(w, f), j, i) for i, w in enumerate(wanted)
+                                 for j, (f, _) in enumerate(found)), key=lambda c: (-c[0], c[1], c[2]))
+            for score, j, i in candidates:
+                if 2 * score < len(FIELDS):
+                    break
+                if i in usedWanted or j in usedFound:
+                    continue
+                usedWanted.add(i)
+                usedFound.add(j)
+                rule, position = found[j]
+                drifts.append(Drift(DIFFERENT, wanted[i], rule, position,
+                                    fieldChanges(wanted[i], rule)))
+        drifts += [Drift(MISSING, w, None, None, {})
+                   for i, w in enumerate(wanted) if i not in usedWanted]
+        drifts += [Drift(EXTRA, None, rule, position, {})
+                   for j, (rule, position) in enumerate(found) if j not in usedFound]
+    return drifts
+
+
+def ruleLabel(rule):
+    return f"{rule.action} {rule.protocol} {rule.src} port {rule.srcport} -> " \
+        f"{rule.dst} port {rule.dstport}"
+
+
+def driftReport(device, drifts):
+    """
+    Generate a text report of the drift of one device, one line per rule and
+    one indented line per changed field.
+    """
+
+    st = f"{device.name} ({device.vendor}): {driftSummary(drifts)}\n"
+    for d in drifts:
+        if d.kind == MISSING:
+            st += f"- {d.expected.scope}: {ruleLabel(d.expected)}\n"
+        elif d.kind == EXTRA:
+            st += f"+ {d.found.scope} #{d.position}: {ruleLabel(d.found)}\n"
+        else:
+            st += f"~ {d.found.scope} #{d.position}: {ruleLabel(d.found)}\n"
+            for f in FIELDS:
+                if f in d.fields:
+                    expected, found = d.fields[f]
+                    st += f"    {f}: {expected!r} -> {found!r}\n"
+    return st
+
+
+def driftSummary(drifts):
+    counts = {kind: 0 for kind in (MISSING, EXTRA, DIFFERENT)}
+    for d in drifts:
+        counts[d.kind] += 1
+    return ", ".join(f"{n} {kind}" for kind, n in counts.items())
+
+
+def driftToJSON(devices, drift):
+    """
+    Returns the drift of every device as a JSON-serializable dictionary.
+    """
+
+    def rule(r):
+        return None if r is None else r._asdict()
+
+    return {devices[d].name: [{'kind': x.kind, 'expected': rule(x.expected),
+                               'found': rule(x.found), 'position': x.position,
+                               'fields': {f: list(v) for f, v in x.fields.items()}}
+                              for x in drifts]
+            for d, drifts in drift.items()}
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(
+        description="Find the rules that differ between devices that share a policy.")
+    argparser.add_argument("inputs", nargs="+",
+                           help="configuration files, directories or glob patterns")
+    argparser.add_argument("--baseline", metavar="DEVICE",
+                           help="compare the devices of its vendor with this device "
+                           "instead of with the majority")
+    argparser.add_argument("--jobs", type=int, default=os.cpu_count(),
+                           help="number of processes used to parse the files")
+    argparser.add_argument("--json", action="store_true",
+                           help="print the drift as JSON")
+    args = argparser.parse_intermixed_args()
+
+    start = time.perf_counter()
+    devices = loadFleet(expandInputs(args.inputs), args.jobs)
+    index = FleetIndex(devices)
+    names = [d.name for d in devices]
+    if args.baseline is not None and args.baseline not in names:
+        argparser.error(f"unknown device '{args.baseline}'")
+
+    baseline = names.index(args.baseline) if args.baseline is not None else None
+    drift = {}
+    for group in index.groups().values():
+        drift.update(index.drift(group, baseline if baseline in group else None))
+    drift = dict(sorted(drift.items()))
+
+    if args.json:
+        print(json.dumps(driftToJSON(devices, drift), indent=2))
+    else:
+        print("".join(driftReport(devices[d], drifts) for d, drifts in drift.items()), end='')
+
+    for device in devices:
+        if device.vendor is None:
+            print(f"{device.name}: unknown vendor, skipped", file=sys.stderr)
+    print(f"Compared {sum(len(d.rules) for d in devices)} rules of {len(devices)} device(s) "
+          f"({len(index.holders)} distinct) in {time.perf_counter() - start:.3f}s: "
+          f"{len(drift)} device(s) drifted.", file=sys.stderr)
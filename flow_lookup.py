@@ -0,0 +1,236 @@
+"""
+Copyright 2016-2021 Maen Artimy
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import sys
+import csv
+from array import array
+
+import numpy as np
+
+from normalizer import AddrMask, ANY6_ADDRESS, ANY_PORT, ANY_PROTOCOL, FULL_MASK, ip2int
+
+# Usage: python3 flow_lookup.py {ios|asa} config_file flows_file acl_name
+# Finds the first rule of an ACL that matches each flow of a flow log.
+# The flow log is a CSV file with the columns protocol,srcip,srcport,dstip,dstport.
+
+NO_MATCH = -1
+UNDETERMINED = -2  # the first rule that may match the flow cannot be evaluated
+ANY_CODE = -1  # protocol code of rules that match any protocol
+IPV6_CODE = -2  # protocol code of IPv6 rules, which match no IPv4 flow
+
+PROTOCOL_NUMBERS = {
+    'icmp': 1, 'igmp': 2, 'ipinip': 4, 'tcp': 6, 'udp': 17, 'gre': 47,
+    'esp': 50, 'ahp': 51, 'ah': 51, 'eigrp': 88, 'ospf': 89, 'nos': 94,
+    'pim': 103, 'pcp': 108, 'sctp': 132,
+}
+
+MAX_PORT = 65535
+MAX_PROTOCOL = 255
+
+# Number of rules compared with the flows at once
+RULE_BLOCK = 64
+
+
+def protocolNumber(name):
+    """
+    Convert a protocol name or number to its number. Returns None if unknown.
+    """
+
+    name = str(name).lower()
+    if name.isascii() and name.isdigit():
+        return int(name) if int(name) <= MAX_PROTOCOL else None
+    return PROTOCOL_NUMBERS.get(name)
+
+
+class RuleMatcher:
+    """
+    The rules of one ACL compiled into NumPy arrays for first-match lookups.
+    Rules that reference unresolved objects cannot be evaluated; they are marked
+    in unknown and their number is kept in skipped. A flow that such a rule may
+    match before any other rule has an undetermined first match.
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        n = len(self.rules)
+        self.proto = np.full(n, ANY_CODE, dtype=np.int16)
+        self.srcValue = np.zeros(n, dtype=np.uint32)
+        self.srcMask = np.zeros(n, dtype=np.uint32)
+        self.dstValue = np.zeros(n, dtype=np.uint32)
+        self.dstMask = np.zeros(n, dtype=np.uint32)
+        # Each port field is matched by up to two ranges (two are needed for 'neq')
+        self.sport = np.zeros((n, 4), dtype=np.int32)
+        self.dport = np.zeros((n, 4), dtype=np.int32)
+        self.unknown = np.zeros(n, dtype=bool)
+
+        for i, rule in enumerate(self.rules):
+            self.unknown[i] = not self.compileRule(i, rule)
+        self.skipped = int(self.unknown.sum())
+
+    def compileRule(self, i, rule):
+        """
+        Store rule in row i of the arrays. Returns False if it cannot be evaluated;
+        the fields that are not known are then stored as matching everything,
+        so the rule matches every flow that it may match.
+        """
+
+        if ANY6_ADDRESS in (rule.src, rule.dst):
+            self.proto[i] = IPV6_CODE
+            return True
+        proto = ANY_CODE if rule.protocol == ANY_PROTOCOL else protocolNumber(rule.protocol)
+        known = proto is not None
+        self.proto[i] = ANY_CODE if proto is None else proto
+        for addr, value, mask in ((rule.src, self.srcValue, self.srcMask),
+                                  (rule.dst, self.dstValue, self.dstMask)):
+            if isinstance(addr, AddrMask):
+                value[i], mask[i] = addr.value, addr.mask
+            else:
+                known = False
+        for ports, target in ((rule.srcport, self.sport), (rule.dstport, self.dport)):
+            if not isinstance(ports, tuple) or len(ports) > 2:
+                ports, known = ANY_PORT, False
+            # An empty range (1, 0) fills the unused slots
+            bounds = list(ports) + [(1, 0)] * (2 - len(ports))
+            target[i] = [bounds[0][0], bounds[0][1], bounds[1][0], bounds[1][1]]
+        return known
+
+    def matches(self, start, stop, proto, src, sport, dst, dport):
+        """
+        Returns a boolean matrix of the flows (rows) matched by rules start..stop (columns).
+        """
+
+        r = slice(start, stop)
+        hit = (self.proto[r] == ANY_CODE) | (self.proto[r] == proto[:, None])
+        hit &= ((src[:, None] ^ self.srcValue[r]) & self.srcMask[r]) == 0
+        hit &= ((dst[:, None] ^ self.dstValue[r]) & self.dstMask[r]) == 0
+        for port, bounds in ((sport, self.sport[r]), (dport, self.dport[r])):
+            p = port[:, None]
+            hit &= ((p >= bounds[:, 0]) & (p <= bounds[:, 1])) | \
+                ((p >= bounds[:, 2]) & (p <= bounds[:, 3]))
+        return hit
+
+    def lookup(self, proto, src, sport, dst, dport):
+        """
+        Returns the index of the first rule matching each flow, NO_MATCH, or
+        UNDETERMINED if a rule that cannot be evaluated may match it first.
+        All arguments are arrays of the same length: protocol numbers,
+        addresses as unsigned 32-bit integers and port numbers.
+        """
+
+        proto = np.asarray(proto, dtype=np.int16)
+        src = np.asarray(src, dtype=np.uint32)
+        dst = np.asarray(dst, dtype=np.uint32)
+        sport = np.asarray(sport, dtype=np.int32)
+        dport = np.asarray(dport, dtype=np.int32)
+
+        result = np.full(len(proto), NO_MATCH, dtype=np.int32)
+        pending = np.arange(len(proto))
+        for start in range(0, len(self.rules), RULE_BLOCK):
+            if not len(pending):
+                break
+            stop = min(start + RULE_BLOCK, len(self.rules))
+            hit = self.matches(start, stop, proto[pending], src[pending],
+                               sport[pending], dst[pending], dport[pending])
+            found = hit.any(axis=1)
+            first = start + hit[found].argmax(axis=1)
+            result[pending[found]] = np.where(self.unknown[first], UNDETERMINED, first)
+            pending = pending[~found]
+        return result
+
+    def actions(self, indexes):
+        """
+        Returns the action of the rule at each index, '' where there is no match
+        and 'undetermined' where the first match is not known.
+        """
+
+        names = np.array([r.action for r in self.rules] + ['undetermined', ''], dtype=object)
+        return names[np.where(indexes < 0, len(self.rules) + 2 + indexes, indexes)]
+
+
+def flowNumber(text, limit):
+    """
+    Convert a field of a flow log to an integer. Returns None if it is not
+    a decimal number no larger than limit.
+    """
+
+    text = text.strip()
+    if not text or not text.isascii() or not text.isdigit() or int(text) > limit:
+        return None
+    return int(text)
+
+
+def readFlows(lines):
+    """
+    Read a flow log in CSV format (protocol,srcip,srcport,dstip,dstport) into arrays.
+    Addresses may be dotted or integers and protocols names or numbers.
+    A header line and rows with missing or malformed fields are skipped.
+    """
+
+    proto, src, sport, dst, dport = (array('h'), array('I'), array('i'),
+                                     array('I'), array('i'))
+    for row in csv.reader(lines):
+        if len(row) < 5:
+            continue
+        p = protocolNumber(row[0].strip())
+        s, d = (flowNumber(a, FULL_MASK) if a.strip().isdigit() else ip2int(a.strip())
+                for a in (row[1], row[3]))
+        sp, dp = flowNumber(row[2], MAX_PORT), flowNumber(row[4], MAX_PORT)
+        if s is None or d is None or sp is None or dp is None:
+            continue
+        proto.append(-3 if p is None else p)
+        src.append(s)
+        sport.append(sp)
+        dst.append(d)
+        dport.append(dp)
+    return tuple(np.frombuffer(a, dtype=a.typecode) if len(a) else np.zeros(0, a.typecode)
+                 for a in (proto, src, sport, dst, dport))
+
+
+def aclMatcher(rules, acl):
+    """
+    Returns a RuleMatcher for the rules of one ACL, in order.
+    """
+
+    members = sorted((r for r in rules if r.acl == acl), key=lambda r: r.order)
+    return RuleMatcher(members)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 5:
+        print("Usage: python3 flow_lookup.py {ios|asa} config_file flows_file acl_name",
+              file=sys.stderr)
+        sys.exit(1)
+
+    from anomaly_detector import vendorRules
+
+    vendor, cfgname, flowname, acl = sys.argv[1:5]
+    with open(cfgname, 'r') as cfgfile:
+        rules = vendorRules(vendor, cfgfile.read())
+    matcher = aclMatcher(rules, acl)
+    with open(flowname, 'r') as flowfile:
+        flows = readFlows(flowfile)
+
+    indexes = matcher.lookup(*flows)
+    actions = matcher.actions(indexes)
+
+    writer = csv.writer(sys.stdout, lineterminator='\n')
+    writer.writerow(['flow', 'rule', 'action'])
+    for n, (i, action) in enumerate(zip(indexes, actions)):
+        writer.writerow([n, matcher.rules[i].order if i >= 0 else '', action])
+
+    print(f"Matched {len(indexes)} flows against {len(matcher.rules)} rules "
+          f"({matcher.skipped} rules could not be evaluated, "
+          f"{(indexes == UNDETERMINED).sum()} flows undetermined).", file=sys.stderr)
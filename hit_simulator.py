@@ -0,0 +1,354 @@
+"""
+Copyright 2016-2021 Maen Artimy
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import sys
+import csv
+import time
+import argparse
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from flow_lookup import aclMatcher, readFlows
+from normalizer import int2ip
+from rule_index import formatAddress, formatPorts
+
+# Usage: python3 hit_simulator.py {ios|asa} config_file flows_file [--acl NAME]
+#            [--jobs N] [--top K] [--unused] [--format {auto,csv,binary}]
+#        python3 hit_simulator.py {ios|asa} config_file flows_file --convert FILE
+# Replays a flow log against the ACLs of a configuration and counts the flows
+# that each rule matches first, with the sources that sent the most flows
+# through it. Rules that no flow matched are reported as unused.
+#
+# The flow log is split into shards that are looked up in a pool of processes.
+# The compiled rules are handed to each process once, when it starts (with the
+# fork start method, the rule arrays are shared with the parent and never
+# copied), and each shard returns counters that are added up, so throughput
+# grows with the number of cores. Logs are CSV files with the columns
+# protocol,srcip,srcport,dstip,dstport, or binary files of FLOW_RECORD records,
+# which --convert writes. Binary logs are read without parsing.
+
+# One flow of a binary flow log, with the types readFlows returns
+FLOW_RECORD = np.dtype([('protocol', '<i2'), ('srcip', '<u4'), ('srcport', '<i4'),
+                        ('dstip', '<u4'), ('dstport', '<i4')])
+BINARY_SUFFIX = '.bin'
+
+SHARD_SIZE = 16 * 1024 * 1024  # bytes of the flow log looked up by one task
+LOOKUP_BATCH = 262144  # flows compared with the rules at once
+
+# The flows of each source are counted per rule exactly, unless an ACL has
+# more than TALKER_LIMIT distinct (rule, source) pairs. Then only the
+# TALKER_CAPACITY heaviest sources of each rule are kept from that point on,
+# and the counts of the top talkers become lower bounds.
+TALKER_LIMIT = 4000000
+TALKER_CAPACITY = 1024
+
+# The hits of one ACL. hits[0] counts the flows whose first match is
+# undetermined, as a rule that could not be evaluated may match them, hits[1]
+# the flows that matched no rule and hits[i + 2] the flows that matched rule i
+# first. talkers maps the same
+# indexes to lists of (source address, flows), heaviest first; exact is
+# False when the talker counts are lower bounds.
+AclHits = namedtuple('AclHits', 'matcher hits talkers exact')
+
+_matchers = None
+
+
+def loadMatchers(matchers):
+    """
+    Keep the compiled rules in each process of the pool.
+    """
+
+    global _matchers
+    _matchers = matchers
+
+
+def isBinary(path, fmt='auto'):
+    return fmt == 'binary' or fmt == 'auto' and path.endswith(BINARY_SUFFIX)
+
+
+def flowShards(path, binary, size=SHARD_SIZE):
+    """
+    Split a flow log into (start, stop) byte ranges of about size bytes.
+    The ranges of binary logs hold whole records.
+    """
+
+    total = os.path.getsize(path)
+    if binary:
+        size = max(1, size // FLOW_RECORD.itemsize) * FLOW_RECORD.itemsize
+        total -= total % FLOW_RECORD.itemsize
+    return [(start, min(start + size, total)) for start in range(0, total, size)]
+
+
+def csvLines(path, start, stop):
+    """
+    Yields the lines of a CSV file that start in the byte range [start, stop).
+    """
+
+    with open(path, 'rb') as flowfile:
+        pos = start
+        if start:
+            # Skip the end of the line that the previous range reads
+            flowfile.seek(start - 1)
+            pos += len(flowfile.readline()) - 1
+        while pos < stop:
+            line = flowfile.readline()
+            if not line:
+                break
+            pos += len(line)
+            yield line.decode()
+
+
+def readShard(path, binary, start, stop):
+    """
+    Read the flows of a byte range of a flow log into arrays, as readFlows does.
+    """
+
+    if binary:
+        records = np.fromfile(path, dtype=FLOW_RECORD,
+                              count=(stop - start) // FLOW_RECORD.itemsize, offset=start)
+        return tuple(records[name] for name in FLOW_RECORD.names)
+    return readFlows(csvLines(path, start, stop))
+
+
+def countKeys(keys, counts=None):
+    """
+    Add up the counts of equal keys. Returns the distinct keys and their totals.
+    """
+
+    if not len(keys):
+        return keys, np.zeros(0, dtype=np.int64)
+    distinct, inverse = np.unique(keys, return_inverse=True)
+    return distinct, np.bincount(inverse, weights=counts).astype(np.int64)
+
+
+def heaviest(keys, counts, limit):
+    """
+    Keep the limit largest counts of each rule. The rule is in the high 32 bits
+    of each key and the source address in the low 32 bits.
+    """
+
+    rules = keys >> np.uint64(32)
+    order = np.lexsort((-counts, rules))
+    keys, counts, rules = keys[order], counts[order], rules[order]
+    rank = np.arange(len(keys)) - np.searchsorted(rules, rules)
+    keep = rank < limit
+    return keys[keep], counts[keep]
+
+
+def countShard(path, binary, start, stop):
+    """
+    Look up the flows of one shard in every ACL.
+    Returns the number of flows and, for each ACL, the hits of each rule and
+    the talker keys and counts of the shard.
+    """
+
+    flows = readShard(path, binary, start, stop)
+    counters = []
+    for matcher in _matchers:
+        hits = np.zeros(len(matcher.rules) + 2, dtype=np.int64)
+        keys = [np.zeros(0, dtype=np.uint64)]
+        for b in range(0, len(flows[0]), LOOKUP_BATCH):
+            batch = [f[b:b + LOOKUP_BATCH] for f in flows]
+            first = matcher.lookup(*batch) + 2
+            hits += np.bincount(first, minlength=len(hits))
+            keys.append((first.astype(np.uint64) << np.uint64(32)) |
+                        batch[1].astype(np.uint64))
+        counters.append((hits, *countKeys(np.concatenate(keys))))
+    return len(flows[0]), counters
+
+
+def simulate(matchers, path, binary=False, jobs=1, top=5, shardSize=SHARD_SIZE):
+    """
+    Replay the flow log in path against the RuleMatchers of matchers in a pool
+    of jobs processes, keeping the top sources of each rule.
+    Returns the number of flows and an AclHits per matcher.
+    """
+
+    shards = flowShards(path, binary, shardSize)
+    hits = [np.zeros(len(m.rules) + 2, dtype=np.int64) for m in matchers]
+    keys = [[] for _ in matchers]
+    counts = [[] for _ in matchers]
+    pairs = [0] * len(matchers)
+    exact = [True] * len(matchers)
+    total = 0
+
+    def merge(results):
+        nonlocal total
+        for flows, counters in results:
+            total += flows
+            for n, (h, k, c) in enumerate(counters):
+                hits[n] += h
+                keys[n].append(k)
+                counts[n].append(c)
+                pairs[n] += len(k)
+                if pairs[n] > 2 * TALKER_LIMIT:
+                    k, c = countKeys(np.concatenate(keys[n]), np.concatenate(counts[n]))
+                    if len(k) > TALKER_LIMIT:
+                        k, c = heaviest(k, c, TALKER_CAPACITY)
+                        exact[n] = False
+                    keys[n], counts[n], pairs[n] = [k], [c], len(k)
+
+    tasks = ([path] * len(shards), [binary] * len(shards),
+             [s for s, _ in shards], [s for _, s in shards])
+    if jobs > 1 and len(shards) > 1:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=loadMatchers,
+                                 initargs=(matchers,)) as executor:
+            merge(executor.map(countShard, *tasks))
+    else:
+        loadMatchers(matchers)
+        merge(map(countShard, *tasks))
+
+    results = []
+    for n, matcher in enumerate(matchers):
+        talkers = {}
+        if keys[n]:
+            k, c = heaviest(*countKeys(np.concatenate(keys[n]), np.concatenate(counts[n])), top)
+            for key, count in zip(k.tolist(), c.tolist()):
+                talkers.setdefault(key >> 32, []).append((key & 0xFFFFFFFF, count))
+        results.append(AclHits(matcher, hits[n], talkers, exact[n]))
+    return total, results
+
+
+def writeBinaryFlows(flows, outfile):
+    """
+    Write flow arrays (protocol, srcip, srcport, dstip, dstport) to a binary
+    file as FLOW_RECORD records.
+    """
+
+    records = np.empty(len(flows[0]), dtype=FLOW_RECORD)
+    for name, values in zip(FLOW_RECORD.names, flows):
+        records[name] = values
+    records.tofile(outfile)
+    return len(records)
+
+
+def unused(result):
+    """
+    Returns the indexes of the rules that no flow matched, leaving out the
+    rules that could not be evaluated.
+    """
+
+    return [i for i in range(len(result.matcher.rules))
+            if not result.hits[i + 2] and not result.matcher.unknown[i]]
+
+
+def hitRows(result, onlyUnused=False):
+    """
+    Yields a row per rule of an ACL: the rule, its hits and its top talkers.
+    Rules that could not be evaluated have no hits. The last rows count the
+    flows that matched no rule and were denied implicitly, and the flows whose
+    first match is undetermined, if any rule could not be evaluated.
+    """
+
+    matcher = result.matcher
+    indexes = unused(result) if onlyUnused else range(len(matcher.rules))
+    for i in indexes:
+        r = matcher.rules[i]
+        hits = '' if matcher.unknown[i] else int(result.hits[i + 2])
+        yield [r.acl, r.order, r.action, r.protocol, formatAddress(r.src),
+               formatAddress(r.dst), formatPorts(r.srcport), formatPorts(r.dstport),
+               hits, talkerList(result.talkers.get(i + 2, []))]
+    if not onlyUnused and matcher.rules:
+        yield [matcher.rules[0].acl, 'implicit', 'deny', 'ip', 'any', 'any', 'any', 'any',
+               int(result.hits[1]), talkerList(result.talkers.get(1, []))]
+        if matcher.skipped:
+            yield [matcher.rules[0].acl, 'undetermined', '', '', '', '', '', '',
+                   int(result.hits[0]), talkerList(result.talkers.get(0, []))]
+
+
+def talkerList(talkers):
+    return ';'.join(f"{int2ip(src)}:{count}" for src, count in talkers)
+
+
+def summary(result):
+    """
+    Generate a report of the hits of one ACL.
+    """
+
+    matcher = result.matcher
+    idle = unused(result)
+    st = f"ACL {matcher.rules[0].acl if matcher.rules else ''}: " \
+        f"{len(idle)} of {len(matcher.rules)} rules matched no flow, " \
+        f"{result.hits[1]} flows matched no rule"
+    if matcher.skipped:
+        st += f", {matcher.skipped} rules could not be evaluated"
+    if result.hits[0]:
+        st += f", {result.hits[0]} flows undetermined (later rules may have more hits)"
+    if not result.exact:
+        st += ", talker counts are lower bounds"
+    return st + ".\n"
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(
+        description="Count the flows of a flow log that each rule matches first.")
+    argparser.add_argument("vendor", choices=['ios', 'asa'])
+    argparser.add_argument("config", help="configuration file")
+    argparser.add_argument("flows", help="flow log, CSV or binary")
+    argparser.add_argument("--acl", action="append",
+                           help="ACL to replay the flows against (all ACLs by default)")
+    argparser.add_argument("--jobs", type=int, default=os.cpu_count(),
+                           help="number of processes used to look up the flows")
+    argparser.add_argument("--top", type=int, default=5,
+                           help="number of top talkers listed per rule")
+    argparser.add_argument("--unused", action="store_true",
+                           help="list only the rules that matched no flow")
+    argparser.add_argument("--format", choices=['auto', 'csv', 'binary'], default='auto',
+                           help=f"format of the flow log; auto reads {BINARY_SUFFIX} "
+                           "files as binary")
+    argparser.add_argument("--shard-size", type=int, default=SHARD_SIZE // (1024 * 1024),
+                           metavar="MB", help="size of the part of the log read by one task")
+    argparser.add_argument("--convert", metavar="FILE",
+                           help="convert the CSV flow log to a binary flow log and exit")
+    args = argparser.parse_intermixed_args()
+
+    if args.shard_size < 1:
+        argparser.error("--shard-size must be at least 1 MB")
+    binary = isBinary(args.flows, args.format)
+    if args.convert:
+        if binary:
+            argparser.error("--convert reads a CSV flow log")
+        with open(args.convert, 'wb') as outfile:
+            written = sum(writeBinaryFlows(readShard(args.flows, False, start, stop), outfile)
+                          for start, stop in flowShards(args.flows, False))
+        print(f"Converted {written} flows.", file=sys.stderr)
+        sys.exit()
+
+    from anomaly_detector import vendorRules
+
+    with open(args.config, 'r') as cfgfile:
+        rules = vendorRules(args.vendor, cfgfile.read())
+    acls = args.acl or list(dict.fromkeys(r.acl for r in rules))
+    matchers = [aclMatcher(rules, acl) for acl in acls]
+
+    start = time.perf_counter()
+    total, results = simulate(matchers, args.flows, binary, args.jobs, args.top,
+                              args.shard_size * 1024 * 1024)
+    seconds = time.perf_counter() - start
+
+    writer = csv.writer(sys.stdout, lineterminator='\n')
+    writer.writerow(['acl', 'order', 'action', 'protocol', 'src', 'dst', 'srcport',
+                     'dstport', 'hits', 'talkers'])
+    for result in results:
+        writer.writerows(hitRows(result, args.unused))
+
+    for result in results:
+        print(summary(result), end='', file=sys.stderr)
+    print(f"Replayed {total} flows against {len(matchers)} ACL(s) in {seconds:.3f}s "
+          f"({total / seconds if seconds else 0:.0f} flows/s).", file=sys.stderr)
@@ -0,0 +1,295 @@
+"""
+Copyright 2016-2021 Maen Artimy
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import sys
+import csv
+import time
+import asyncio
+import argparse
+import posixpath
+from urllib.parse import urlsplit
+from concurrent.futures import ProcessPoolExecutor
+
+from batch_parser import SUMMARY_FIELDS, parseText, warmUp
+
+try:
+    import asyncssh
+except ImportError:
+    asyncssh = None
+
+# Usage: python3 ingest.py [--outdir DIR] [--jobs N] [--connections N] [--watch] source
+# where source is a spool directory or sftp://[user[:password]@]host[:port]/directory
+#
+# Fetches the configurations of many devices concurrently and parses them in a
+# pool of processes while the other devices are still being fetched. Fetched
+# configurations wait in a bounded queue; when it is full, fetching pauses
+# until a process is free, so memory stays bounded however slow parsing is.
+# One CSV file is written per device, with a summary of the fetch, queue and
+# parse time of each device.
+
+INGEST_FIELDS = SUMMARY_FIELDS[:-1] + ['fetch', 'queued', 'latency', 'error']
+
+
+class SpoolSource:
+    """
+    Configurations dropped in a spool directory. With watch, the directory is
+    scanned again every interval seconds and new or changed files are fetched,
+    until the pipeline is stopped. Files whose name starts with '.' are ignored,
+    so writers can create a hidden file and rename it once it is complete.
+    """
+
+    def __init__(self, directory, watch=False, interval=2.0):
+        self.directory = directory
+        self.watch = watch
+        self.interval = interval
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    def scan(self):
+        files = {}
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.startswith('.'):
+                files[entry.name] = entry.stat().st_mtime
+        return files
+
+    async def devices(self):
+        """
+        Yields the name of each configuration to fetch.
+        """
+
+        seen = {}
+        while True:
+            files = await asyncio.to_thread(self.scan)
+            for name in sorted(files):
+                if seen.get(name) != files[name]:
+                    seen[name] = files[name]
+                    yield name
+            if not self.watch:
+                return
+            await asyncio.sleep(self.interval)
+
+    def read(self, name):
+        with open(os.path.join(self.directory, name), 'r') as cfgfile:
+            return cfgfile.read()
+
+    async def fetch(self, name):
+        """
+        Returns the text of a configuration.
+        """
+
+        return await asyncio.to_thread(self.read, name)
+
+
+class SFTPSource:
+    """
+    Configurations read from a directory of an SSH server over SFTP, such as a
+    configuration archive or a local test server. All the requests share one
+    SSH connection. Requires asyncssh.
+    """
+
+    def __init__(self, host, port=22, username=None, password=None, directory='.',
+                 knownHosts=None):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.directory = directory
+        self.knownHosts = knownHosts
+        self.conn = None
+        self.sftp = None
+
+    async def __aenter__(self):
+        if asyncssh is None:
+            raise ImportError("asyncssh is required for SFTP sources")
+        self.conn = await asyncssh.connect(
+            self.host, port=self.port, username=self.username, password=self.password,
+            known_hosts=self.knownHosts if self.knownHosts else ())
+        self.sftp = await self.conn.start_sftp_client()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.sftp.exit()
+        self.conn.close()
+        await self.conn.wait_closed()
+
+    async def devices(self):
+        for name in sorted(await self.sftp.listdir(self.directory)):
+            if not name.startswith('.'):
+                yield name
+
+    async def fetch(self, name):
+        async with self.sftp.open(posixpath.join(self.directory, name), 'r') as remote:
+            return await remote.read()
+
+
+def openSource(source, watch=False, interval=2.0, knownHosts=None):
+    """
+    Returns the source named by a directory or an sftp:// URL.
+    """
+
+    url = urlsplit(source)
+    if url.scheme == 'sftp':
+        return SFTPSource(url.hostname, url.port or 22, url.username, url.password,
+                          url.path or '.', knownHosts)
+    return SpoolSource(source, watch, interval)
+
+
+class OutputNames:
+    """
+    Names the output file of each device after its configuration file.
+    A device that is fetched again keeps its output file.
+    """
+
+    def __init__(self, outdir):
+        self.outdir = outdir
+        self.paths = {}
+        self.used = set()
+
+    def __call__(self, name):
+        path = self.paths.get(name)
+        if path is None:
+            device = os.path.splitext(os.path.basename(name))[0]
+            unique, n = device, 1
+            while unique in self.used:
+                n += 1
+                unique = f"{device}-{n}"
+            self.used.add(unique)
+            path = self.paths[name] = os.path.join(self.outdir, unique + ".csv")
+        return path
+
+
+async def ingest(source, outdir, jobs=1, connections=8, queueSize=None, report=None):
+    """
+    Fetch the configurations of source with up to connections concurrent requests
+    and parse them in a pool of jobs processes. Fetched configurations wait in a
+    queue of queueSize items (twice jobs by default) for a free process.
+    report, if given, is called with the summary of each device when it is done.
+    Returns the summaries, in the order the devices were done.
+    """
+
+    os.makedirs(outdir, exist_ok=True)
+    outputName = OutputNames(outdir)
+    names = asyncio.Queue(maxsize=connections)
+    fetched = asyncio.Queue(maxsize=queueSize or 2 * jobs)
+    loop = asyncio.get_running_loop()
+    summaries = []
+
+    def done(summary):
+        summaries.append(summary)
+        if report:
+            report(summary)
+
+    async def listDevices():
+        async for name in source.devices():
+            await names.put(name)
+        for _ in range(connections):
+            await names.put(None)
+
+    async def fetch():
+        while (name := await names.get()) is not None:
+            start = time.perf_counter()
+            try:
+                text = await source.fetch(name)
+            except Exception as e:
+                summary = dict.fromkeys(INGEST_FIELDS, '')
+                summary.update(device=name, file=name, error=f"fetch: {e}",
+                               latency=round(time.perf_counter() - start, 4))
+                done(summary)
+                continue
+            await fetched.put((name, text, start, time.perf_counter()))
+
+    async def parse(executor):
+        while (item := await fetched.get()) is not None:
+            name, text, start, end = item
+            begin = time.perf_counter()
+            try:
+                summary = await loop.run_in_executor(
+                    executor, parseText, text, name, outputName(name))
+            except Exception as e:
+                summary = dict.fromkeys(SUMMARY_FIELDS, '')
+                summary.update(device=name, file=name, error=f"parse: {e}")
+            summary.update(fetch=round(end - start, 4), queued=round(begin - end, 4),
+                           latency=round(time.perf_counter() - start, 4))
+            done(summary)
+
+    async with source:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=warmUp) as executor:
+            parsers = [asyncio.create_task(parse(executor)) for _ in range(jobs)]
+            try:
+                await asyncio.gather(listDevices(), *(fetch() for _ in range(connections)))
+                for _ in parsers:
+                    await fetched.put(None)
+                await asyncio.gather(*parsers)
+            finally:
+                for task in parsers:
+                    task.cancel()
+    return summaries
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(
+        description="Fetch and convert the firewall policies of many devices to CSV.")
+    argparser.add_argument("source",
+                           help="spool directory or sftp://user@host[:port]/directory")
+    argparser.add_argument("--outdir", default="out",
+                           help="directory of the output files")
+    argparser.add_argument("--jobs", type=int, default=os.cpu_count(),
+                           help="number of processes used to parse the configurations")
+    argparser.add_argument("--connections", type=int, default=8,
+                           help="number of configurations fetched at the same time")
+    argparser.add_argument("--queue", type=int, metavar="N",
+                           help="largest number of fetched configurations waiting to be parsed")
+    argparser.add_argument("--watch", action="store_true",
+                           help="keep fetching new files of the spool directory")
+    argparser.add_argument("--interval", type=float, default=2.0,
+                           help="seconds between two scans of the spool directory")
+    argparser.add_argument("--known-hosts", metavar="FILE",
+                           help="known hosts file of the SFTP server")
+    args = argparser.parse_intermixed_args()
+
+    source = openSource(args.source, args.watch, args.interval, args.known_hosts)
+    os.makedirs(args.outdir, exist_ok=True)
+    start = time.perf_counter()
+    with open(os.path.join(args.outdir, "summary.csv"), 'w') as outfile:
+        writer = csv.DictWriter(outfile, lineterminator='\n', fieldnames=INGEST_FIELDS)
+        writer.writeheader()
+
+        def report(s):
+            writer.writerow(s)
+            outfile.flush()
+            if s['error']:
+                print(f"{s['device']}: {s['error']}", file=sys.stderr)
+                return
+            vendor = s['vendor'] or 'unknown vendor, skipped'
+            print(f"{s['device']} ({vendor}): parsed {s['parsed'] or 0} of "
+                  f"{s['found'] or 0} policies, fetched in {s['fetch']:.3f}s, "
+                  f"queued {s['queued']:.3f}s, parsed in {s['seconds']:.3f}s, "
+                  f"latency {s['latency']:.3f}s", file=sys.stderr)
+
+        try:
+            summaries = asyncio.run(ingest(source, args.outdir, args.jobs,
+                                           args.connections, args.queue, report))
+        except KeyboardInterrupt:
+            summaries = None
+
+    if summaries is not None:
+        print(f"Ingested {len(summaries)} configuration(s) in "
+              f"{time.perf_counter() - start:.3f}s.", file=sys.stderr)
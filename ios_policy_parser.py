@@ -17,6 +17,7 @@ limitations under the License.
 
 import sys
 import csv
+import argparse
 
 # Literal: will match the given string, even if it is just the start of a larger string.
 # Word: will match a word group of characters consisting of the letters in its constructor string.
@@ -48,36 +49,134 @@ access-list 121 deny   ip any any
 access-list 13 deny ip any
 """
 
-from config_parser import ios_policy_parser, field_names
-import yaml
+from config_parser import ios_policy_records, ios_policy_stream
+from config_parser import F_NAME, F_ACTION, F_PROTOCOL, F_SRCIP, F_SRCPORT, \
+    F_DSTIP, F_DSTPORT, F_NOTES
+from policy_table import PolicyTable
+from profiler import Profiler
+
+# yaml and columnar_export (NumPy) are imported only when their output is written,
+# so a run that only writes CSV starts quickly.
 
 outfilename = "out.csv"
+COLUMNS = [F_NAME, F_ACTION, F_PROTOCOL, F_SRCIP,
+           F_SRCPORT, F_DSTIP, F_DSTPORT, F_NOTES]
+
+
+def stream_to_files(lines, csvfile, ymlfile, columnar=None):
+    """
+    Parse the policies one line at a time and write each of them to the
+    csv file, the yaml file and the columnar writer, if given, as soon as it is parsed.
+    """
+
+    writer = csv.DictWriter(csvfile, lineterminator='\n', fieldnames=COLUMNS)
+    writer.writeheader()
+    if ymlfile:
+        import yaml
+        ymlfile.write('acl:\n')
+    count = 0
+    for data in ios_policy_stream(lines):
+        writer.writerow(data)
+        if ymlfile:
+            ymlfile.write(yaml.dump([data]))
+        if columnar:
+            columnar.writePolicy(data)
+        count += 1
+    if ymlfile and not count:
+        ymlfile.seek(0)
+        ymlfile.write('acl: []\n')
+    return count
 
 
 if __name__ == "__main__":
     # Read command line arguments
-    if len(sys.argv) > 2:
-        outfilename = sys.argv[2].split('.')[0] + ".csv"
-    if len(sys.argv) > 1:
-        with open(sys.argv[1], 'r') as fgfile:
-            cfg = fgfile.read()
-    else:
+    argparser = argparse.ArgumentParser(
+        description="Convert IOS access-list policies to CSV and YAML.")
+    argparser.add_argument("infile", nargs="?", help="configuration file")
+    argparser.add_argument("outfile", nargs="?", help="output file name")
+    argparser.add_argument("--stream", action="store_true",
+                           help="parse one line at a time with bounded memory")
+    argparser.add_argument("--no-yaml", action="store_true",
+                           help="write the CSV file only, not out.yml")
+    argparser.add_argument("--columnar", metavar="PATH",
+                           help="also write the policies in a columnar binary format: "
+                           "Arrow (.arrow), Parquet (.parquet) or a directory of NumPy arrays")
+    argparser.add_argument("--profile", metavar="FILE",
+                           help="write the time spent in each stage to FILE as JSON")
+    args = argparser.parse_intermixed_args()
+
+    profiler = Profiler()
+
+    if args.outfile:
+        outfilename = args.outfile.split('.')[0] + ".csv"
+    if not args.infile:
         print("Input file name is required! An example is used for now.")
 
+    if args.stream:
+        # Parsing and writing are interleaved, so they are profiled as one stage
+        columnar = None
+        if args.columnar:
+            from columnar_export import columnarWriter
+            columnar = columnarWriter(args.columnar, COLUMNS)
+        ymlfile = None if args.no_yaml else open('out.yml', 'w')
+        with profiler.stage('stream') as stage, open(outfilename, 'w') as csvfile:
+            if args.infile:
+                with open(args.infile, 'r') as fgfile:
+                    stage.items = stream_to_files(fgfile, csvfile, ymlfile, columnar)
+                    stage.bytes = fgfile.tell()
+            else:
+                stage.items = stream_to_files(cfg.splitlines(), csvfile, ymlfile, columnar)
+                stage.bytes = len(cfg)
+        if ymlfile:
+            ymlfile.close()
+        if columnar:
+            columnar.close()
+        if args.profile:
+            with open(args.profile, 'w') as profile:
+                profiler.write(profile)
+        sys.exit()
+
+    if args.infile:
+        with open(args.infile, 'r') as fgfile:
+            cfg = fgfile.read()
+
     # Parse ACL policies
-    policies = ios_policy_parser(cfg)
-    
+    with profiler.stage('ios_policy_records', bytes=len(cfg)) as stage:
+        policies = PolicyTable()
+        policies.extend(ios_policy_records(cfg.splitlines()))
+        stage.items = len(policies)
+
     # Get field names from parsed policies and insert order field
-    columns = field_names(policies)
+    with profiler.stage('fieldNames') as stage:
+        columns = policies.fieldNames()
+        stage.items = len(policies)
 
     # Write to yaml
-    policy_list = [p.asDict() for p in policies if p]
-    with open('out.yml', 'w') as file:
-        yaml.dump({'acl': policy_list}, file)
+    policy_list = [p.asDict() for p in policies.records()]
+    if not args.no_yaml:
+        with profiler.stage('yaml') as stage:
+            import yaml
+            with open('out.yml', 'w') as file:
+                yaml.dump({'acl': policy_list}, file)
+                stage.bytes = file.tell()
+            stage.items = len(policy_list)
 
     # Write to csv         
-    with open(outfilename, 'w') as csvfile:
+    with profiler.stage('csv') as stage, open(outfilename, 'w') as csvfile:
         writer = csv.DictWriter(csvfile, lineterminator='\n', fieldnames=columns)
         writer.writeheader()
         for data in policy_list:
-            writer.writerow(data)
\ No newline at end of file
+            writer.writerow(data)
+        stage.items = len(policy_list)
+        stage.bytes = csvfile.tell()
+
+    if args.columnar:
+        from columnar_export import columnarWriter
+        with profiler.stage('columnar') as stage, \
+                columnarWriter(args.columnar, columns) as columnar:
+            columnar.writePolicies(policies.records())
+            stage.items = columnar.written
+
+    if args.profile:
+        with open(args.profile, 'w') as profile:
+            profiler.write(profile)
\ No newline at end of file
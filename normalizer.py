@@ -0,0 +1,524 @@
+"""
+Copyright 2016-2021 Maen Artimy
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import itertools
+from collections import namedtuple
+
+from definitions import RField
+
+# Converts the parsed policies of the IOS, ASA and FortiGate parsers into
+# rules with comparable fields:
+#   addresses are AddrMask(value, mask) where mask holds the bits that must match,
+#   ports are tuples of (low, high) ranges,
+#   protocols are names, where 'ip' matches any protocol,
+#   names that cannot be resolved (objects, interfaces) are kept as strings,
+#   and so are IPv6 addresses: 'any6' is within 'any' but apart from IPv4 addresses.
+
+AddrMask = namedtuple('AddrMask', 'value mask')
+Rule = namedtuple(
+    'Rule', 'acl order action protocol src srcport dst dstport')
+
+FULL_MASK = 0xFFFFFFFF
+ANY_ADDRESS = AddrMask(0, 0)
+ANY6_ADDRESS = 'any6'
+ANY_PORT = ((0, 65535),)
+ANY_PROTOCOL = 'ip'
+
+# Protocols whose ASA rules may have port arguments, and the operators of these arguments
+ASA_PORT_PROTOCOLS = ('tcp', 'udp', 'sctp')
+# ASA addresses that are a single word
+ASA_ANY_ADDRESSES = ('any', 'any4', 'any6')
+ASA_PORT_OPERATORS = (['eq'], ['neq'], ['gt'], ['lt'], ['range'])
+
+# Options of IOS rules that do not change the packets they match
+IOS_LOG_OPTIONS = ('log', 'log-input')
+
+# Largest number of free bits of a non-contiguous mask expanded into prefixes
+PREFIX_LIMIT = 8
+
+# Port names accepted by Cisco IOS and ASA
+PORT_NAMES = {
+    'aol': 5190, 'bgp': 179, 'biff': 512, 'bootpc': 68, 'bootps': 67,
+    'chargen': 19, 'citrix-ica': 1494, 'cmd': 514, 'ctiqbe': 2748,
+    'daytime': 13, 'discard': 9, 'dnsix': 195, 'domain': 53, 'echo': 7,
+    'exec': 512, 'finger': 79, 'ftp': 21, 'ftp-data': 20, 'gopher': 70,
+    'h323': 1720, 'hostname': 101, 'http': 80, 'https': 443, 'ident': 113,
+    'imap4': 143, 'irc': 194, 'isakmp': 500, 'kerberos': 750, 'klogin': 543,
+    'kshell': 544, 'ldap': 389, 'ldaps': 636, 'login': 513, 'lotusnotes': 1352,
+    'lpd': 515, 'mobile-ip': 434, 'nameserver': 42, 'netbios-dgm': 138,
+    'netbios-ns': 137, 'netbios-ss': 139, 'netbios-ssn': 139, 'nntp': 119,
+    'ntp': 123, 'pcanywhere-data': 5631, 'pim-auto-rp': 496, 'pop2': 109,
+    'pop3': 110, 'pptp': 1723, 'radius': 1645, 'radius-acct': 1646,
+    'rip': 520, 'rsh': 514, 'rtsp': 554, 'sip': 5060, 'smtp': 25,
+    'snmp': 161, 'snmptrap': 162, 'sqlnet': 1521, 'ssh': 22,
+    'sunrpc': 111, 'syslog': 514, 'tacacs': 49, 'talk': 517, 'telnet': 23,
+    'tftp': 69, 'time': 37, 'uucp': 540, 'who': 513, 'whois': 43,
+    'www': 80, 'xdmcp': 177,
+}
+
+# FortiGate predefined services
+FG_SERVICES = {
+    'ALL': (ANY_PROTOCOL, ANY_PORT),
+    'ALL_TCP': ('tcp', ANY_PORT),
+    'ALL_UDP': ('udp', ANY_PORT),
+    'ALL_ICMP': ('icmp', ANY_PORT),
+}
+
+
+def ip2int(text):
+    """
+    Convert a dotted IPv4 address to an integer. Returns None if text is not an address.
+    """
+
+    parts = text.split('.')
+    if len(parts) != 4:
+        return None
+    value = 0
+    for part in parts:
+        if not part.isascii() or not part.isdigit() or int(part) > 255:
+            return None
+        value = (value << 8) | int(part)
+    return value
+
+
+def int2ip(value):
+    """
+    Convert an integer to a dotted IPv4 address.
+    """
+
+    return '.'.join(str((value >> shift) & 0xFF) for shift in (24, 16, 8, 0))
+
+
+def addressBounds(addr):
+    """
+    Returns the lowest and highest address matched by an AddrMask.
+    Non-contiguous masks are bounded by the smallest enclosing interval.
+    """
+
+    low = addr.value & addr.mask
+    return low, low | (~addr.mask & FULL_MASK)
+
+
+def prefixMask(length):
+    """
+    Returns the network mask of a prefix length.
+    """
+
+    return (FULL_MASK << (32 - length)) & FULL_MASK
+
+
+def addressPrefixes(addr, limit=PREFIX_LIMIT):
+    """
+    Returns the CIDR prefixes matched by an AddrMask, as sorted (value, length) pairs.
+    A non-contiguous mask matches one prefix per combination of the free bits above
+    its last matched bit; when there are more than limit such bits, the single
+    enclosing prefix is returned instead.
+    """
+
+    if not addr.mask:
+        return [(0, 0)]
+    length = 32 - ((addr.mask & -addr.mask).bit_length() - 1)
+    value = addr.value & addr.mask
+    holes = prefixMask(length) & ~addr.mask
+    if not holes:
+        return [(value, length)]
+    if bin(holes).count('1') > limit:
+        lead = 32 - (~addr.mask & FULL_MASK).bit_length()
+        return [(value & prefixMask(lead), lead)]
+    starts = [value]
+    for bit in (1 << b for b in range(32) if holes >> b & 1):
+        starts += [s | bit for s in starts]
+    return [(s, length) for s in sorted(starts)]
+
+
+def wildcardAddress(ip, wildcard):
+    """
+    Build an AddrMask from an address and a Cisco wildcard (inverse mask).
+    """
+
+    value, wild = ip2int(ip), ip2int(wildcard)
+    if value is None or wild is None:
+        return f"{ip} {wildcard}"
+    mask = ~wild & FULL_MASK
+    return AddrMask(value & mask, mask)
+
+
+def netmaskAddress(ip, netmask):
+    """
+    Build an AddrMask from an address and a network mask.
+    """
+
+    value, mask = ip2int(ip), ip2int(netmask)
+    if value is None or mask is None:
+        return f"{ip} {netmask}"
+    return AddrMask(value & mask, mask)
+
+
+def hostAddress(ip):
+    """
+    Build an AddrMask that matches a single host.
+    """
+
+    value = ip2int(ip)
+    return ip if value is None else AddrMask(value, FULL_MASK)
+
+
+def iosAddress(text):
+    """
+    Normalize an IOS address as formatted by ios_policy_parser:
+    'any', 'a.b.c.d' (host), 'a.b.c.d/w.x.y.z' or 'a.b.c.d w.x.y.z'.
+    """
+
+    tokens = text.replace('/', ' ').split()
+    if not tokens or tokens == ['any']:
+        return ANY_ADDRESS
+    if len(tokens) == 1:
+        return hostAddress(tokens[0])
+    return wildcardAddress(tokens[0], tokens[1])
+
+
+def asaAddress(text):
+    """
+    Normalize an ASA address as formatted by the ASA parser:
+    'any', 'any4', 'any6', 'host a.b.c.d', 'a.b.c.d m.m.m.m' or an object reference.
+    """
+
+    tokens = text.split()
+    if tokens[:1] == ['any6']:
+        return ANY6_ADDRESS
+    if not tokens or tokens[0] in ('any', 'any4'):
+        return ANY_ADDRESS
+    if tokens[0] == 'host' and len(tokens) == 2:
+        return hostAddress(tokens[1])
+    if len(tokens) == 2 and ip2int(tokens[0]) is not None:
+        return netmaskAddress(tokens[0], tokens[1])
+    return text
+
+
+def fgAddress(text):
+    """
+    Normalize a FortiGate address name. Only 'all' has a known value.
+    """
+
+    return ANY_ADDRESS if text in ('', 'all') else text
+
+
+def portNumber(text):
+    """
+    Convert a port number or name to an integer. Returns None if unknown.
+    """
+
+    if text.isdigit():
+        return int(text)
+    return PORT_NAMES.get(text)
+
+
+def portRanges(op, args):
+    """
+    Build port ranges from an operator (eq, neq, gt, lt, range) and its arguments.
+    Returns the original text if a port name is unknown.
+    """
+
+    values = [portNumber(a) for a in args]
+    if None in values or not values:
+        return ' '.join([op] + args)
+    if op == 'eq':
+        return ((values[0], values[0]),)
+    if op == 'gt':
+        return ((values[0] + 1, 65535),) if values[0] < 65535 else ()
+    if op == 'lt':
+        return ((0, values[0] - 1),) if values[0] > 0 else ()
+    if op == 'neq':
+        return tuple(r for r in ((0, values[0] - 1), (values[0] + 1, 65535))
+                     if r[0] <= r[1])
+    if op == 'range' and len(values) == 2:
+        return ((min(values), max(values)),)
+    return ' '.join([op] + args)
+
+
+def iosPort(text):
+    """
+    Normalize an IOS port as formatted by ios_policy_parser:
+    'any', 'www' (eq), 'gt-1023', '10000-10010' (range) or the ' ' joined standard forms.
+    """
+
+    tokens = text.replace('-', ' ').split()
+    if not tokens or tokens == ['any']:
+        return ANY_PORT
+    if tokens[0] in ('gt', 'lt', 'neq'):
+        return portRanges(tokens[0], tokens[1:])
+    if len(tokens) == 2:
+        return portRanges('range', tokens)
+    return portRanges('eq', tokens)
+
+
+def iosOptions(notes):
+    """
+    Returns the options of an IOS rule that narrow the packets it matches, such
+    as an ICMP type or 'established', without its logging options.
+    """
+
+    return ' '.join(w for w in notes.split() if w not in IOS_LOG_OPTIONS)
+
+
+def asaPort(text):
+    """
+    Normalize an ASA port argument such as 'eq https' or 'range 1000 2000'.
+    """
+
+    tokens = text.split()
+    if not tokens:
+        return ANY_PORT
+    if tokens[0] in ('eq', 'neq', 'gt', 'lt', 'range'):
+        return portRanges(tokens[0], tokens[1:])
+    return text
+
+
+def asaFieldText(text):
+    """
+    Read the action, protocol, addresses and ports of an extended ASA rule from
+    its text, with or without the keyword 'access-list', as the ASA grammar does
+    not keep every address and port. Returns the six fields as text, with ''
+    for a missing port, and the words that follow them, or None, None.
+    """
+
+    words = text.split()
+    if words[:1] == ['access-list']:
+        words = words[1:]
+    if words[1:2] == ['line']:
+        words = words[:1] + words[3:]
+    if len(words) < 4 or words[1] != 'extended':
+        return None, None
+    fields, rest = words[2:4], words[4:]
+    for position in ('src', 'dst'):
+        # An IPv6 prefix is a single word, such as 2001:db8::/32
+        if rest and (rest[0] in ASA_ANY_ADDRESSES or ':' in rest[0]):
+            addr, rest = rest[0], rest[1:]
+        elif len(rest) > 1:
+            addr, rest = ' '.join(rest[:2]), rest[2:]
+        else:
+            return None, None
+        n = {'eq': 2, 'lt': 2, 'gt': 2, 'neq': 2, 'range': 3}.get(rest[0], 0) if rest else 0
+        # A service object group after the destination holds its ports
+        if position == 'dst' and rest[:1] == ['object-group']:
+            n = 2
+        fields += [addr, ' '.join(rest[:n])]
+        rest = rest[n:]
+    return fields, rest
+
+
+def asaFields(text):
+    """
+    Read the fields of an extended ASA rule from its text, as asaFieldText does.
+    Returns the fields, normalized as in a Rule, and the words that follow
+    them, or None, None.
+    """
+
+    fields, rest = asaFieldText(text)
+    if fields is None:
+        return None, None
+    return fields[:2] + [asaAddress(fields[2]), asaPort(fields[3]),
+                         asaAddress(fields[4]), asaPort(fields[5])], rest
+
+
+def fgService(text):
+    """
+    Normalize a FortiGate service name into a protocol and port ranges.
+    """
+
+    return FG_SERVICES.get(text, (ANY_PROTOCOL, text))
+
+
+def iosRules(policies):
+    """
+    Convert policies returned by config_parser.ios_policy_parser into rules.
+    Remarks and unparsed lines (None) are skipped.
+    Options that narrow a rule, such as an ICMP type or 'established', are kept
+    as text in place of a port that is 'any' (the destination port, else the
+    source port), so the rule is within the same rule without the options but
+    only equal to the rules with the same options.
+    """
+
+    rules = []
+    orders = {}
+    for p in policies:
+        if p is None or not p.get('action'):
+            continue
+        acl = p.get('name')
+        orders[acl] = orders.get(acl, 0) + 1
+        srcport, dstport = iosPort(p.get('srcport', 'any')), iosPort(p.get('dstport', 'any'))
+        options = iosOptions(p.get('notes', ''))
+        if options and dstport == ANY_PORT:
+            dstport = options
+        elif options and srcport == ANY_PORT:
+            srcport = options
+        elif options:
+            dstport = f"{p.get('dstport')} {options}"
+        rules.append(Rule(
+            acl, orders[acl], p.get('action'), p.get('protocol', ANY_PROTOCOL),
+            iosAddress(p.get('srcip', 'any')), srcport,
+            iosAddress(p.get('dstip', 'any')), dstport))
+    return rules
+
+
+def asaRules(policies, lines=None):
+    """
+    Convert the policies of asa_policy_parser_lite, such as the rows of
+    its policyTable, into rules. Remarks, inactive policies and unparsed lines
+    (None) are skipped.
+    lines are the texts the policies were parsed from, one per policy, as
+    policyLineStream yields them. The ASA grammar reads the destination of a
+    TCP, UDP or SCTP rule with ports as the port argument, so the addresses and
+    ports of these rules are read from their text. Without lines, an address
+    that is a port argument is kept as text with the name of its rule, which
+    is only equal to itself.
+    """
+
+    rules = []
+    orders = {}
+    if lines is None:
+        lines = itertools.repeat(None)
+    for p, text in zip(policies, lines):
+        if p is None or not p.get('action') or p.get('inactive'):
+            continue
+        acl = p.get('name')
+        orders[acl] = orders.get(acl, 0) + 1
+        # ICMP types take the place of the destination port
+        dstport = p.get('icmp_opt') or asaPort(p.get('dstport', ''))
+        rule = Rule(
+            acl, orders[acl], p.get('action'), p.get('protocol', ANY_PROTOCOL),
+            asaAddress(p.get('srcaddr', 'any')), asaPort(p.get('srcport', '')),
+            asaAddress(p.get('dstaddr', 'any')), dstport)
+        if rule.protocol in ASA_PORT_PROTOCOLS and 'user' not in p:
+            fields = asaFields(text)[0] if text is not None else None
+            if fields is not None and fields[:2] == [rule.action, rule.protocol]:
+                rule = rule._replace(src=fields[2], srcport=fields[3], dst=fields[4],
+                                     dstport=fields[5])
+            elif str(p.get('dstaddr', '')).split()[:1] in ASA_PORT_OPERATORS:
+                rule = rule._replace(dst=f"{acl}:{orders[acl]}:{p.get('dstaddr')}")
+        rules.append(rule)
+    return rules
+
+
+def fgRules(policies):
+    """
+    Convert the parsed policies of each section of fg_policy_parser_lite into rules.
+    Policies are grouped by section and interface pair, which is the scope
+    in which FortiGate policies are compared.
+    """
+
+    rules = []
+    orders = {}
+    for x, sec in enumerate(policies):
+        for p in sec:
+            acl = f"{x}:{p.get('srcintf', '')}->{p.get('dstintf', '')}"
+            orders[acl] = orders.get(acl, 0) + 1
+            protocol, ports = fgService(p.get('service', 'ALL'))
+            rules.append(Rule(
+                acl, orders[acl], p.get('action', 'deny'), protocol,
+                fgAddress(p.get('srcaddr', 'all')), ANY_PORT,
+                fgAddress(p.get('dstaddr', 'all')), ports))
+    return rules
+
+
+def isAny(value):
+    """
+    Returns True if value matches everything.
+    """
+
+    return value == ANY_ADDRESS or value == ANY_PORT
+
+
+def addressRelation(a, b):
+    """
+    Compare two AddrMask values.
+    """
+
+    if (a.value ^ b.value) & a.mask & b.mask:
+        return RField.UNEQUAL
+    if a == b:
+        return RField.EQUAL
+    if b.mask & ~a.mask == 0:
+        return RField.SUBSET
+    if a.mask & ~b.mask == 0:
+        return RField.SUPERSET
+    return RField.OVERLAP
+
+
+def covers(ranges, low, high):
+    """
+    Returns True if the union of ranges covers the interval [low, high].
+    """
+
+    for lo, hi in sorted(ranges):
+        if lo > low:
+            return False
+        if hi >= low:
+            low = hi + 1
+        if low > high:
+            return True
+    return low > high
+
+
+def portRelation(a, b):
+    """
+    Compare two tuples of port ranges.
+    """
+
+    if not any(alo <= bhi and blo <= ahi for alo, ahi in a for blo, bhi in b):
+        return RField.UNEQUAL
+    inB = all(covers(b, lo, hi) for lo, hi in a)
+    inA = all(covers(a, lo, hi) for lo, hi in b)
+    if inA and inB:
+        return RField.EQUAL
+    if inB:
+        return RField.SUBSET
+    if inA:
+        return RField.SUPERSET
+    return RField.OVERLAP
+
+
+def fieldRelation(a, b):
+    """
+    Compare two normalized field values.
+    Unresolved names are only known to be equal to themselves.
+    """
+
+    if isinstance(a, AddrMask) and isinstance(b, AddrMask):
+        return addressRelation(a, b)
+    if isinstance(a, tuple) and isinstance(b, tuple):
+        return portRelation(a, b)
+    if a == b:
+        return RField.EQUAL
+    if isAny(b):
+        return RField.SUBSET
+    if isAny(a):
+        return RField.SUPERSET
+    return RField.UNEQUAL
+
+
+def protocolRelation(a, b):
+    """
+    Compare two protocol names.
+    """
+
+    if a == b:
+        return RField.EQUAL
+    if b == ANY_PROTOCOL:
+        return RField.SUBSET
+    if a == ANY_PROTOCOL:
+        return RField.SUPERSET
+    return RField.UNEQUAL
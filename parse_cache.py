@@ -0,0 +1,141 @@
+"""
+Copyright 2016-2021 Maen Artimy
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import json
+import sqlite3
+import hashlib
+
+# An on-disk cache of parsed policies.
+# Each entry is keyed by a hash of the text of one policy (a FortiGate
+# 'edit ... next' block or an 'access-list' line) and holds the parsed
+# policies as a JSON list of dictionaries. The least recently used
+# entries are evicted as soon as a new entry makes the cache grow beyond
+# its size limit.
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class ParseCache:
+    """
+    Size-bounded LRU cache of parse results stored in an SQLite file.
+    """
+
+    def __init__(self, path, maxBytes=DEFAULT_MAX_BYTES):
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS entries ("
+                        "key BLOB PRIMARY KEY, value TEXT, size INTEGER, used INTEGER)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS entries_used ON entries (used)")
+        self.maxBytes = maxBytes
+        self.tick, self.size = self.db.execute(
+            "SELECT COALESCE(MAX(used), 0), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    @staticmethod
+    def key(namespace, text):
+        """
+        Returns the key of a policy text. namespace separates the parsers and
+        their grammar versions, so a grammar change never reuses old results.
+        """
+
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(namespace.encode())
+        digest.update(b'\0')
+        digest.update(text.encode())
+        return digest.digest()
+
+    def get(self, key):
+        """
+        Returns the cached policies of key, or None.
+        """
+
+        row = self.db.execute(
+            "SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.tick += 1
+        self.db.execute("UPDATE entries SET used = ? WHERE key = ?", (self.tick, key))
+        return json.loads(row[0])
+
+    def put(self, key, policies):
+        """
+        Store a list of policies (dictionaries) under key, and evict the
+        least recently used entries if the cache no longer fits in maxBytes.
+        """
+
+        value = json.dumps(policies)
+        old = self.db.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+        self.tick += 1
+        self.db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                        (key, value, len(value) + len(key), self.tick))
+        self.size += len(value) + len(key) - (old[0] if old else 0)
+        if self.size > self.maxBytes:
+            self.evict()
+
+    def cached(self, parse, namespace):
+        """
+        Wrap a parse function that returns a list of ParseResults or dictionaries.
+        The wrapped function returns the same policies as dictionaries and
+        only calls parse for texts that are not in the cache.
+        """
+
+        def cachedParse(text):
+            key = self.key(namespace, text)
+            policies = self.get(key)
+            if policies is None:
+                policies = [p if isinstance(p, dict) else p.asDict() for p in parse(text)]
+                self.put(key, policies)
+            return policies
+
+        return cachedParse
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits in maxBytes.
+        """
+
+        if self.size <= self.maxBytes:
+            return
+        victims = []
+        for key, size in self.db.execute("SELECT key, size FROM entries ORDER BY used"):
+            if self.size <= self.maxBytes:
+                break
+            victims.append((key,))
+            self.size -= size
+        self.db.executemany("DELETE FROM entries WHERE key = ?", victims)
+        self.evicted += len(victims)
+
+    def close(self):
+        """
+        Evict, save and close the cache.
+        """
+
+        self.evict()
+        self.db.commit()
+        self.db.close()
+
+    def report(self):
+        """
+        Generate a report of the cache statistics.
+        """
+
+        total = self.hits + self.misses
+        rate = 100 * self.hits / total if total else 0
+        return f"Cache: {self.hits} hits, {self.misses} misses ({rate:.1f}% hit rate), " \
+            f"{self.evicted} evicted.\n"
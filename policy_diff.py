@@ -0,0 +1,428 @@
+"""
+Copyright 2016-2021 Maen Artimy
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import sys
+import json
+import bisect
+import argparse
+from collections import namedtuple, defaultdict, deque
+
+import asa_policy_parser_lite as asa
+import fg_policy_parser_lite as fg
+import config_parser
+from normalizer import ASA_PORT_PROTOCOLS, asaFieldText
+from parse_cache import ParseCache
+
+# Usage: python3 policy_diff.py {fg|asa|ios} old_config new_config [--json] [--cache PATH]
+# Reports the policies added, removed, modified and moved between two snapshots
+# of the same device.
+#
+# FortiGate policies are matched by uuid, or by section and policy number.
+# ASA and IOS entries are identified by their access list name and their content:
+# entries of an access list with the same fields are matched first, and the
+# remaining entries between two matched ones are paired as modified, preferring
+# the ones that share the most fields. ASA line numbers are positions, which
+# change when a line is inserted, so they are not compared. An entry is moved
+# when its order relative to the other matched entries of its group changed.
+
+ADDED, REMOVED, MODIFIED, MOVED = 'added', 'removed', 'modified', 'moved'
+
+# group is the FortiGate section or the access list name, position the order
+# of the policy in its group (from 1) and key its identity, if any.
+Entry = namedtuple('Entry', 'group position key policy')
+
+# fields maps each changed field to its (old, new) values
+Change = namedtuple('Change', 'kind old new fields')
+
+# Largest number of unmatched entries between two matched ones that are
+# paired by similarity; longer runs are paired in order.
+SIMILARITY_WINDOW = 64
+
+
+def memoized(parse):
+    """
+    Wrap a parse function so each distinct block of text is parsed once.
+    Blocks that are the same in both snapshots reuse the first result.
+    """
+
+    results = {}
+
+    def parseOnce(text):
+        policies = results.get(text)
+        if policies is None:
+            policies = results[text] = [p if isinstance(p, dict) else p.asDict()
+                                        for p in parse(text)]
+        return policies
+
+    return parseOnce
+
+
+def fgEntries(lines, parse):
+    """
+    Returns the entries of the FortiGate policies, keyed by uuid or number.
+    """
+
+    entries = []
+    positions = defaultdict(int)
+    for section, block in fg.policyStream(lines):
+        for policy in parse(block):
+            positions[section] += 1
+            key = ('uuid', policy['uuid']) if policy.get('uuid') \
+                else ('num', section, policy.get('num'))
+            entries.append(Entry(section, positions[section], key, policy))
+    return entries
+
+
+def asaPolicy(policy, line):
+    """
+    Returns a copy of a parsed ASA policy without its line number. The ASA
+    grammar does not keep the ports of TCP, UDP and SCTP rules, so their
+    addresses and ports are read from the text of the line.
+    """
+
+    policy = {f: v for f, v in policy.items() if f != 'line'}
+    if policy.get('protocol') in ASA_PORT_PROTOCOLS and 'user' not in policy:
+        fields, _ = asaFieldText(line)
+        if fields is not None and fields[:2] == [policy.get('action'), policy['protocol']]:
+            for f, value in zip(('srcaddr', 'srcport', 'dstaddr', 'dstport'), fields[2:]):
+                if value:
+                    policy[f] = value
+                else:
+                    policy.pop(f, None)
+    return policy
+
+
+def asaEntries(lines, parse):
+    """
+    Returns the entries of the ASA access lists. Lines that were not parsed are skipped.
+    """
+
+    entries = []
+    positions = defaultdict(int)
+    for line in asa.policyLineStream(lines):
+        policies = parse(line)
+        if policies:
+            policy = asaPolicy(policies[0], line)
+            name = policy.get('name')
+            positions[name] += 1
+            entries.append(Entry(name, positions[name], None, policy))
+    return entries
+
+
+def iosEntries(lines, parse):
+    """
+    Returns the entries of the IOS access lists.
+    """
+
+    entries = []
+    positions = defaultdict(int)
+    for line in lines:
+        if not line.lstrip().startswith('access-list'):
+            continue
+        for policy in parse(line):
+            name = policy.get('name')
+            positions[name] += 1
+            entries.append(Entry(name, positions[name], None, policy))
+    return entries
+
+
+def iosParser(line):
+    return list(config_parser.ios_policy_records([line]))
+
+
+VENDORS = {
+    'fg': (fgEntries, fg.policyParser, fg.GRAMMAR_VERSION),
+    'asa': (asaEntries, asa.policyParser, asa.GRAMMAR_VERSION),
+    'ios': (iosEntries, iosParser, 'ios-1'),
+}
+
+
+def snapshotEntries(vendor, lines, parse=None):
+    """
+    Parse a configuration into entries. parse replaces the parser of the vendor,
+    for example to share results between snapshots.
+    """
+
+    entriesOf, defaultParse, _ = VENDORS[vendor]
+    return entriesOf(lines, parse or memoized(defaultParse))
+
+
+def content(entry):
+    """
+    Returns a hashable summary of the fields of an entry.
+    """
+
+    return tuple(sorted((f, tuple(v) if isinstance(v, list) else v)
+                        for f, v in entry.policy.items()))
+
+
+def fieldChanges(old, new):
+    """
+    Returns the fields that differ between two policies, as {field: (old, new)}.
+    """
+
+    fields = {}
+    for f in set(old) | set(new):
+        if old.get(f) != new.get(f):
+            fields[f] = (old.get(f), new.get(f))
+    return fields
+
+
+def matchByKey(old, new):
+    """
+    Pair the entries that have the same key. Returns the pairs and the unmatched entries.
+    """
+
+    byKey = {e.key: e for e in old}
+    pairs, added = [], []
+    for e in new:
+        match = byKey.pop(e.key, None)
+        if match is None:
+            added.append(e)
+        else:
+            pairs.append((match, e))
+    matched = {id(o) for o, _ in pairs}
+    return pairs, [e for e in old if id(e) not in matched], added
+
+
+def similarity(a, b):
+    """
+    Returns the number of fields with the same value in two policies.
+    """
+
+    return sum(1 for f, v in a.policy.items() if b.policy.get(f) == v)
+
+
+def pairGap(olds, news):
+    """
+    Pair the unmatched entries found between the same two matched entries.
+    Returns the pairs and the entries left unpaired.
+    """
+
+    if len(olds) > SIMILARITY_WINDOW or len(news) > SIMILARITY_WINDOW:
+        n = min(len(olds), len(news))
+        return list(zip(olds, news)), olds[n:], news[n:]
+    candidates = sorted(((similarity(o, e), i, j) for i, o in enumerate(olds)
+                         for j, e in enumerate(news)), key=lambda c: (-c[0], c[1], c[2]))
+    usedOld, usedNew, pairs = set(), set(), []
+    for score, i, j in candidates:
+        if i in usedOld or j in usedNew:
+            continue
+        # Entries that share less than half of their fields are different policies
+        if 2 * score < max(len(olds[i].policy), len(news[j].policy)):
+            break
+        usedOld.add(i)
+        usedNew.add(j)
+        pairs.append((olds[i], news[j]))
+    return (pairs, [o for i, o in enumerate(olds) if i not in usedOld],
+            [e for j, e in enumerate(news) if j not in usedNew])
+
+
+def matchByContent(old, new):
+    """
+    Pair the entries of each group with the same content, then pair the remaining
+    entries found between the same matched entries.
+    Returns the pairs and the unmatched entries.
+    """
+
+    index = defaultdict(deque)
+    for e in old:
+        index[e.group, content(e)].append(e)
+    pairs = []
+    anchors = {}
+    for e in new:
+        candidates = index.get((e.group, content(e)))
+        if candidates:
+            o = candidates.popleft()
+            pairs.append((o, e))
+            anchors[id(o)] = anchors[id(e)] = len(pairs)
+
+    # Entries in a gap share the last matched entry that precedes them in their group
+    gaps = defaultdict(lambda: ([], []))
+    for side, entries in ((0, old), (1, new)):
+        last = {}
+        for e in entries:
+            if id(e) in anchors:
+                last[e.group] = anchors[id(e)]
+            else:
+                gaps[e.group, last.get(e.group, 0)][side].append(e)
+
+    removed, added = [], []
+    for olds, news in gaps.values():
+        gapPairs, gapRemoved, gapAdded = pairGap(olds, news)
+        pairs += gapPairs
+        removed += gapRemoved
+        added += gapAdded
+    return pairs, removed, added
+
+
+def movedPairs(pairs):
+    """
+    Returns the pairs whose relative order changed. Within each group, the pairs
+    that keep their order are the longest increasing subsequence of the old
+    positions taken in the new order; the others moved, unless they kept their
+    position. Pairs that changed group always moved.
+    """
+
+    moved = []
+    groups = defaultdict(list)
+    for o, e in pairs:
+        if o.group != e.group:
+            moved.append((o, e))
+        else:
+            groups[e.group].append((o, e))
+    for members in groups.values():
+        members.sort(key=lambda p: p[1].position)
+        tails, tailIndex, previous = [], [], [None] * len(members)
+        for i, (o, _) in enumerate(members):
+            k = bisect.bisect_left(tails, o.position)
+            if k == len(tails):
+                tails.append(o.position)
+                tailIndex.append(i)
+            else:
+                tails[k] = o.position
+                tailIndex[k] = i
+            previous[i] = tailIndex[k - 1] if k else None
+        kept = set()
+        i = tailIndex[-1] if tailIndex else None
+        while i is not None:
+            kept.add(i)
+            i = previous[i]
+        moved += [(o, e) for i, (o, e) in enumerate(members)
+                  if i not in kept and o.position != e.position]
+    return moved
+
+
+def diffEntries(vendor, old, new):
+    """
+    Compare the entries of two snapshots. Returns a list of Changes:
+    removed, added, modified (with the changed fields) and moved policies.
+    """
+
+    if vendor == 'fg':
+        pairs, removed, added = matchByKey(old, new)
+    else:
+        pairs, removed, added = matchByContent(old, new)
+
+    changes = [Change(REMOVED, o, None, {}) for o in removed]
+    changes += [Change(ADDED, None, e, {}) for e in added]
+    for o, e in pairs:
+        fields = fieldChanges(o.policy, e.policy)
+        if fields:
+            changes.append(Change(MODIFIED, o, e, fields))
+    changes += [Change(MOVED, o, e, {}) for o, e in movedPairs(pairs)]
+    return changes
+
+
+def diffConfigs(vendor, oldLines, newLines, parse=None):
+    """
+    Parse two snapshots of a configuration and compare them. Blocks of text
+    that are the same in both snapshots are parsed once.
+    """
+
+    if parse is None:
+        parse = memoized(VENDORS[vendor][1])
+    return diffEntries(vendor, snapshotEntries(vendor, oldLines, parse),
+                       snapshotEntries(vendor, newLines, parse))
+
+
+def entryLabel(entry):
+    """
+    Describe where an entry is, e.g. 'section 0 policy 5' or 'acl 101 entry 3'.
+    """
+
+    if 'num' in entry.policy:
+        return f"section {entry.group} policy {entry.policy['num']}"
+    return f"acl {entry.group} entry {entry.position}"
+
+
+def changeReport(changes):
+    """
+    Generate a text report of the changes, one line per change and one
+    indented line per changed field.
+    """
+
+    st = ""
+    for c in changes:
+        if c.kind == ADDED:
+            st += f"+ {entryLabel(c.new)}: {c.new.policy}\n"
+        elif c.kind == REMOVED:
+            st += f"- {entryLabel(c.old)}: {c.old.policy}\n"
+        elif c.kind == MODIFIED:
+            st += f"~ {entryLabel(c.new)}:\n"
+            for f in sorted(c.fields):
+                old, new = c.fields[f]
+                st += f"    {f}: {old!r} -> {new!r}\n"
+        else:
+            st += f"> {entryLabel(c.new)} moved from position {c.old.position}"
+            st += f" to {c.new.position}\n" if c.old.group == c.new.group \
+                else f" of {c.old.group} to {c.new.position}\n"
+    return st
+
+
+def changesToJSON(changes):
+    """
+    Returns the changes as a list of JSON-serializable dictionaries.
+    """
+
+    def entry(e):
+        return None if e is None else {'group': e.group, 'position': e.position,
+                                       'policy': e.policy}
+
+    return [{'kind': c.kind, 'old': entry(c.old), 'new': entry(c.new),
+             'fields': {f: list(v) for f, v in c.fields.items()}} for c in changes]
+
+
+def summary(changes):
+    counts = {kind: 0 for kind in (ADDED, REMOVED, MODIFIED, MOVED)}
+    for c in changes:
+        counts[c.kind] += 1
+    return ", ".join(f"{n} {kind}" for kind, n in counts.items())
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(
+        description="Compare the policies of two snapshots of a device configuration.")
+    argparser.add_argument("vendor", choices=sorted(VENDORS))
+    argparser.add_argument("old", help="older configuration file")
+    argparser.add_argument("new", help="newer configuration file")
+    argparser.add_argument("--json", action="store_true",
+                           help="print the changes as JSON")
+    argparser.add_argument("--cache", metavar="PATH",
+                           help="reuse the results of unchanged policies from this cache file")
+    argparser.add_argument("--cache-size", type=int, default=256, metavar="MB",
+                           help="largest size of the cache file")
+    args = argparser.parse_intermixed_args()
+
+    _, parse, version = VENDORS[args.vendor]
+    cache = None
+    if args.cache:
+        cache = ParseCache(args.cache, args.cache_size * 1024 * 1024)
+        parse = cache.cached(parse, version)
+
+    with open(args.old, 'r') as oldfile, open(args.new, 'r') as newfile:
+        changes = diffConfigs(args.vendor, oldfile, newfile, memoized(parse))
+
+    if args.json:
+        json.dump(changesToJSON(changes), sys.stdout, indent=2)
+        print()
+    else:
+        print(changeReport(changes), end="")
+    report = f"Changes: {summary(changes)}.\n"
+    if cache:
+        cache.close()
+        report += cache.report()
+    print(report, file=sys.stderr)
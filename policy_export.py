@@ -0,0 +1,62 @@
+"""
+Copyright 2016-2021 Maen Artimy
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import csv
+
+
+class PolicyWriter:
+    """
+    Writes parsed policies to a CSV file as soon as they are available.
+    Fields are quoted when needed, and the written and failed policies are counted.
+    """
+
+    def __init__(self, outfile, columns):
+        self.writer = csv.writer(outfile, lineterminator='\n')
+        self.columns = columns
+        self.written = 0
+        self.failed = 0
+
+    def writeHeader(self):
+        """
+        Write the column names.
+        """
+
+        self.writer.writerow(self.columns)
+
+    def writePolicy(self, policy):
+        """
+        Write one policy. policy is any mapping with a get method,
+        such as a dict or a pyparsing ParseResults.
+        """
+
+        self.writer.writerow([policy.get(att, '') for att in self.columns])
+        self.written += 1
+
+    def writePolicies(self, policies):
+        """
+        Write each policy of an iterable.
+        """
+
+        for policy in policies:
+            self.writePolicy(policy)
+
+    def writeFailure(self, marker):
+        """
+        Write a row holding only marker in place of a policy that could not be parsed.
+        """
+
+        self.writer.writerow([marker])
+        self.failed += 1
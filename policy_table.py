@@ -0,0 +1,189 @@
+"""
+Copyright 2016-2021 Maen Artimy
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from array import array
+
+# A column-oriented store of parsed policies.
+# Every value is interned once in a string pool and each column holds
+# the pool indexes of its values in an array of unsigned integers.
+# Index 0 is reserved for missing fields; empty strings have their own index.
+
+
+class PolicyRecord:
+    """
+    A read-only view of one policy in a PolicyTable.
+    It behaves like the dictionaries produced by the parsers.
+    """
+
+    __slots__ = ('table', 'row')
+
+    def __init__(self, table, row):
+        self.table = table
+        self.row = row
+
+    def get(self, field, default=''):
+        column = self.table.columns.get(field)
+        if column is None:
+            return default
+        value = column[self.row]
+        return self.table.strings[value] if value else default
+
+    def __getitem__(self, field):
+        value = self.get(field, None)
+        if value is None:
+            raise KeyError(field)
+        return value
+
+    def __contains__(self, field):
+        return self.get(field, None) is not None
+
+    def keys(self):
+        return [f for f, column in self.table.columns.items() if column[self.row]]
+
+    def asDict(self):
+        return {f: self.table.strings[column[self.row]]
+                for f, column in self.table.columns.items() if column[self.row]}
+
+    @property
+    def section(self):
+        return self.table.sections[self.row]
+
+    def __repr__(self):
+        return f"PolicyRecord({self.asDict()})"
+
+
+class PolicyTable:
+    """
+    Column-oriented store of parsed policies shared by the parsers, the exporters
+    and the analyses. Rows are added with append() and read back as PolicyRecord views.
+    Policies that could not be parsed are kept as failed rows, so the order of the
+    configuration is preserved.
+    """
+
+    __slots__ = ('strings', 'index', 'columns', 'sections', 'parsed')
+
+    def __init__(self):
+        self.strings = [None]
+        self.index = {}
+        self.columns = {}
+        self.sections = array('I')
+        self.parsed = bytearray()
+
+    def __len__(self):
+        return len(self.parsed)
+
+    def intern(self, value):
+        """
+        Returns the pool index of value, adding it to the pool if needed.
+        """
+
+        if not isinstance(value, str):
+            value = ' '.join(value) if isinstance(value, (list, tuple)) else str(value)
+        i = self.index.get(value)
+        if i is None:
+            i = self.index[value] = len(self.strings)
+            self.strings.append(value)
+        return i
+
+    def column(self, field):
+        """
+        Returns the array of a column, creating it if needed.
+        """
+
+        column = self.columns.get(field)
+        if column is None:
+            column = self.columns[field] = array('I', bytes(4 * len(self)))
+        return column
+
+    def append(self, policy, section=0):
+        """
+        Add a policy. policy is any mapping with keys and get methods,
+        such as a dict, a PolicyRecord or a pyparsing ParseResults.
+        """
+
+        row = len(self)
+        for field in policy.keys():
+            self.column(field)
+            value = policy.get(field)
+            if value is not None:
+                self.columns[field].append(self.intern(value))
+        for column in self.columns.values():
+            if len(column) == row:
+                column.append(0)
+        self.sections.append(section)
+        self.parsed.append(1)
+
+    def appendFailure(self, section=0):
+        """
+        Add a row for a policy that could not be parsed.
+        """
+
+        for column in self.columns.values():
+            column.append(0)
+        self.sections.append(section)
+        self.parsed.append(0)
+
+    def extend(self, policies, section=0):
+        """
+        Add each policy of an iterable. None stands for a policy that was not parsed.
+        """
+
+        for policy in policies:
+            if policy is None:
+                self.appendFailure(section)
+            else:
+                self.append(policy, section)
+
+    def __getitem__(self, row):
+        if not 0 <= row < len(self):
+            raise IndexError(row)
+        return PolicyRecord(self, row) if self.parsed[row] else None
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield PolicyRecord(self, row) if self.parsed[row] else None
+
+    def records(self):
+        """
+        Returns the parsed policies, skipping failed rows.
+        """
+
+        return [PolicyRecord(self, row) for row in range(len(self)) if self.parsed[row]]
+
+    def bySection(self, count=None):
+        """
+        Returns a list with the parsed policies of each section, in order.
+        count is the number of sections, which includes sections without policies.
+        """
+
+        if count is None:
+            count = max(self.sections) + 1 if self.sections else 0
+        sections = [[] for _ in range(count)]
+        for row in range(len(self)):
+            if self.parsed[row]:
+                sections[self.sections[row]].append(PolicyRecord(self, row))
+        return sections
+
+    def fieldNames(self):
+        """
+        Returns the names of the columns that hold at least one value.
+        """
+
+        return [f for f, column in self.columns.items() if any(column)]
+
+    @property
+    def failed(self):
+        return len(self) - sum(self.parsed)
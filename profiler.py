@@ -0,0 +1,175 @@
+"""
+Copyright 2016-2021 Maen Artimy
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import json
+import time
+from contextlib import contextmanager
+
+# Opt-in instrumentation of the parse pipeline.
+# A Profiler records the wall time, the number of policies, the bytes processed
+# and the parse failures of each stage (section discovery, policy finding,
+# grammar matching, field-name collection, output), per section or VDOM.
+# It can also attribute time to the alternatives of a pyparsing expression,
+# such as the branches of the ASA policyDef.
+
+
+class StageRecord:
+    """
+    The measurements of one run of a stage.
+    """
+
+    __slots__ = ('name', 'section', 'seconds', 'items', 'bytes', 'failures')
+
+    def __init__(self, name, section=None, items=0, bytes=0, failures=0):
+        self.name = name
+        self.section = section
+        self.seconds = 0.0
+        self.items = items
+        self.bytes = bytes
+        self.failures = failures
+
+    def asDict(self):
+        return {'name': self.name, 'section': self.section,
+                'seconds': round(self.seconds, 6), 'items': self.items,
+                'bytes': self.bytes, 'failures': self.failures}
+
+
+class AlternativeRecord:
+    """
+    The attempts of one alternative of a pyparsing expression.
+    """
+
+    __slots__ = ('attempts', 'matches', 'failures', 'seconds', 'starts')
+
+    def __init__(self):
+        self.attempts = 0
+        self.matches = 0
+        self.failures = 0
+        self.seconds = 0.0
+        self.starts = []
+
+    def asDict(self):
+        return {'attempts': self.attempts, 'matches': self.matches,
+                'failures': self.failures, 'seconds': round(self.seconds, 6)}
+
+
+class Profiler:
+    """
+    Collects StageRecords and AlternativeRecords and reports them as JSON.
+    """
+
+    def __init__(self):
+        self.stages = []
+        self.alternatives = {}
+
+    @contextmanager
+    def stage(self, name, section=None, bytes=0):
+        """
+        Time the body of a with statement as a stage. The StageRecord is returned,
+        so the body can set the number of items and failures it handled.
+        """
+
+        record = StageRecord(name, section, bytes=bytes)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record.seconds = time.perf_counter() - start
+            self.stages.append(record)
+
+    def instrument(self, expr, label, names=None):
+        """
+        Attribute the time spent in each alternative of expr (a MatchFirst or an Or)
+        to label. names are the names of the alternatives, in order.
+        expr is modified, so it should not be shared with code that is not profiled.
+        """
+
+        # Streamlining merges nested alternations into one list of alternatives
+        expr.streamline()
+        alternatives = self.alternatives.setdefault(label, {})
+        for i, alt in enumerate(expr.exprs):
+            name = names[i] if names and i < len(names) else str(alt)
+            record = alternatives.setdefault(name, AlternativeRecord())
+            alt.set_debug_actions(*self._debugActions(record))
+        return expr
+
+    def instrumentNamed(self, expr, label, names):
+        """
+        Attribute the time spent in the sub-expressions of expr that were named
+        (with setName) in names to label, however deeply they are nested.
+        An expression that appears in several branches is counted in all of them.
+        """
+
+        alternatives = self.alternatives.setdefault(label, {})
+        for name in names:
+            alternatives.setdefault(name, AlternativeRecord())
+        seen = set()
+        pending = [expr]
+        while pending:
+            sub = pending.pop()
+            if id(sub) in seen:
+                continue
+            seen.add(id(sub))
+            if sub.customName in alternatives:
+                sub.set_debug_actions(*self._debugActions(alternatives[sub.customName]))
+            pending.extend(sub.recurse())
+        return expr
+
+    @staticmethod
+    def _debugActions(record):
+        def started(instring, loc, expr, cache_hit=False):
+            record.attempts += 1
+            record.starts.append(time.perf_counter())
+
+        def matched(instring, startloc, endloc, expr, toks, cache_hit=False):
+            record.matches += 1
+            record.seconds += time.perf_counter() - record.starts.pop()
+
+        def failed(instring, loc, expr, exc, cache_hit=False):
+            record.failures += 1
+            record.seconds += time.perf_counter() - record.starts.pop()
+
+        return started, matched, failed
+
+    def totals(self):
+        """
+        Returns the measurements of each stage summed over all sections.
+        """
+
+        totals = {}
+        for record in self.stages:
+            total = totals.setdefault(record.name, StageRecord(record.name))
+            total.seconds += record.seconds
+            total.items += record.items
+            total.bytes += record.bytes
+            total.failures += record.failures
+        return totals
+
+    def asDict(self):
+        return {
+            'stages': [record.asDict() for record in self.stages],
+            'totals': {name: total.asDict() for name, total in self.totals().items()},
+            'alternatives': {label: {name: record.asDict() for name, record in alts.items()}
+                             for label, alts in self.alternatives.items()},
+        }
+
+    def write(self, outfile):
+        """
+        Write the measurements to outfile as JSON.
+        """
+
+        json.dump(self.asDict(), outfile, indent=2)
+        outfile.write("\n")
@@ -0,0 +1,291 @@
+"""
+Copyright 2016-2021 Maen Artimy
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import sys
+import csv
+import bisect
+import argparse
+from collections import defaultdict
+
+from definitions import RField
+from normalizer import AddrMask, ANY_ADDRESS, ANY_PORT, ANY_PROTOCOL, FULL_MASK, \
+    addressPrefixes, prefixMask, ip2int, int2ip, iosAddress, iosPort, \
+    fieldRelation, protocolRelation
+
+# Usage: python3 rule_index.py {ios|asa|fg} config_file [--src PREFIX] [--dst PREFIX]
+#            [--sport PORTS] [--dport PORTS] [--protocol NAME] [--mode MODE]
+# Indexes the normalized rules of a configuration by source and destination
+# prefix, port ranges and protocol, and lists the rules that overlap, contain
+# or are contained in a query.
+#
+# Each dimension of the index only returns candidates; every candidate is then
+# compared with the query using the field relations of the normalizer, so
+# non-contiguous masks that were indexed by their enclosing prefix are exact.
+# Rules with a field that could not be normalized (an object name) are left out
+# of the queries on that field.
+
+DIMENSIONS = ['src', 'dst', 'srcport', 'dstport']
+
+# The relations of a rule field to the query field accepted by each mode
+MODES = {
+    'overlap': {RField.EQUAL, RField.SUBSET, RField.SUPERSET, RField.OVERLAP},
+    'contains': {RField.EQUAL, RField.SUPERSET},
+    'within': {RField.EQUAL, RField.SUBSET},
+}
+
+
+class PrefixIndex:
+    """
+    CIDR prefixes of rules, queried like a binary trie: the prefixes that contain
+    a query prefix are found in one hash table per prefix length (the path from
+    the root), and the prefixes inside it in a sorted array of prefix starts
+    (the subtree).
+    """
+
+    def __init__(self, items):
+        self.levels = [defaultdict(list) for _ in range(33)]
+        entries = []
+        for i, addr in items:
+            for value, length in addressPrefixes(addr):
+                self.levels[length][value].append(i)
+                entries.append((value, length, i))
+        entries.sort()
+        self.starts = [e[0] for e in entries]
+        self.entries = entries
+
+    def overlapping(self, addr):
+        """
+        Returns the rules with a prefix that overlaps addr, an AddrMask.
+        """
+
+        found = set()
+        for value, length in addressPrefixes(addr):
+            for shorter in range(length):
+                found.update(self.levels[shorter].get(value & prefixMask(shorter), ()))
+            last = value | (~prefixMask(length) & FULL_MASK)
+            lo = bisect.bisect_left(self.starts, value)
+            hi = bisect.bisect_right(self.starts, last)
+            found.update(i for _, n, i in self.entries[lo:hi] if n >= length)
+        return found
+
+
+class IntervalTree:
+    """
+    A static interval tree. The intervals are sorted by their low end and
+    stored as an implicit balanced binary tree, in which each node keeps
+    the highest end of its subtree.
+    """
+
+    def __init__(self, items):
+        self.items = sorted(items)
+        self.maxHigh = [0] * len(self.items)
+        self._build(0, len(self.items))
+
+    def _build(self, lo, hi):
+        if lo >= hi:
+            return -1
+        mid = (lo + hi) // 2
+        high = max(self.items[mid][1], self._build(lo, mid), self._build(mid + 1, hi))
+        self.maxHigh[mid] = high
+        return high
+
+    def overlapping(self, low, high):
+        """
+        Returns the rules of the intervals that overlap [low, high].
+        """
+
+        found = set()
+        stack = [(0, len(self.items))]
+        while stack:
+            lo, hi = stack.pop()
+            if lo >= hi:
+                continue
+            mid = (lo + hi) // 2
+            if self.maxHigh[mid] < low:
+                continue
+            start, end, i = self.items[mid]
+            stack.append((lo, mid))
+            if start <= high:
+                if end >= low:
+                    found.add(i)
+                stack.append((mid + 1, hi))
+        return found
+
+
+class RuleIndex:
+    """
+    The rules of a configuration (normalizer.Rule) indexed for overlap and
+    containment queries. Queries return the numbers of the rules in self.rules.
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self.protocols = defaultdict(set)
+        for i, rule in enumerate(self.rules):
+            self.protocols[rule.protocol].add(i)
+        self.addresses = {}
+        self.ports = {}
+        for field in ('src', 'dst'):
+            self.addresses[field] = PrefixIndex(
+                (i, getattr(r, field)) for i, r in enumerate(self.rules)
+                if isinstance(getattr(r, field), AddrMask))
+        for field in ('srcport', 'dstport'):
+            self.ports[field] = IntervalTree(
+                (low, high, i) for i, r in enumerate(self.rules)
+                if isinstance(getattr(r, field), tuple) for low, high in getattr(r, field))
+
+    def candidates(self, protocol=None, **fields):
+        """
+        Returns the rules that may overlap the query, or None when the query
+        does not restrict any field.
+        """
+
+        sets = []
+        if protocol not in (None, ANY_PROTOCOL):
+            sets.append(self.protocols.get(protocol, set()) |
+                        self.protocols.get(ANY_PROTOCOL, set()))
+        for field, value in fields.items():
+            if value is None:
+                continue
+            if field in self.addresses:
+                sets.append(self.addresses[field].overlapping(value))
+            else:
+                found = set()
+                for low, high in value:
+                    found |= self.ports[field].overlapping(low, high)
+                sets.append(found)
+        if not sets:
+            return None
+        sets.sort(key=len)
+        return set.intersection(*sets)
+
+    def query(self, mode='overlap', protocol=None, src=None, dst=None,
+              srcport=None, dstport=None):
+        """
+        Returns the numbers of the rules, in order, whose fields relate to every
+        given query field as mode requires: 'overlap', 'contains' (the rule
+        field contains the query field) or 'within'.
+        Addresses are AddrMasks and ports tuples of (low, high) ranges.
+        """
+
+        accepted = MODES[mode]
+        fields = {'src': src, 'dst': dst, 'srcport': srcport, 'dstport': dstport}
+        fields = {f: v for f, v in fields.items() if v is not None}
+        candidates = self.candidates(protocol, **fields)
+        if candidates is None:
+            candidates = range(len(self.rules))
+        found = []
+        for i in sorted(candidates):
+            rule = self.rules[i]
+            if protocol is not None and \
+                    protocolRelation(rule.protocol, protocol) not in accepted:
+                continue
+            if all(isinstance(getattr(rule, f), (AddrMask, tuple)) and
+                   fieldRelation(getattr(rule, f), v) in accepted for f, v in fields.items()):
+                found.append(i)
+        return found
+
+    def overlapping(self, **fields):
+        return self.query('overlap', **fields)
+
+    def containing(self, **fields):
+        return self.query('contains', **fields)
+
+    def within(self, **fields):
+        return self.query('within', **fields)
+
+
+def queryAddress(text):
+    """
+    Convert a query address to an AddrMask: 'any', a host, a CIDR prefix
+    'a.b.c.d/n' or an address and a wildcard 'a.b.c.d/w.x.y.z'.
+    Raises ValueError if text is not an address.
+    """
+
+    ip, _, bits = text.partition('/')
+    if bits.isdigit() and int(bits) <= 32 and ip2int(ip) is not None:
+        mask = prefixMask(int(bits))
+        return AddrMask(ip2int(ip) & mask, mask)
+    addr = iosAddress(text)
+    if not isinstance(addr, AddrMask):
+        raise ValueError(f"'{text}' is not an address")
+    return addr
+
+
+def queryPorts(text):
+    """
+    Convert query ports ('any', '443', 'www', '1000-2000', 'gt-1023') to ranges.
+    Raises ValueError if a port is unknown.
+    """
+
+    ports = iosPort(text)
+    if not isinstance(ports, tuple):
+        raise ValueError(f"'{text}' is not a port")
+    return ports
+
+
+def formatAddress(addr):
+    """
+    Format an AddrMask as a CIDR prefix, or as an address and a wildcard
+    when its mask is not contiguous.
+    """
+
+    if not isinstance(addr, AddrMask):
+        return addr
+    if addr == ANY_ADDRESS:
+        return 'any'
+    prefixes = addressPrefixes(addr, 0)
+    if len(prefixes) == 1 and prefixMask(prefixes[0][1]) == addr.mask:
+        return f"{int2ip(addr.value)}/{prefixes[0][1]}"
+    return f"{int2ip(addr.value)}/{int2ip(~addr.mask & FULL_MASK)}"
+
+
+def formatPorts(ports):
+    if not isinstance(ports, tuple):
+        return ports
+    if ports == ANY_PORT:
+        return 'any'
+    return ';'.join(str(lo) if lo == hi else f"{lo}-{hi}" for lo, hi in ports)
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(
+        description="List the rules that overlap, contain or are within a query.")
+    argparser.add_argument("vendor", choices=['ios', 'asa', 'fg'])
+    argparser.add_argument("config", help="configuration file")
+    argparser.add_argument("--src", type=queryAddress, help="source address or prefix")
+    argparser.add_argument("--dst", type=queryAddress, help="destination address or prefix")
+    argparser.add_argument("--sport", type=queryPorts, help="source port or range")
+    argparser.add_argument("--dport", type=queryPorts, help="destination port or range")
+    argparser.add_argument("--protocol", help="protocol name, such as tcp")
+    argparser.add_argument("--mode", choices=sorted(MODES), default='overlap',
+                           help="relation of the rules to the query")
+    args = argparser.parse_intermixed_args()
+
+    from anomaly_detector import vendorRules
+
+    with open(args.config, 'r') as cfgfile:
+        index = RuleIndex(vendorRules(args.vendor, cfgfile.read()))
+    found = index.query(args.mode, args.protocol, args.src, args.dst, args.sport, args.dport)
+
+    writer = csv.writer(sys.stdout, lineterminator='\n')
+    writer.writerow(['acl', 'order', 'action', 'protocol'] + DIMENSIONS)
+    for i in found:
+        r = index.rules[i]
+        writer.writerow([r.acl, r.order, r.action, r.protocol, formatAddress(r.src),
+                         formatAddress(r.dst), formatPorts(r.srcport), formatPorts(r.dstport)])
+
+    print(f"Found {len(found)} of {len(index.rules)} rules.", file=sys.stderr)
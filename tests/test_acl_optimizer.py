@@ -0,0 +1,117 @@
+"""
+Copyright 2016-2021 Maen Artimy
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import itertools
+import random
+
+import pytest
+
+from acl_optimizer import OPAQUE, PLAIN, Entry, firstDifference, optimizeEntries
+from normalizer import AddrMask, ANY_ADDRESS, ANY_PORT, Rule, prefixMask
+
+# The rules use the addresses 10.0.0.0/29 and the ports 0 to 7, so the
+# decision of every packet is the decision of one of these packets
+BASE = 0x0A000000
+ADDRESSES = [BASE + n for n in range(8)] + [0x0B000000]
+PORTS = list(range(9))
+PROTOCOLS = ['tcp', 'udp', 'gre']
+
+
+def randomAddress(rnd):
+    if rnd.random() < 0.3:
+        return ANY_ADDRESS
+    length = rnd.randint(29, 32)
+    return AddrMask((BASE + rnd.randrange(8)) & prefixMask(length), prefixMask(length))
+
+
+def randomPorts(rnd):
+    if rnd.random() < 0.5:
+        return ANY_PORT
+    low = rnd.randrange(8)
+    return ((low, rnd.randrange(low, 8)),)
+
+
+def randomACL(rnd, size):
+    rules = [Rule('acl', n, rnd.choice(['permit', 'deny']), rnd.choice(['ip', 'tcp', 'udp']),
+                  randomAddress(rnd), randomPorts(rnd), randomAddress(rnd), randomPorts(rnd))
+             for n in range(size)]
+    return [Entry('acl', n, f"rule {n}", rule, PLAIN) for n, rule in enumerate(rules)]
+
+
+def decision(entries, protocol, src, sport, dst, dport):
+    for e in entries:
+        r = e.rule
+        if r.protocol in ('ip', protocol) and \
+                (src ^ r.src.value) & r.src.mask == 0 and (dst ^ r.dst.value) & r.dst.mask == 0 and \
+                any(low <= sport <= high for low, high in r.srcport) and \
+                any(low <= dport <= high for low, high in r.dstport):
+            return r.action
+    return 'deny'
+
+
+def differences(a, b):
+    return [packet for packet in itertools.product(PROTOCOLS, ADDRESSES, PORTS, ADDRESSES, PORTS)
+            if decision(a, *packet) != decision(b, *packet)]
+
+
+def mutate(rnd, entries):
+    entries = list(entries)
+    i, j = rnd.randrange(len(entries)), rnd.randrange(len(entries))
+    change = rnd.randrange(3)
+    if change == 0:
+        del entries[i]
+    elif change == 1:
+        entries[i], entries[j] = entries[j], entries[i]
+    else:
+        rule = entries[i].rule
+        rule = rule._replace(action='deny' if rule.action == 'permit' else 'permit')
+        entries[i] = entries[i]._replace(rule=rule)
+    return entries
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_first_difference_matches_a_packet_scan(seed):
+    rnd = random.Random(seed)
+    before = randomACL(rnd, rnd.randint(1, 6))
+    after = mutate(rnd, before)
+    found = firstDifference(before, after)
+    packets = differences(before, after)
+    assert (found is None) == (not packets)
+    if found is not None:
+        protocol, region = found
+        packet = (protocol or 'gre', region.src.value, region.srcport[0],
+                  region.dst.value, region.dstport[0])
+        assert decision(before, *packet) != decision(after, *packet)
+
+
+@pytest.mark.parametrize("seed", range(15))
+def test_optimized_lists_are_equivalent(seed):
+    rnd = random.Random(seed)
+    before = randomACL(rnd, rnd.randint(1, 12))
+    after = optimizeEntries(before)
+    assert len(after) <= len(before)
+    assert firstDifference(before, after) is None
+    assert not differences(before, after)
+
+
+def test_opaque_rules_must_keep_their_order():
+    rnd = random.Random(0)
+    entries = randomACL(rnd, 4)
+    opaque = [Entry('acl', 10 + n, f"opaque {n}", None, OPAQUE) for n in range(2)]
+    before = entries[:2] + opaque + entries[2:]
+    assert firstDifference(before, list(before)) is None
+    assert firstDifference(before, entries[:2] + opaque[::-1] + entries[2:]) is not None
+    assert firstDifference(before, entries[:2] + opaque[:1] + entries[2:]) is not None
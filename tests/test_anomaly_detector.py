@@ -0,0 +1,125 @@
+"""
+Copyright 2016-2021 Maen Artimy
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import random
+
+import pytest
+
+import asa_policy_parser_lite as asa
+import config_parser
+from anomaly_detector import candidatePairs, findAnomalies, ruleAnomaly, ruleRelation, \
+    vendorRules
+from definitions import RRule, RField, Anomaly
+from normalizer import AddrMask, ANY_ADDRESS, ANY_PORT, Rule, asaRules, fieldRelation, \
+    iosRules, prefixMask
+
+
+def asaAcl(*rules):
+    """
+    Returns the rules of the access list 'acl' made of the given extended rules.
+    """
+
+    lines = [f"acl extended {rule}" for rule in rules]
+    return asaRules([asa.policyParser(line)[0] for line in lines], lines)
+
+
+def iosAcl(*rules):
+    return iosRules(config_parser.ios_policy_records([f"access-list 101 {r}" for r in rules]))
+
+
+@pytest.mark.parametrize("x, y, relation, same, other", [
+    ("tcp any host 10.0.0.1 eq 80", "tcp any host 10.0.0.1 eq 80",
+     RRule.EM, Anomaly.RXD, Anomaly.SHD),
+    ("ip any any", "tcp any host 10.0.0.1 eq 80", RRule.IMP, Anomaly.RXD, Anomaly.SHD),
+    ("tcp any host 10.0.0.1 eq 80", "ip any any", RRule.IMB, Anomaly.RUD, Anomaly.GEN),
+    ("tcp 10.0.0.0 255.0.0.0 any", "tcp any 20.0.0.0 255.0.0.0", RRule.CC, Anomaly.AOK,
+     Anomaly.COR),
+    ("tcp any host 10.0.0.1 eq 80", "tcp any host 10.0.0.1 eq 443", RRule.PD, Anomaly.AOK,
+     Anomaly.AOK),
+    ("tcp host 1.1.1.1 eq 1 host 2.2.2.2 eq 2", "udp host 3.3.3.3 eq 3 host 4.4.4.4 eq 4",
+     RRule.CD, Anomaly.AOK, Anomaly.AOK),
+])
+def test_relation_and_anomaly(x, y, relation, same, other):
+    rx, ry = asaAcl(f"permit {x}", f"permit {y}")
+    assert ruleRelation(rx, ry) == relation
+    assert ruleAnomaly(relation, rx, ry) == same
+    rx, ry = asaAcl(f"permit {x}", f"deny {y}")
+    assert ruleAnomaly(relation, rx, ry) == other
+
+
+def randomAddress(rnd):
+    kind = rnd.random()
+    if kind < 0.1:
+        return ANY_ADDRESS
+    if kind < 0.2:
+        return rnd.choice(['object-group A', 'object-group B', 'any6'])
+    length = rnd.randint(4, 32)
+    return AddrMask(rnd.getrandbits(32) & prefixMask(length), prefixMask(length))
+
+
+def test_candidate_pairs_match_a_brute_force_join():
+    rnd = random.Random(0)
+    rules = [Rule('acl', n, 'permit', 'ip', randomAddress(rnd), ANY_PORT,
+                  randomAddress(rnd), ANY_PORT) for n in range(300)]
+    expected = {(i, j) for j in range(len(rules)) for i in range(j)
+                if fieldRelation(rules[i].src, rules[j].src) != RField.UNEQUAL and
+                fieldRelation(rules[i].dst, rules[j].dst) != RField.UNEQUAL}
+    pairs = list(candidatePairs(rules))
+    assert len(pairs) == len(set(pairs))
+    assert set(pairs) == expected
+
+
+def test_candidate_pairs_skip_disjoint_ranges():
+    rules = asaAcl("permit ip 10.0.0.0 255.255.255.0 any",
+                   "permit ip 10.0.1.0 255.255.255.0 any",
+                   "permit ip 10.0.0.0 255.255.0.0 any",
+                   "permit ip 10.0.0.128 255.255.255.128 10.0.0.0 255.0.0.0",
+                   "permit ip 10.0.0.128 255.255.255.128 20.0.0.0 255.0.0.0")
+    assert sorted(candidatePairs(rules)) == [(0, 2), (0, 3), (0, 4), (1, 2), (2, 3),
+                                             (2, 4)]
+
+
+def test_asa_port_rules_are_compared_by_port():
+    assert findAnomalies(vendorRules('asa', asa.cfg)) == []
+    rules = asaAcl("permit tcp any host 10.0.0.1 eq https",
+                   "permit tcp any host 10.0.0.1 eq 80",
+                   "deny tcp any host 10.0.0.1 eq 443")
+    assert [(f.rulex, f.ruley, f.anomaly) for f in findAnomalies(rules)] == \
+        [(1, 3, Anomaly.SHD)]
+
+
+def test_asa_port_rules_without_text_are_only_equal_to_themselves():
+    lines = ["acl extended permit tcp any eq https host 10.0.0.1 eq https",
+             "acl extended permit tcp any eq https host 10.0.0.2 eq https"]
+    rules = asaRules([asa.policyParser(line)[0] for line in lines])
+    assert ruleRelation(*rules) == RRule.PD
+
+
+def test_asa_any6_is_apart_from_ipv4():
+    rules = asaAcl("permit tcp any6 host 10.0.0.1 eq 80",
+                   "deny tcp 10.0.0.0 255.0.0.0 host 10.0.0.1 eq 80",
+                   "deny tcp any host 10.0.0.1 eq 80")
+    assert rules[0].src != ANY_ADDRESS and rules[0].dstport == ((80, 80),)
+    assert [(f.rulex, f.ruley, f.anomaly) for f in findAnomalies(rules)] == \
+        [(1, 3, Anomaly.GEN), (2, 3, Anomaly.RUD)]
+
+
+def test_ios_options_narrow_the_rule():
+    rules = iosAcl("permit icmp any any echo", "deny icmp any any",
+                   "permit tcp any host 1.1.1.1 eq www log",
+                   "permit tcp any host 1.1.1.1 eq www established")
+    assert [(f.rulex, f.ruley, f.relation, f.anomaly) for f in findAnomalies(rules)] == \
+        [(1, 2, RRule.IMB, Anomaly.GEN), (3, 4, RRule.IMP, Anomaly.RXD)]
@@ -0,0 +1,97 @@
+"""
+Copyright 2016-2021 Maen Artimy
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import pytest
+
+from asa_policy_parser_lite import EXTENDED_ALTERNATIVES, PolicyParser, policyLineStream, \
+    policyParser
+from profiler import Profiler
+
+
+@pytest.mark.parametrize("line, expected", [
+    ("abc extended permit icmp any any echo",
+     {'name': 'abc', 'action': 'permit', 'protocol': 'icmp', 'srcaddr': 'any',
+      'dstaddr': 'any', 'icmp_opt': 'echo'}),
+    ("abc extended permit icmp any any object-group obj_icmp",
+     {'name': 'abc', 'action': 'permit', 'protocol': 'icmp', 'srcaddr': 'any',
+      'dstaddr': 'any', 'icmp_opt': 'object-group obj_icmp'}),
+    ("uvw line 3 extended deny ip interface inside 192.168.20.64 255.255.255.240",
+     {'name': 'uvw', 'line': '3', 'action': 'deny', 'protocol': 'ip',
+      'srcaddr': 'interface inside', 'dstaddr': '192.168.20.64 255.255.255.240'}),
+    ("abc extended permit object-group SVC any host 10.1.1.1",
+     {'name': 'abc', 'action': 'permit', 'protocol': 'object-group SVC', 'srcaddr': 'any',
+      'dstaddr': 'host 10.1.1.1'}),
+    ("std standard permit host 10.1.1.1",
+     {'name': 'std', 'action': 'permit', 'srcaddr': 'host 10.1.1.1'}),
+    ("std standard deny 10.0.0.0 255.0.0.0",
+     {'name': 'std', 'action': 'deny', 'srcaddr': '10.0.0.0 255.0.0.0'}),
+    ("std standard permit any4", {'name': 'std', 'action': 'permit', 'srcaddr': 'any4'}),
+    ("abc remark allow web traffic", {'name': 'abc', 'remark': 'allow web traffic'}),
+    ("abc line 5 remark numbered remark",
+     {'name': 'abc', 'line': '5', 'remark': 'numbered remark'}),
+    ("abc extended permit ip any4 any6",
+     {'name': 'abc', 'action': 'permit', 'protocol': 'ip', 'srcaddr': 'any4',
+      'dstaddr': 'any6'}),
+    ("abc extended deny tcp any6 host 10.1.1.1 eq 80 log 7 interval 30 time-range WORK inactive",
+     {'name': 'abc', 'action': 'deny', 'protocol': 'tcp', 'srcaddr': 'any6',
+      'dstaddr': 'host 10.1.1.1', 'time_range': 'WORK', 'inactive': 'inactive'}),
+    ("abc extended permit udp any any time-range NIGHT",
+     {'name': 'abc', 'action': 'permit', 'protocol': 'udp', 'srcaddr': 'any',
+      'dstaddr': 'any', 'time_range': 'NIGHT'}),
+    ("abc extended permit ip any any inactive",
+     {'name': 'abc', 'action': 'permit', 'protocol': 'ip', 'srcaddr': 'any',
+      'dstaddr': 'any', 'inactive': 'inactive'}),
+    # A name that contains an option keyword is not an option
+    ("abc extended permit ip any object-group inactive-hosts",
+     {'name': 'abc', 'action': 'permit', 'protocol': 'ip', 'srcaddr': 'any',
+      'dstaddr': 'object-group inactive-hosts'}),
+])
+def test_policy_fields(line, expected):
+    [policy] = policyParser(line)
+    assert policy.asDict() == expected
+
+
+@pytest.mark.parametrize("line", [
+    "abc extended bogus ip any any",
+    "abc standard permit",
+    "abc unknown permit ip any any",
+])
+def test_policy_not_parsed(line):
+    assert len(policyParser(line)) == 0
+
+
+@pytest.mark.parametrize("line, tried", [
+    ("abc extended permit icmp any any echo", {'icmp'}),
+    ("abc extended permit tcp any host 10.1.1.1 eq 80", {'fqdn'}),
+    ("abc extended permit ip any any", {'fqdn'}),
+    ("abc extended permit object-group SVC any any", {'fqdn'}),
+    ("abc standard permit any4", set()),
+    ("abc remark text", set()),
+])
+def test_protocol_selects_the_alternatives(line, tried):
+    parser = PolicyParser()
+    profiler = Profiler()
+    profiler.instrumentNamed(parser.policyDef, 'extended', EXTENDED_ALTERNATIVES)
+    parser.policyDef.parse_string(line)
+    attempts = profiler.alternatives['extended']
+    assert {name for name, record in attempts.items() if record.attempts} == tried
+
+
+def test_policy_line_stream():
+    lines = ["access-list abc extended permit ip any any\n", "  access-list\n",
+             "object-group network A\n", "access-list abc remark x\r\n"]
+    assert list(policyLineStream(lines)) == ["abc extended permit ip any any", "",
+                                             "abc remark x"]
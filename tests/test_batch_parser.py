@@ -0,0 +1,88 @@
+"""
+Copyright 2016-2021 Maen Artimy
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import csv
+
+import pytest
+
+import fg_policy_parser_lite as fg
+from batch_parser import batchParse, writeSummary
+from benchmark import asaConfig, iosConfig
+
+IOS_WITH_ERRORS = iosConfig(5) + "access-list 101 permit bogus\naccess-list 101 deny\n"
+
+
+@pytest.fixture
+def configs(tmp_path):
+    inputs = tmp_path / 'configs'
+    inputs.mkdir()
+    (inputs / 'fw1.conf').write_text(fg.cfg)
+    (inputs / 'asa1.cfg').write_text(asaConfig(20))
+    (inputs / 'router1.txt').write_text(IOS_WITH_ERRORS)
+    (inputs / 'binary.cfg').write_bytes(b'\xff\xfe\x00access-list')
+    (inputs / 'notes.txt').write_text("hostname notes\n")
+    (inputs / 'locked.cfg').write_text(asaConfig(5))
+    return inputs
+
+
+def summarize(configs, outdir, jobs=1):
+    names = ['fw1.conf', 'asa1.cfg', 'router1.txt', 'binary.cfg', 'notes.txt',
+             'locked.cfg', 'missing.cfg']
+    summaries = batchParse([str(configs / n) for n in names], str(outdir), jobs)
+    return {s['device']: s for s in summaries}
+
+
+def test_errors_are_recorded_per_file(tmp_path, configs):
+    outdir = tmp_path / 'out'
+    # The output of locked cannot be written
+    (outdir / 'locked.csv').mkdir(parents=True)
+    summaries = summarize(configs, outdir)
+
+    assert summaries['fw1']['vendor'] == 'fg'
+    assert summaries['asa1']['vendor'] == 'asa'
+    assert summaries['asa1']['parsed'] == 20
+    assert summaries['router1']['vendor'] == 'ios'
+    assert summaries['router1']['failed'] == 2
+    assert summaries['router1']['parsed'] == summaries['router1']['found'] - 2
+    for device in ['fw1', 'asa1', 'router1', 'notes']:
+        assert summaries[device]['error'] == ''
+    assert summaries['notes']['vendor'] == ''
+
+    assert summaries['binary']['error'].startswith('read: ')
+    assert summaries['missing']['error'].startswith('read: ')
+    assert summaries['locked']['vendor'] == 'asa'
+    assert summaries['locked']['error'].startswith('parse: ')
+
+    # Each error is one row of summary.csv
+    with open(outdir / 'summary.csv', 'w') as outfile:
+        writeSummary(summaries.values(), outfile)
+    with open(outdir / 'summary.csv') as infile:
+        rows = {row['device']: row for row in csv.DictReader(infile)}
+    assert len(rows) == 7
+    assert rows['router1']['failed'] == '2'
+    assert rows['missing']['error'] == summaries['missing']['error']
+
+
+def test_pool_gives_the_same_summaries(tmp_path, configs):
+    def withoutTimes(summaries):
+        return {d: {f: v for f, v in s.items() if f != 'seconds'}
+                for d, s in summaries.items()}
+
+    serial = summarize(configs, tmp_path / 'serial')
+    pooled = summarize(configs, tmp_path / 'pooled', jobs=2)
+    assert withoutTimes(pooled) == withoutTimes(serial)
+    assert (tmp_path / 'pooled' / 'router1.csv').read_text() == \
+        (tmp_path / 'serial' / 'router1.csv').read_text()
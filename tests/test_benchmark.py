@@ -0,0 +1,60 @@
+"""
+Copyright 2016-2021 Maen Artimy
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import json
+
+import pytest
+
+from benchmark import asaConfig, fgConfig, iosConfig, compareSuites, runSuite, suiteCase
+
+STAGES = {
+    'fg': ['policySectionParser', 'policyFinder', 'policyParser', 'policyTable', 'csv'],
+    'asa': ['policyFinder', 'policyParser', 'policyTable', 'csv'],
+    'ios': ['ios_policy_parser', 'ios_policy_records', 'csv', 'yaml'],
+}
+
+
+@pytest.mark.parametrize('generate', [asaConfig, fgConfig, iosConfig])
+def test_generated_configurations_are_repeatable(generate):
+    assert generate(50) == generate(50)
+    assert generate(50, seed=1) != generate(50)
+
+
+@pytest.mark.parametrize('vendor', sorted(STAGES))
+def test_suite_case_times_every_stage(vendor):
+    case = suiteCase(vendor, 50, 2)
+    assert list(case['stages']) == STAGES[vendor]
+    assert case['vdoms'] == (2 if vendor == 'fg' else 1)
+    assert case['bytes'] > 0 and case['peak_rss_kb'] > 0
+    assert all(s['items'] == 50 for s in case['stages'].values())
+    assert case['seconds'] == pytest.approx(
+        sum(s['seconds'] for s in case['stages'].values()), abs=1e-5)
+
+
+def test_suite_results_are_compared(capsys):
+    old = runSuite([20, 40], ['asa'])
+    new = json.loads(json.dumps(runSuite([20, 40], ['asa'])))
+    assert [(c['vendor'], c['size']) for c in new['results']] == [('asa', 20), ('asa', 40)]
+    assert 'asa 20: ' in capsys.readouterr().err
+
+    report = compareSuites(old, new).splitlines()
+    assert report[0] == f"Comparing {old['commit']} (before) with {new['commit']} (after):"
+    assert len(report) == 1 + 2 * len(STAGES['asa'])
+    assert all('x), RSS' in line for line in report[1:])
+
+    # Cases that were not run before are skipped
+    assert len(compareSuites({'results': old['results'][:1]}, new).splitlines()) == \
+        1 + len(STAGES['asa'])
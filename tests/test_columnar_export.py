@@ -0,0 +1,135 @@
+"""
+Copyright 2016-2021 Maen Artimy
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+import columnar_export
+from benchmark import asaConfig, fgConfig, iosConfig
+from columnar_export import columnarWriter, loadColumnar, fallbackPath
+from policy_table import PolicyTable
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COLUMNS = ['id', 'srcaddr', 'action', 'comments']
+POLICIES = [
+    {'id': '1', 'srcaddr': ['a', 'b'], 'action': 'accept'},
+    None,
+    {'id': '2', 'comments': '', 'action': 'deny', 'ignored': 'x'},
+    {'id': '3', 'srcaddr': 'a', 'comments': 'é'},
+]
+
+
+def expected(policy):
+    return policy and {f: ' '.join(v) if isinstance(v, list) else v
+                       for f, v in policy.items() if f in COLUMNS}
+
+
+def write(path, batchSize=2):
+    with columnarWriter(str(path), COLUMNS, batchSize=batchSize) as writer:
+        writer.writePolicies(POLICIES[:2], section=0)
+        writer.writePolicies(POLICIES[2:], section=1)
+    return writer
+
+
+@pytest.mark.parametrize('batchSize', [1, 2, 100])
+def test_numpy_round_trip(tmp_path, batchSize):
+    writer = write(tmp_path / 'policies', batchSize)
+    assert (writer.written, writer.failed) == (3, 1)
+
+    policies = loadColumnar(str(tmp_path / 'policies'))
+    assert len(policies) == 4
+    assert list(policies.records()) == [expected(p) for p in POLICIES]
+    assert policies.column('srcaddr') == ['a b', None, None, 'a']
+    assert policies.string(0) is None
+    assert policies.sections.tolist() == [0, 0, 1, 1]
+
+
+def test_numpy_table(tmp_path):
+    write(tmp_path / 'policies')
+    table = loadColumnar(str(tmp_path / 'policies')).table()
+
+    reference = PolicyTable()
+    reference.extend([expected(p) for p in POLICIES])
+    assert [r and r.asDict() for r in table] == [r and r.asDict() for r in reference]
+    assert table.failed == 1
+    assert [len(s) for s in table.bySection()] == [1, 2]
+
+    # The table can be extended after loading
+    table.append({'id': '4', 'srcaddr': 'a'})
+    assert table[4].asDict() == {'id': '4', 'srcaddr': 'a'}
+
+
+def test_empty_output(tmp_path):
+    with columnarWriter(str(tmp_path / 'empty'), COLUMNS):
+        pass
+    policies = loadColumnar(str(tmp_path / 'empty'))
+    assert len(policies) == 0
+    assert list(policies.records()) == []
+
+
+@pytest.mark.parametrize('name', ['policies.arrow', 'policies.parquet'])
+def test_fallback_without_pyarrow(tmp_path, monkeypatch, capsys, name):
+    monkeypatch.setattr(columnar_export, 'pa', None)
+    path = str(tmp_path / name)
+    write(path)
+    assert 'pyarrow is not installed' in capsys.readouterr().err
+    assert fallbackPath(path) == str(tmp_path / 'policies.npy')
+
+    policies = loadColumnar(path)
+    assert list(policies.records()) == [expected(p) for p in POLICIES]
+
+
+def test_missing_file_without_pyarrow(tmp_path, monkeypatch):
+    monkeypatch.setattr(columnar_export, 'pa', None)
+    with pytest.raises(ImportError):
+        loadColumnar(str(tmp_path / 'missing.arrow'))
+
+
+@pytest.mark.parametrize('name', ['policies.arrow', 'policies.parquet'])
+def test_arrow_round_trip(tmp_path, name):
+    pytest.importorskip('pyarrow')
+    path = str(tmp_path / name)
+    write(path)
+    table = loadColumnar(path)
+    assert table.column('_parsed').to_pylist() == [p is not None for p in POLICIES]
+    assert table.column('_section').to_pylist() == [0, 0, 1, 1]
+    rows = table.select(COLUMNS).to_pylist()
+    for row, policy in zip(rows, POLICIES):
+        if policy is not None:
+            assert {f: v for f, v in row.items() if v is not None} == expected(policy)
+
+
+@pytest.mark.parametrize("parser,config", [
+    ('fg_policy_parser_lite.py', fgConfig(200, vdoms=2)),
+    ('asa_policy_parser_lite.py', asaConfig(200)),
+    ('ios_policy_parser.py', iosConfig(200)),
+])
+def test_stream_writes_the_same_columns(tmp_path, parser, config):
+    (tmp_path / 'config.conf').write_text(config)
+
+    def convert(name, *options):
+        subprocess.run([sys.executable, '-W', 'ignore', os.path.join(ROOT, parser),
+                        'config.conf', '--columnar', name, *options],
+                       cwd=tmp_path, capture_output=True, check=True)
+        return list(loadColumnar(str(tmp_path / name)).records())
+
+    records = convert('default')
+    assert len(records) > 0
+    assert convert('stream', '--stream') == records
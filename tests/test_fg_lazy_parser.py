@@ -0,0 +1,75 @@
+"""
+Copyright 2016-2021 Maen Artimy
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import random
+
+import fg_policy_parser_lite as fg
+from benchmark import fgConfig
+
+# Statements of the generated policies: regular fields, fields whose names
+# start like them, and values that the grammar rejects or reads in part
+STATEMENTS = [
+    'set srcaddr "net-1"', 'set dstaddr "all"', 'set dstaddr "web" "db"',
+    'set service "HTTP"', 'set service "HTTP" "HTTPS"', 'set action accept',
+    'set action deny', 'set name "policy one"', 'set schedule "always"',
+    'set comments "allow web, not ssh"', 'set logtraffic all', 'set status disable',
+    'set srcaddr6 "all"', 'set dstaddr6 "all"', 'set srcaddr6 all',
+    'set service6 "HTTP"', 'set services "HTTP"', 'set servicex "HTTP"',
+    'set service-negate enable', 'set srcaddr-negate enable',
+    'set dstaddr 10.0.0.1/24', 'set srcaddr "net-1" junk', 'set comments',
+    'set schedule "always', 'set service  "DNS"', 'set\taction\taccept',
+    'set action accept  ', 'set dstaddr "a"  "b"', 'set name "x" "y z"',
+    'unset comments', '',
+]
+FIELDS = ['srcaddr', 'dstaddr', 'action', 'service']
+
+
+def sectionText(count, seed=0):
+    rnd = random.Random(seed)
+    lines = []
+    for num in range(1, count + 1):
+        lines.append(f"    edit {num}")
+        for _ in range(rnd.randrange(1, 6)):
+            lines.append("        " + rnd.choice(STATEMENTS))
+        lines.append("    next")
+    eol = rnd.choice(["\n", "\r\n"])
+    return eol.join(lines) + eol
+
+
+def sections(text):
+    return [s.content for s in fg.policySectionParser(text)]
+
+
+def assertSameAsGrammar(text):
+    expected = [p.asDict() for p in fg.policyParser(text)]
+    assert [p.asDict() for p in fg.lazyPolicyParser(text)] == expected
+    projected = [{f: v for f, v in p.items() if f in FIELDS + ['num']} for p in expected]
+    assert fg.policyProjection(text, FIELDS) == projected
+
+
+def test_generated_config():
+    for text in sections(fgConfig(500, vdoms=2)):
+        assertSameAsGrammar(text)
+
+
+def test_sample_config():
+    for text in sections(fg.cfg):
+        assertSameAsGrammar(text)
+
+
+def test_lookalike_fields_and_odd_values():
+    for seed in range(200):
+        assertSameAsGrammar(sectionText(20, seed))
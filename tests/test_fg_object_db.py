@@ -0,0 +1,157 @@
+"""
+Copyright 2016-2021 Maen Artimy
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import random
+
+from fg_object_db import ObjectDB, formatAddresses, formatServices, mergeIntervals, \
+    objectDatabase, resolvePolicy
+
+CONFIG = """\
+config firewall address
+    edit "web"
+        set subnet 10.0.1.0 255.255.255.0
+    next
+    edit "db"
+        set subnet 10.0.2.0/24
+    next
+    edit "pool"
+        set type iprange
+        set start-ip 10.0.3.10
+        set end-ip 10.0.3.20
+    next
+    edit "site"
+        set type fqdn
+        set fqdn "www.example.com"
+    next
+end
+config firewall addrgrp
+    edit "servers"
+        set member "web" "db"
+    next
+    edit "ring-a"
+        set member "ring-b" "pool"
+    next
+    edit "ring-b"
+        set member "ring-a" "servers"
+    next
+    edit "self"
+        set member "self" "site"
+    next
+end
+config firewall service custom
+    edit "HTTPS"
+        set tcp-portrange 443
+    next
+    edit "DNS"
+        set tcp-portrange 53
+        set udp-portrange 53
+    next
+    edit "PING"
+        set protocol ICMP
+        set icmptype 8
+    next
+end
+config firewall service group
+    edit "WEB"
+        set member "HTTPS" "ALL_ICMP"
+    next
+    edit "ALL-SERVICES"
+        set member "WEB" "DNS" "PING"
+    next
+end
+config firewall policy
+    edit 1
+        set srcaddr "ring-a"
+        set dstaddr "self" "web"
+        set service "ALL-SERVICES"
+    next
+end
+config firewall address
+    edit "web"
+        set subnet 192.168.0.0 255.255.0.0
+    next
+end
+config firewall policy
+end
+"""
+
+
+def test_groups_are_expanded():
+    db = objectDatabase(CONFIG.splitlines())
+    assert formatAddresses(db.address(0, 'servers')) == '10.0.1.0/24;10.0.2.0/24'
+    assert formatServices(db.service(0, 'WEB')) == 'icmp/0-255;tcp/443'
+    assert formatServices(db.service(0, 'ALL-SERVICES')) == \
+        'icmp/0-255;tcp/53;tcp/443;udp/53'
+    assert formatAddresses(db.addresses(0, 'web;missing')) == '10.0.1.0/24;missing'
+    # Objects belong to the policy section that follows them
+    assert formatAddresses(db.address(1, 'web')) == '192.168.0.0/16'
+    assert formatAddresses(db.address(1, 'servers')) == 'servers'
+
+
+def test_cyclic_groups_are_the_union_of_the_cycle():
+    db = objectDatabase(CONFIG.splitlines())
+    ring = db.address(0, 'ring-a')
+    assert db.address(0, 'ring-b') == ring
+    assert formatAddresses(ring) == \
+        '10.0.1.0/24;10.0.2.0/24;10.0.3.10/31;10.0.3.12/30;10.0.3.16/30;10.0.3.20/32'
+    # An FQDN has no address: it is kept as a name
+    assert formatAddresses(db.address(0, 'self')) == 'site'
+    assert sorted(db.cycles) == [['ring-a', 'ring-b'], ['self']]
+
+
+def test_resolve_policy():
+    db = objectDatabase(CONFIG.splitlines())
+    policy = resolvePolicy(db, {'srcaddr': 'all', 'dstaddr': 'web', 'service': 'ALL'}, 0)
+    assert policy['srcaddr-resolved'] == '0.0.0.0/0'
+    assert policy['dstaddr-resolved'] == '10.0.1.0/24'
+    assert policy['service-resolved'] == 'ip'
+
+
+def bruteForce(groups, leaves, name, seen=None):
+    """
+    Expand a group by visiting every reachable member.
+    """
+
+    seen = set() if seen is None else seen
+    if name in seen:
+        return []
+    seen.add(name)
+    if name not in groups:
+        return list(leaves.get(name, ()))
+    return [i for member in groups[name] for i in bruteForce(groups, leaves, member, seen)]
+
+
+def test_random_groups_match_a_brute_force_expansion():
+    rnd = random.Random(0)
+    cycles = 0
+    for _ in range(20):
+        leaves = {}
+        for n in range(20):
+            low = rnd.randrange(1 << 20)
+            leaves[f"a{n}"] = ((low, low + rnd.randrange(1 << 12)),)
+        groups = {f"g{n}": rnd.sample([f"g{m}" for m in range(15)], rnd.randint(0, 2)) +
+                  rnd.sample(sorted(leaves), 1) for n in range(15)}
+        db = ObjectDB()
+        for name, value in leaves.items():
+            db.objects['address'][0, name] = value
+        for name, members in groups.items():
+            db.objects['addrgrp'][0, name] = members
+        for name in rnd.sample(sorted(groups), len(groups)):
+            resolved = db.address(0, name)
+            assert resolved.values == mergeIntervals(bruteForce(groups, leaves, name))
+            assert not resolved.unresolved
+        cycles += len(db.cycles)
+    assert cycles
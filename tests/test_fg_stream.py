@@ -0,0 +1,45 @@
+"""
+Copyright 2016-2021 Maen Artimy
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+import fg_policy_parser_lite as fg
+
+PARSER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                      'fg_policy_parser_lite.py')
+
+EMPTY_SECTION = "config firewall policy\nend\n"
+
+
+def convert(tmp_path, config, *options):
+    path = tmp_path / 'config.conf'
+    path.write_text(config)
+    run = subprocess.run([sys.executable, '-W', 'ignore', PARSER, str(path), 'out', *options],
+                         cwd=tmp_path, capture_output=True, text=True, check=True)
+    return (tmp_path / 'out.csv').read_text(), run.stderr
+
+
+@pytest.mark.parametrize("config", [
+    EMPTY_SECTION,
+    "config system global\nend\n",
+    EMPTY_SECTION + fg.cfg + EMPTY_SECTION,
+])
+def test_stream_writes_the_same_tables(tmp_path, config):
+    assert convert(tmp_path, config, '--stream') == convert(tmp_path, config)
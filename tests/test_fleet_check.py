@@ -0,0 +1,70 @@
+"""
+Copyright 2016-2021 Maen Artimy
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from fleet_check import DIFFERENT, EXTRA, MISSING, FleetIndex, loadFleet, pairDrift
+
+RULES = ["permit tcp any host 10.1.1.1 eq 80",
+         "permit tcp any host 10.1.1.2 eq 443",
+         "permit ip 10.2.0.0 255.255.0.0 any",
+         "permit tcp any host 10.1.1.4 eq 22"]
+
+
+def fleet(tmp_path, configs):
+    paths = []
+    for name, rules in configs.items():
+        path = tmp_path / f"{name}.cfg"
+        path.write_text(''.join(f"access-list out extended {r}\n" for r in rules))
+        paths.append(str(path))
+    return loadFleet(paths)
+
+
+def test_drifted_device_is_found(tmp_path):
+    drifted = RULES[:1] + [RULES[1].replace('443', '444')] + RULES[2:3] + \
+        ["deny udp host 9.9.9.9 any eq 53"]
+    devices = fleet(tmp_path, {
+        'a': RULES,
+        # The same rules written differently
+        'b': [RULES[0].replace('host 10.1.1.1', '10.1.1.1 255.255.255.255'),
+              RULES[1].replace('443', 'https')] + RULES[2:],
+        'c': drifted})
+    index = FleetIndex(devices)
+    assert index.groups() == {'asa': [0, 1, 2]}
+    group = index.groups()['asa']
+    assert index.expected(group) == {rule: 1 for rule in devices[0].rules}
+    assert devices[0].rules == devices[1].rules
+
+    drift = index.drift(group)
+    assert list(drift) == [2]
+    kinds = [(d.kind, d.position) for d in drift[2]]
+    assert kinds == [(DIFFERENT, 2), (MISSING, None), (EXTRA, 4)]
+    assert drift[2][0].fields == {'dstport': ('443', '444')}
+    assert drift[2][1].expected == devices[0].rules[3]
+
+
+def test_pair_is_compared_with_the_first_device(tmp_path):
+    devices = fleet(tmp_path, {'a': RULES, 'b': RULES[:3]})
+    index = FleetIndex(devices)
+    assert [d.kind for d in index.drift([1, 0])[0]] == [EXTRA]
+    assert [d.kind for d in index.drift([0, 1])[1]] == [MISSING]
+
+
+def test_unrelated_rules_are_not_paired(tmp_path):
+    a, b = (d.rules for d in fleet(tmp_path, {'a': RULES[3:], 'b': RULES[:1]}))
+    # permit tcp to another host and port: two of six fields differ
+    [different] = pairDrift(a, [(b[0], 1)])
+    assert different.kind == DIFFERENT
+    drifts = pairDrift(a, [(b[0]._replace(action='deny', protocol='udp'), 1)])
+    assert [d.kind for d in drifts] == [MISSING, EXTRA]
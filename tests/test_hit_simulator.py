@@ -0,0 +1,57 @@
+"""
+Copyright 2016-2021 Maen Artimy
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import numpy as np
+
+import asa_policy_parser_lite as asa
+from anomaly_detector import vendorRules
+from flow_lookup import aclMatcher, readFlows
+from hit_simulator import simulate
+
+# Destinations of the port rules of the access list xyz of the sample ASA configuration
+XYZ_PORT_RULES = [('3389', '192.168.20.53', '3389'), ('443', '192.168.30.54', '443'),
+                  ('443', '192.168.30.55', '443'), ('443', '192.168.30.56', '443'),
+                  ('443', '192.168.30.57', '443')]
+
+
+def flowLog(path, count=2000):
+    rnd = np.random.default_rng(0)
+    rows = ['protocol,srcip,srcport,dstip,dstport']
+    for n in range(count):
+        sport, dst, dport = XYZ_PORT_RULES[n % len(XYZ_PORT_RULES)]
+        if n % 3 == 0:
+            dport = '80'
+        rows.append(f"tcp,0.0.0.{rnd.integers(256)},{sport},{dst},{dport}")
+    path.write_text('\n'.join(rows) + '\n')
+    return rows
+
+
+def test_asa_port_rules_are_hit(tmp_path):
+    flows = tmp_path / 'flows.csv'
+    rows = flowLog(flows)
+    matcher = aclMatcher(vendorRules('asa', asa.cfg), 'xyz')
+    expected = matcher.lookup(*readFlows(rows))
+
+    for jobs in (1, 2):
+        total, [result] = simulate([matcher], str(flows), jobs=jobs, shardSize=4096)
+        assert total == len(rows) - 1
+        # hits[0] counts the undetermined flows, hits[1] the implicit deny
+        assert result.hits[0] == 0
+        # The first rule of xyz is an ICMP rule, the next five are port rules
+        assert all(result.hits[3:8] > 0)
+        assert result.hits[1] == (expected == -1).sum()
+        assert [result.hits[i + 2] for i in range(len(matcher.rules))] == \
+            [(expected == i).sum() for i in range(len(matcher.rules))]
@@ -0,0 +1,67 @@
+"""
+Copyright 2016-2021 Maen Artimy
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import random
+
+import config_parser
+import ios_policy_parser
+from benchmark import iosConfig, iosFuzzLines
+
+# Characters that str methods and re patterns take for digits, letters or
+# whitespace, but the grammar does not
+UNICODE_CHARS = ['\xb2', '\u0663', '\uff11', '\xe9', '\xa0', '\x0b', '\x0c',
+                 '\x1c', '\x85', '\u2028', '\u3000']
+
+
+def mutatedLines(lines, count, seed=0):
+    """
+    Insert or substitute one of UNICODE_CHARS at a random place of random lines.
+    """
+
+    rnd = random.Random(seed)
+    mutated = []
+    for _ in range(count):
+        line = rnd.choice(lines).rstrip('\r\n')
+        i = rnd.randrange(len(line) + 1)
+        char = rnd.choice(UNICODE_CHARS)
+        mutated.append(line[:i] + char + line[i + rnd.choice([0, 1]):])
+    return mutated
+
+
+def test_generated_lines():
+    lines = iosConfig(2000).splitlines()
+    assert all(config_parser.ios_fast_parser(line) is not None for line in lines)
+    assert config_parser.compare_engines(lines) == []
+
+
+def test_sample_and_fuzzed_lines():
+    lines = ios_policy_parser.cfg.splitlines(keepends=True) + iosFuzzLines(5000)
+    assert config_parser.compare_engines(lines) == []
+
+
+def test_unicode_lines():
+    lines = [
+        "access-list 101 permit tcp any any eq \xb2",
+        "access-list 101 permit tcp any any range 1 \xb2",
+        "access-list 101 permit tcp any host 1.2.3.\u0664 eq 80",
+        "access-list 1\xb2 permit ip any",
+        "access-list 101 perm\xa0it tcp any any",
+        "access-list 101 permit tcp any any eq www\x0b",
+        "access-list 101 permit t\xe9p any any",
+    ]
+    samples = iosConfig(500).splitlines() + iosFuzzLines(500)
+    lines += mutatedLines(samples, 5000)
+    assert config_parser.compare_engines(lines) == []
@@ -0,0 +1,59 @@
+"""
+Copyright 2016-2021 Maen Artimy
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from functools import partial
+
+import asa_policy_parser_lite as asa
+import fg_policy_parser_lite as fg
+from benchmark import asaConfig, fgConfig
+
+
+def records(results):
+    return [[p if isinstance(p, dict) else p.asDict() for p in policies]
+            for policies in results]
+
+
+def test_asa_parallel_parsing_keeps_the_order():
+    lines = list(asa.policyLineStream(asaConfig(300).splitlines()))
+    # Lines that do not parse keep their place
+    lines[10:10] = ["acl0 extended bogus ip any any", ""]
+    serial = records(asa.policyParser(line) for line in lines)
+    assert records(asa.parallelPolicyParser(lines, 2, chunksize=7)) == serial
+    assert serial[10] == serial[11] == []
+
+
+def test_fg_parallel_parsing_keeps_the_order():
+    cfg = fgConfig(300, vdoms=2)
+    # A policy without any statement is not parsed
+    cfg = cfg.replace("    edit 5\n", "    edit 500\n    next\n    edit 5\n", 1)
+    sections = [section.content for section in fg.policySectionParser(cfg)]
+    assert len(sections) == 2
+    serial = [records([fg.policyParser(text)])[0] for text in sections]
+    assert records(fg.parallelPolicyParser(sections, 2, chunksize=7)) == serial
+    assert sum(map(len, serial)) == 300
+
+    fields = ['srcintf', 'dstintf', 'action']
+    project = partial(fg.policyProjection, fields=fields)
+    assert fg.parallelPolicyParser(sections, 2, chunksize=7, parse=project) == \
+        [project(text) for text in sections]
+
+
+def test_fg_chunks_start_at_a_policy():
+    text = fg.policySectionParser(fgConfig(50))[0].content
+    chunks = fg.splitPolicies(text, 7)
+    assert ''.join(chunks) == text
+    assert len(chunks) == 8
+    assert all(chunk.lstrip().startswith('edit ') for chunk in chunks[1:])
@@ -0,0 +1,81 @@
+"""
+Copyright 2016-2021 Maen Artimy
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from parse_cache import ParseCache
+
+
+def countingParser(calls):
+    def parse(text):
+        calls.append(text)
+        return [{'text': text}]
+    return parse
+
+
+def test_hits_and_misses(tmp_path):
+    calls = []
+    cache = ParseCache(str(tmp_path / 'cache.db'))
+    parse = cache.cached(countingParser(calls), 'v1')
+    assert parse('a') == [{'text': 'a'}]
+    assert parse('a') == [{'text': 'a'}]
+    assert parse('b') == [{'text': 'b'}]
+    assert calls == ['a', 'b']
+    assert (cache.hits, cache.misses) == (1, 2)
+    cache.close()
+
+    # The entries are kept on disk, per namespace
+    cache = ParseCache(str(tmp_path / 'cache.db'))
+    cache.cached(countingParser(calls), 'v1')('a')
+    cache.cached(countingParser(calls), 'v2')('a')
+    assert calls == ['a', 'b', 'a']
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.close()
+
+
+def test_least_recently_used_entries_are_evicted_on_put(tmp_path):
+    entry = len(ParseCache.key('v1', 'a')) + len('[{"text": "a"}]')
+    cache = ParseCache(str(tmp_path / 'cache.db'), maxBytes=3 * entry)
+    parse = cache.cached(countingParser([]), 'v1')
+    for text in 'abc':
+        parse(text)
+    parse('a')
+    assert (cache.size, cache.evicted) == (3 * entry, 0)
+
+    # 'b' is the least recently used entry
+    parse('d')
+    assert (cache.size, cache.evicted) == (3 * entry, 1)
+    assert cache.get(ParseCache.key('v1', 'b')) is None
+    assert cache.get(ParseCache.key('v1', 'a')) == [{'text': 'a'}]
+    rows = cache.db.execute("SELECT COUNT(*), SUM(size) FROM entries").fetchone()
+    assert rows == (3, 3 * entry)
+    cache.close()
+
+
+def test_a_smaller_limit_evicts_when_reopened(tmp_path):
+    cache = ParseCache(str(tmp_path / 'cache.db'))
+    parse = cache.cached(countingParser([]), 'v1')
+    for text in 'abcd':
+        parse(text)
+    entry = cache.size // 4
+    cache.close()
+
+    cache = ParseCache(str(tmp_path / 'cache.db'), maxBytes=2 * entry)
+    assert cache.size == 4 * entry
+    cache.close()
+    cache = ParseCache(str(tmp_path / 'cache.db'))
+    assert (cache.size, cache.evicted) == (2 * entry, 0)
+    assert cache.get(ParseCache.key('v1', 'a')) is None
+    assert cache.get(ParseCache.key('v1', 'd')) == [{'text': 'd'}]
+    cache.close()
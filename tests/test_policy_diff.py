@@ -0,0 +1,42 @@
+"""
+Copyright 2016-2021 Maen Artimy
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from policy_diff import ADDED, MODIFIED, diffConfigs
+
+
+def numbered(rules):
+    return [f"access-list out line {n} extended {rule}" for n, rule in enumerate(rules, 1)]
+
+
+def test_asa_port_change_is_a_modification():
+    old = ['access-list out extended permit tcp any host 1.2.3.4 eq 80']
+    new = ['access-list out extended permit tcp any host 1.2.3.4 eq 443']
+    [change] = diffConfigs('asa', old, new)
+    assert change.kind == MODIFIED
+    assert change.fields == {'dstport': ('eq 80', 'eq 443')}
+
+
+def test_asa_insertion_renumbers_without_changes():
+    rules = [f"permit tcp any host 1.2.3.{n} eq 80" for n in range(1, 4)]
+    changes = diffConfigs('asa', numbered(rules),
+                          numbered(['deny ip any host 9.9.9.9'] + rules))
+    assert [(c.kind, c.new.position) for c in changes] == [(ADDED, 1)]
+
+
+def test_asa_move_is_reported_once():
+    rules = [f"permit tcp any host 1.2.3.{n} eq 80" for n in range(1, 5)]
+    changes = diffConfigs('asa', numbered(rules), numbered(rules[1:] + rules[:1]))
+    assert [(c.kind, c.old.position, c.new.position) for c in changes] == [('moved', 1, 4)]
@@ -0,0 +1,47 @@
+"""
+Copyright 2016-2021 Maen Artimy
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import csv
+import io
+
+import asa_policy_parser_lite as asa
+from policy_export import PolicyWriter
+
+
+def test_fields_are_quoted():
+    policies = [
+        {'name': 'a,b', 'comments': 'say "hi"', 'action': 'accept'},
+        {'name': 'line\nbreak'},
+    ]
+    outfile = io.StringIO()
+    writer = PolicyWriter(outfile, ['name', 'comments', 'action'])
+    writer.writeHeader()
+    writer.writePolicies(policies)
+
+    rows = list(csv.reader(io.StringIO(outfile.getvalue())))
+    assert rows == [['name', 'comments', 'action'],
+                    ['a,b', 'say "hi"', 'accept'],
+                    ['line\nbreak', '', '']]
+    assert (writer.written, writer.failed) == (2, 0)
+
+
+def test_failures_are_marked_and_counted():
+    outfile = io.StringIO()
+    writer = asa.policyToCSV(['acl', 'action'],
+                             [{'acl': 'in', 'action': 'permit'}, None, None], outfile)
+    assert (writer.written, writer.failed) == (1, 2)
+    assert outfile.getvalue().splitlines() == \
+        ['acl,action', 'in,permit', asa.NOT_PARSED, asa.NOT_PARSED]
@@ -0,0 +1,94 @@
+"""
+Copyright 2016-2021 Maen Artimy
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import pytest
+
+from policy_table import PolicyTable
+
+POLICIES = [
+    {'id': '1', 'srcaddr': ['a', 'b'], 'action': 'accept'},
+    None,
+    {'id': '2', 'comments': '', 'action': 'deny'},
+    {'id': '3', 'srcaddr': 'a', 'schedule': 'always'},
+]
+
+
+def expected(policy):
+    # Lists are stored as the space-separated names, as in the CSV output
+    return {f: ' '.join(v) if isinstance(v, list) else v for f, v in policy.items()}
+
+
+def test_round_trip():
+    table = PolicyTable()
+    table.extend(POLICIES[:2], section=0)
+    table.extend(POLICIES[2:], section=1)
+
+    assert len(table) == 4
+    assert table.failed == 1
+    assert table[1] is None
+    assert [r and r.asDict() for r in table] == \
+        [p and expected(p) for p in POLICIES]
+    assert [r.asDict() for r in table.records()] == \
+        [expected(p) for p in POLICIES if p]
+    assert [r.section for r in table.records()] == [0, 1, 1]
+
+
+def test_missing_and_empty_fields():
+    table = PolicyTable()
+    table.extend(POLICIES)
+
+    first, third = table[0], table[2]
+    assert 'comments' not in first
+    assert first.get('comments') == ''
+    assert first.get('comments', None) is None
+    with pytest.raises(KeyError):
+        first['comments']
+    assert 'comments' in third
+    assert third['comments'] == ''
+    assert third.keys() == ['id', 'action', 'comments']
+    with pytest.raises(IndexError):
+        table[4]
+
+
+def test_values_are_interned_once():
+    table = PolicyTable()
+    table.extend(POLICIES)
+    assert table.strings.count('a') == 1
+    assert table.columns['srcaddr'][3] == table.index['a']
+
+
+def test_sections_and_field_names():
+    table = PolicyTable()
+    table.extend(POLICIES[:1], section=0)
+    table.extend(POLICIES[2:], section=2)
+
+    # Sections without policies are kept when the count is given
+    sections = table.bySection(4)
+    assert [len(s) for s in sections] == [1, 0, 2, 0]
+    assert [r['id'] for r in sections[2]] == ['2', '3']
+    assert [len(s) for s in table.bySection()] == [1, 0, 2]
+
+    # A column that only holds missing fields has no name
+    table.column('unused')
+    assert table.fieldNames() == ['id', 'srcaddr', 'action', 'comments', 'schedule']
+
+
+def test_records_are_copied_between_tables():
+    table = PolicyTable()
+    table.extend(POLICIES)
+    copy = PolicyTable()
+    copy.extend(table)
+    assert [r and r.asDict() for r in copy] == [r and r.asDict() for r in table]
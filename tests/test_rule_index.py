@@ -0,0 +1,105 @@
+"""
+Copyright 2016-2021 Maen Artimy
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import random
+
+import pytest
+
+from normalizer import AddrMask, ANY_ADDRESS, ANY_PORT, FULL_MASK, Rule, addressBounds, \
+    fieldRelation, prefixMask, protocolRelation
+from rule_index import MODES, IntervalTree, PrefixIndex, RuleIndex, queryAddress, queryPorts
+
+
+def randomPrefix(rnd, shortest=0):
+    length = rnd.randint(shortest, 32)
+    return AddrMask(rnd.getrandbits(32) & prefixMask(length), prefixMask(length))
+
+
+def randomAddress(rnd):
+    kind = rnd.random()
+    if kind < 0.05:
+        return ANY_ADDRESS
+    if kind < 0.1:
+        return 'object-group A'
+    if kind < 0.2:
+        # A non-contiguous mask, such as a Cisco wildcard 0.0.255.0
+        mask = FULL_MASK & ~(rnd.getrandbits(8) << rnd.randint(0, 24))
+        return AddrMask(rnd.getrandbits(32) & mask, mask)
+    return randomPrefix(rnd, 8)
+
+
+def randomPorts(rnd):
+    if rnd.random() < 0.2:
+        return ANY_PORT
+    low = rnd.randrange(65536)
+    return ((low, min(low + rnd.randrange(100), 65535)),)
+
+
+def test_prefix_index_matches_a_scan():
+    rnd = random.Random(0)
+    prefixes = [randomPrefix(rnd) for _ in range(500)]
+    index = PrefixIndex(enumerate(prefixes))
+    for _ in range(300):
+        query = randomPrefix(rnd)
+        low, high = addressBounds(query)
+        expected = {i for i, p in enumerate(prefixes)
+                    if addressBounds(p)[0] <= high and low <= addressBounds(p)[1]}
+        assert index.overlapping(query) == expected
+
+
+def test_interval_tree_matches_a_scan():
+    rnd = random.Random(1)
+    items = []
+    for i in range(500):
+        low = rnd.randrange(10000)
+        items.append((low, low + rnd.randrange(500), i))
+    tree = IntervalTree(items)
+    for _ in range(300):
+        low = rnd.randrange(10500)
+        high = low + rnd.randrange(200)
+        assert tree.overlapping(low, high) == \
+            {i for start, end, i in items if start <= high and low <= end}
+
+
+@pytest.mark.parametrize("mode", sorted(MODES))
+def test_rule_queries_match_a_scan(mode):
+    rnd = random.Random(2)
+    rules = [Rule('acl', n, 'permit', rnd.choice(['ip', 'tcp', 'udp']),
+                  randomAddress(rnd), randomPorts(rnd), randomAddress(rnd), randomPorts(rnd))
+             for n in range(400)]
+    index = RuleIndex(rules)
+    for _ in range(200):
+        query = {'src': randomPrefix(rnd, 4), 'dst': randomPrefix(rnd, 4),
+                 'dstport': randomPorts(rnd)}
+        query = {f: v for f, v in query.items() if rnd.random() < 0.7}
+        protocol = rnd.choice([None, 'ip', 'tcp'])
+        accepted = MODES[mode]
+        expected = [i for i, rule in enumerate(rules)
+                    if (protocol is None or protocolRelation(rule.protocol, protocol) in accepted)
+                    and all(isinstance(getattr(rule, f), (AddrMask, tuple)) and
+                            fieldRelation(getattr(rule, f), v) in accepted
+                            for f, v in query.items())]
+        assert index.query(mode, protocol=protocol, **query) == expected
+
+
+def test_query_arguments():
+    assert queryAddress('10.1.2.3/16') == AddrMask(0x0A010000, prefixMask(16))
+    assert queryAddress('any') == ANY_ADDRESS
+    assert queryPorts('1000-2000') == ((1000, 2000),)
+    with pytest.raises(ValueError):
+        queryAddress('web-servers')
+    with pytest.raises(ValueError):
+        queryPorts('nosuchport')
@@ -0,0 +1,31 @@
+"""
+Copyright 2016-2021 Maen Artimy
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import pytest
+
+from benchmark import DEFERRED_MODULES, STARTUP_PARSERS, importTime
+
+# The parsers and the modules they share, which must import without loading
+# any of DEFERRED_MODULES
+LIGHT_MODULES = sorted(module for module, _, _ in STARTUP_PARSERS.values()) + \
+    ['config_parser', 'normalizer', 'policy_export', 'policy_table']
+
+
+@pytest.mark.parametrize('module', LIGHT_MODULES)
+def test_import_defers_heavy_modules(module):
+    _, loaded = importTime(module, repeat=1)
+    assert not set(loaded) & set(DEFERRED_MODULES), \
+        f"importing {module} loaded {', '.join(loaded)}"